@@ -1,15 +1,95 @@
+import base64
+import binascii
+import bisect
+import contextvars
+import csv
+import fcntl
+import functools
+import hashlib
+import importlib
+import io
+import json
+import multiprocessing
 import os
-from datetime import datetime
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from urllib.parse import unquote
 
 import numpy as np
-import pandas as pd
-from flask import Flask, render_template, request, jsonify
-import neurokit2 as nk
-from scipy import interpolate, signal
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson  # opcional: backend JSON rápido
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
 
-DATASET_FILE = "dataset_hba.csv"
+
+class _LazyModule:
+    """
+    Importa el módulo recién en el primer uso: los workers de gunicorn sirven
+    "/" y /healthz sin pagar neurokit2/scipy. warm_engine() los carga antes.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+nk = _LazyModule("neurokit2")
+interpolate = _LazyModule("scipy.interpolate")
+ndimage = _LazyModule("scipy.ndimage")
+signal = _LazyModule("scipy.signal")
+
+_ENGINE_MODULES = (interpolate, ndimage, signal)  # filtros, picos, Welch: siempre
+_engine_state = {"warm_seconds": None, "forkserver_ok": False}
+
+
+def _engine_modules():
+    # neurokit2 solo con el motor HRV de referencia (HBA_HRV_ENGINE=neurokit2)
+    return _ENGINE_MODULES + (nk,) if HRV_ENGINE == "neurokit2" else _ENGINE_MODULES
+
+
+def engine_warm():
+    """
+    Motor listo en este proceso, o ya respondió un hijo de análisis aislado (el
+    forkserver precarga el motor: con HBA_WARM=0 el worker puede no importarlo nunca).
+    """
+    return _engine_state["forkserver_ok"] or all(m.loaded for m in _engine_modules())
+
+
+def warm_engine():
+    """Carga las dependencias científicas (gunicorn preload / post_fork)."""
+    t0 = time.perf_counter()
+    for m in _engine_modules():
+        m.load()
+    if _engine_state["warm_seconds"] is None:
+        _engine_state["warm_seconds"] = time.perf_counter() - t0
+    return _engine_state["warm_seconds"]
+
+DATASET_FILE = "dataset_hba.csv"  # formato anterior: se migra y se exporta
+DATASET_DB = "dataset_hba.sqlite"
+RESCORE_CHUNK_ROWS = int(os.environ.get("HBA_RESCORE_CHUNK_ROWS", "5000"))
 
 # ============================
 # Utilidades
@@ -29,20 +109,249 @@ def _finite_array(x):
     return x[np.isfinite(x)]
 
 
-def _sanitize_for_json(obj):
-    """Evita NaN/Inf en JSON (rompen JSON y generan 'Unexpected token N')."""
-    if obj is None:
-        return None
-    if isinstance(obj, (np.floating, float)):
-        v = float(obj)
-        return v if np.isfinite(v) else None
-    if isinstance(obj, (np.integer, int)):
-        return int(obj)
-    if isinstance(obj, dict):
-        return {k: _sanitize_for_json(v) for k, v in obj.items()}
-    if isinstance(obj, (list, tuple)):
-        return [_sanitize_for_json(v) for v in obj]
-    return obj
+# ============================
+# Serialización JSON (NaN/Inf -> null)
+# ============================
+
+_INF = float("inf")
+
+
+def _json_default(o):
+    # tipos NumPy que json no conoce; los arrays float pasan NaN/Inf a None vectorizado
+    if isinstance(o, np.ndarray):
+        if o.dtype.kind == "f":
+            ok = np.isfinite(o)
+            if not ok.all():
+                return np.where(ok, o, None).tolist()
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _json_clean(o):
+    """
+    Copia serializable con allow_nan=False en un solo recorrido: NaN/Inf -> None
+    (evita 'Unexpected token N' en el navegador), arrays float vectorizado.
+    Los tipos que json no conoce quedan para _json_default.
+    """
+    if isinstance(o, float):
+        return o if o == o and o != _INF and o != -_INF else None
+    if isinstance(o, dict):
+        return {k: _json_clean(v) for k, v in o.items()}
+    if isinstance(o, (list, tuple)):
+        return [_json_clean(v) for v in o]
+    if isinstance(o, np.ndarray):
+        return _json_clean(o.tolist()) if o.dtype.kind == "O" else _json_default(o)
+    if isinstance(o, np.generic):
+        return _json_clean(o.item())
+    return o
+
+
+def json_dumps(obj, **kwargs):
+    """
+    Serializa resultados con NaN/Inf -> null:
+    - orjson si está instalado (NaN -> null y arrays NumPy nativos, una pasada)
+    - si no, _json_clean y el encoder C de json con allow_nan=False (un recorrido
+      previo y una codificación, haya o no NaN)
+    Acepta los kwargs de json.dumps (Flask pasa sort_keys, indent, separators...).
+    """
+    kwargs.setdefault("default", _json_default)
+    if orjson is not None and kwargs.get("indent") is None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if kwargs.get("sort_keys"):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=kwargs["default"], option=option).decode("utf-8")
+    kwargs.pop("allow_nan", None)
+    return json.dumps(_json_clean(obj), allow_nan=False, **kwargs)
+
+
+class HBAJSONProvider(DefaultJSONProvider):
+    """jsonify / request.get_json de Flask con json_dumps (NaN -> null)."""
+
+    def dumps(self, obj, **kwargs):
+        kwargs.setdefault("ensure_ascii", self.ensure_ascii)
+        kwargs.setdefault("sort_keys", self.sort_keys)
+        return json_dumps(obj, **kwargs)
+
+
+app.json = HBAJSONProvider(app)
+
+
+# ============================
+# Métricas por etapa (trazas por análisis + histogramas para /metrics)
+# ============================
+
+METRICS_ENABLED = os.environ.get("HBA_METRICS", "1") == "1"
+METRICS_DIR = os.environ.get("HBA_METRICS_DIR") or os.path.join(tempfile.gettempdir(), "hba_metrics")
+TIMINGS_DEBUG = os.environ.get("HBA_DEBUG_TIMINGS", "0") == "1"  # agrega "timings" a la respuesta
+
+_HIST_BUCKETS = {
+    "hba_stage_seconds": (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+    "hba_analysis_seconds": (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 120.0, 900.0),
+    "hba_input_samples": (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000),
+    "hba_artifact_percent": (1.0, 2.0, 5.0, 10.0, 15.0, 20.0, 30.0, 50.0),
+}
+_METRIC_HELP = {
+    "hba_stage_seconds": "Duración por etapa del pipeline.",
+    "hba_analysis_seconds": "Duración total del análisis visto por el worker web (incluye cola y aislamiento).",
+    "hba_input_samples": "Largo de la señal de entrada (muestras o intervalos RR).",
+    "hba_artifact_percent": "Porcentaje de artefactos del resultado.",
+    "hba_analysis_total": "Análisis terminados por origen y código HTTP.",
+    "hba_ppg_peaks_total": "Resultado del detector de picos PPG (elgendi vectorizado, o none si no halló picos).",
+    "hba_hrv_mode_total": "Camino de HRV usado (native, rri o fallback peaks).",
+    "hba_cache_total": "Consultas a la caché de resultados.",
+}
+
+_trace_var = contextvars.ContextVar("hba_trace", default=None)
+_metrics = {"hist": {}, "counters": {}}
+_metrics_lock = threading.Lock()
+_metrics_file = {}
+
+
+class _Stage:
+    """
+    `with _Stage("ppg_filter"):` suma la duración a la traza del análisis en curso.
+    Sin traza activa (métricas y debug apagados) no mide nada.
+    """
+    __slots__ = ("name", "trace", "t0")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.trace = _trace_var.get()
+        if self.trace is not None:
+            self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.trace is not None:
+            stages = self.trace["stages"]
+            stages[self.name] = stages.get(self.name, 0.0) + time.perf_counter() - self.t0
+        return False
+
+
+def _trace_note(key, value):
+    trace = _trace_var.get()
+    if trace is not None:
+        trace[key] = value
+
+
+def _metric_key(name, **labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+def _observe(key, value):
+    name = key.split("{", 1)[0]
+    h = _metrics["hist"].get(key)
+    if h is None:
+        h = _metrics["hist"][key] = [0] * (len(_HIST_BUCKETS[name]) + 1) + [0.0]
+    h[int(np.searchsorted(_HIST_BUCKETS[name], value))] += 1  # bucket "le": primer límite >= value
+    h[-1] += float(value)
+
+
+def _count(key, n=1):
+    _metrics["counters"][key] = _metrics["counters"].get(key, 0) + n
+
+
+def _metrics_path():
+    # un archivo por proceso (pid + arranque: un pid reciclado no pisa al anterior)
+    pid = os.getpid()
+    if _metrics_file.get("pid") != pid:
+        _metrics_file.update(pid=pid, path=os.path.join(METRICS_DIR, f"{pid}-{time.time_ns()}.json"))
+    return _metrics_file["path"]
+
+
+def _metrics_flush():
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _metrics_path()
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(_metrics, fh)
+    os.replace(tmp, path)
+
+
+def metrics_record(source: str, result: dict, status: int, trace: dict, seconds: float):
+    """
+    Acumula un análisis terminado en los histogramas del proceso y los vuelca a
+    METRICS_DIR/<pid>-<t>.json, que /metrics suma entre workers de gunicorn.
+    La traza llega del proceso donde corrió el pipeline (hijo aislado, pool o inline).
+    """
+    if not METRICS_ENABLED:
+        return
+    with _metrics_lock:
+        _count(_metric_key("hba_analysis_total", source=source, status=status))
+        _observe(_metric_key("hba_analysis_seconds", source=source), seconds)
+        if trace:
+            kind = trace.get("kind", "")
+            for stage, dt in trace["stages"].items():
+                _observe(_metric_key("hba_stage_seconds", stage=stage), dt)
+            if "n_input" in trace:
+                _observe(_metric_key("hba_input_samples", kind=kind), trace["n_input"])
+            if "peaks_method" in trace:
+                _count(_metric_key("hba_ppg_peaks_total", method=trace["peaks_method"]))
+            if "cache" in trace:
+                _count(_metric_key("hba_cache_total", result=trace["cache"]))
+            if result.get("hrv_mode"):
+                _count(_metric_key("hba_hrv_mode_total", mode=result["hrv_mode"]))
+            art = _as_float(result.get("artifact_percent"))
+            if np.isfinite(art):
+                _observe(_metric_key("hba_artifact_percent", kind=kind), art)
+        try:
+            _metrics_flush()
+        except OSError:
+            pass
+
+
+def timings_block(trace: dict, seconds: float):
+    """Bloque "timings" de la respuesta (solo con HBA_DEBUG_TIMINGS=1)."""
+    out = {"total_ms": seconds * 1000.0}
+    if trace:
+        out["stages_ms"] = {k: v * 1000.0 for k, v in trace["stages"].items()}
+        out.update({k: v for k, v in trace.items() if k != "stages"})
+    return out
+
+
+def metrics_text():
+    """Exposición Prometheus (text/plain 0.0.4) de la suma de todos los procesos."""
+    hist, counters = {}, {}
+    try:
+        names = [f for f in os.listdir(METRICS_DIR) if f.endswith(".json")]
+    except FileNotFoundError:
+        names = []
+    for fname in names:
+        try:
+            with open(os.path.join(METRICS_DIR, fname), encoding="utf-8") as fh:
+                part = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        for k, v in part.get("counters", {}).items():
+            counters[k] = counters.get(k, 0) + v
+        for k, h in part.get("hist", {}).items():
+            acc = hist.setdefault(k, [0] * len(h))
+            if len(acc) == len(h):
+                hist[k] = [a + b for a, b in zip(acc, h)]
+
+    lines = []
+    for name, buckets in _HIST_BUCKETS.items():
+        lines += [f"# HELP {name} {_METRIC_HELP[name]}", f"# TYPE {name} histogram"]
+        for key in sorted(k for k in hist if k.split("{", 1)[0] == name):
+            h = hist[key]
+            labels = key[len(name) + 1:-1] if "{" in key else ""
+            sep = "," if labels else ""
+            cum = 0
+            for le, c in zip([*map(str, buckets), "+Inf"], h[:-1]):
+                cum += c
+                lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {cum}')
+            suffix = "{" + labels + "}" if labels else ""
+            lines += [f"{name}_sum{suffix} {h[-1]:.6f}", f"{name}_count{suffix} {cum}"]
+    for name in ("hba_analysis_total", "hba_ppg_peaks_total", "hba_hrv_mode_total", "hba_cache_total"):
+        lines += [f"# HELP {name} {_METRIC_HELP[name]}", f"# TYPE {name} counter"]
+        lines += [f"{key} {counters[key]}" for key in sorted(k for k in counters if k.split("{", 1)[0] == name)]
+    return "\n".join(lines) + "\n"
 
 
 # ============================
@@ -91,30 +400,33 @@ def clean_rri_ms(rri_ms: np.ndarray):
     return rri_clean, artifact_percent, bad
 
 
-def _kubios_like_artifact_mask(rr_ms: np.ndarray, win=11):
+def _kubios_window(win=11):
+    w = int(win) if int(win) % 2 == 1 else int(win) + 1
+    return max(7, min(w, 21))
+
+
+def _local_median(rr: np.ndarray, w: int):
     """
-    Heurística estilo Kubios:
-    - compara cada RR contra mediana local
-    - marca artefacto si desviación relativa es alta
-    - y/o si el salto dRR es demasiado grande
+    Mediana local centrada (ventana w impar), truncada en los bordes.
+    - interior: filtro de mediana 1D (rank filter de scipy, sin loop Python)
+    - bordes: ventanas truncadas (idéntico a np.median(rr[a:b]))
     """
-    rr = _finite_array(rr_ms)
     n = rr.size
-    if n < 15:
-        return np.zeros(n, dtype=bool)
-
-    w = int(win) if int(win) % 2 == 1 else int(win) + 1
-    w = max(7, min(w, 21))
     half = w // 2
+    med_local = np.empty(n)
+    if n > 2 * half:
+        med_local[half:n - half] = ndimage.median_filter(rr, size=w, mode="nearest")[half:n - half]
+        edge = np.r_[0:half, n - half:n]
+    else:
+        edge = np.arange(n)
+    for i in edge:
+        med_local[i] = np.median(rr[max(0, i - half):min(n, i + half + 1)])
+    return med_local
 
-    med_local = np.zeros(n)
-    for i in range(n):
-        a = max(0, i - half)
-        b = min(n, i + half + 1)
-        med_local[i] = np.median(rr[a:b])
 
+def _kubios_bad_from_median(rr: np.ndarray, med_local: np.ndarray, drr_abs: np.ndarray):
     rel_dev = np.abs(rr - med_local) / (med_local + 1e-9)
-    drr = np.abs(np.diff(rr, prepend=rr[0])) / (med_local + 1e-9)
+    drr = drr_abs / (med_local + 1e-9)
 
     # thresholds conservadores (no matar test por micro-ruido)
     # rel_dev > 0.20 = 20% fuera de mediana local
@@ -126,6 +438,23 @@ def _kubios_like_artifact_mask(rr_ms: np.ndarray, win=11):
     return bad
 
 
+def _kubios_like_artifact_mask(rr_ms: np.ndarray, win=11):
+    """
+    Heurística estilo Kubios:
+    - compara cada RR contra mediana local
+    - marca artefacto si desviación relativa es alta
+    - y/o si el salto dRR es demasiado grande
+    """
+    rr = _finite_array(rr_ms)
+    n = rr.size
+    if n < 15:
+        return np.zeros(n, dtype=bool)
+
+    med_local = _local_median(rr, _kubios_window(win))
+    drr_abs = np.abs(np.diff(rr, prepend=rr[0]))
+    return _kubios_bad_from_median(rr, med_local, drr_abs)
+
+
 def _interpolate_bad(rr_ms: np.ndarray, bad_mask: np.ndarray):
     rr = np.asarray(rr_ms, dtype=float)
     bad = np.asarray(bad_mask, dtype=bool)
@@ -151,332 +480,932 @@ def _interpolate_bad(rr_ms: np.ndarray, bad_mask: np.ndarray):
     return out
 
 
+def _salvage_keep_mask(bad: np.ndarray, w: int, s: int, max_artifact_pct: float):
+    """
+    Beats cubiertos por alguna ventana bad[i:i+w] (i = 0, s, 2s, ...) con artefactos
+    <= max_artifact_pct. Sumas acumuladas + arreglo de diferencias: O(n), sin
+    materializar ventanas; la unión de rangos deja tramos disjuntos.
+    """
+    n = bad.size
+    starts = np.arange(0, n - w + 1, s)
+    cs = np.r_[0, np.cumsum(bad)]
+    arts = 100.0 * (cs[starts + w] - cs[starts]) / w
+    good = starts[arts <= max_artifact_pct]
+
+    cover = np.zeros(n + 1, dtype=np.int32)
+    cover[good] += 1
+    cover[good + w] -= 1
+    return np.cumsum(cover[:-1]) > 0
+
+
 def _windowed_rr_salvage(rr_ms: np.ndarray, window_beats=40, step_beats=20, max_artifact_pct=25.0):
     """
-    Rescata segmentos de RR de mejor calidad (no rompe test).
+    Rescata tramos de RR de buena calidad (no rompe test).
     - Trabaja en el dominio de beats (robusto incluso si no hay timestamps).
-    - Devuelve rr_rescued, usable_ratio, artifact_percent_global
+    - Una máscara Kubios-like global y un único buffer interpolado; las ventanas
+      solo eligen qué rangos de índices se conservan (_salvage_keep_mask), sin
+      copiar ni duplicar beats.
+    - Devuelve rr_rescued, usable_ratio, artifact_percent_global, breaks
+      (breaks[i]: rr_rescued[i] - rr_rescued[i-1] no es una diferencia sucesiva
+      real, porque rr_rescued[i] abre un tramo o uno de los dos beats fue
+      interpolado; no entra en RMSSD/pNN50).
     """
     rr = _finite_array(rr_ms)
     n = rr.size
     if n < 20:
-        return rr, 0.0, np.nan
+        return rr, 0.0, np.nan, np.zeros(n, dtype=bool)
 
     w = max(25, int(window_beats))
     s = max(10, int(step_beats))
 
-    segments = []
-    qualities = []
-
-    for start in range(0, n - w + 1, s):
-        seg = rr[start:start + w]
-        bad = _kubios_like_artifact_mask(seg)
-        art = 100.0 * bad.mean()
-        if art <= max_artifact_pct:
-            seg_clean = _interpolate_bad(seg, bad)
-            segments.append(seg_clean)
-            # score: más alto = mejor
-            qualities.append(100.0 - art)
-
-    if not segments:
-        # fallback: limpiar todo, pero no tirar error
-        bad_all = _kubios_like_artifact_mask(rr)
-        rr_clean = _interpolate_bad(rr, bad_all)
-        art = 100.0 * bad_all.mean()
-        usable_ratio = max(0.0, 1.0 - art / 100.0)
-        return rr_clean, usable_ratio, art
-
-    # elegir top segmentos y concatenar (evita zonas malas)
-    order = np.argsort(qualities)[::-1]
-    segments = [segments[i] for i in order]
-
-    rr_rescued = np.concatenate(segments)
-    rr_rescued = rr_rescued[:n]  # no crecer indefinidamente
-
-    # artefactos globales estimados desde rr original
     bad_all = _kubios_like_artifact_mask(rr)
     art_global = 100.0 * bad_all.mean()
+    rr_fixed = _interpolate_bad(rr, bad_all)
 
-    usable_ratio = min(1.0, max(0.0, len(rr_rescued) / max(1, n)))
-    return rr_rescued, usable_ratio, art_global
+    keep = _salvage_keep_mask(bad_all, w, s, max_artifact_pct)
+    if not np.any(keep):
+        # fallback: limpiar todo, pero no tirar error
+        usable_ratio = max(0.0, 1.0 - art_global / 100.0)
+        return rr_fixed, usable_ratio, art_global, bad_all | np.r_[False, bad_all[:-1]]
+
+    breaks = (keep & ~np.r_[False, keep[:-1]]) | bad_all | np.r_[False, bad_all[:-1]]
+    return rr_fixed[keep], float(keep.mean()), art_global, breaks[keep]
 
 
 def rri_to_peaks(rri_ms: np.ndarray, sampling_rate=1000):
+    """
+    RR (ms) -> índices de muestra de cada pico (representación dispersa, int32).
+    NK2 acepta los índices directamente, así que nunca se arma el tren denso
+    de 0/1 por milisegundo (~690 MB en 24 h); 24 h de RR ocupan ~0.4 MB.
+    """
     rri_ms = _finite_array(rri_ms)
     if len(rri_ms) < 3:
         return None
 
     peak_times_s = np.cumsum(rri_ms) / 1000.0
-    peak_samples = np.unique(np.round(peak_times_s * sampling_rate).astype(int))
+    peak_samples = np.unique(np.round(peak_times_s * sampling_rate).astype(np.int32))
     if len(peak_samples) < 3:
         return None
+    return peak_samples
 
-    length = int(peak_samples[-1] + sampling_rate)
-    peaks = np.zeros(length, dtype=int)
-    peaks[peak_samples] = 1
-    return peaks
+
+# ============================
+# Contexto de análisis (se comparte entre etapas)
+# ============================
+
+@dataclass
+class AnalysisContext:
+    """
+    Intermedios de una medición, para que dashboard/Baevsky/respiración
+    no vuelvan a filtrar ni detectar picos desde el payload JSON.
+    - signal_f: PPG normalizado + filtrado, float32 (None en RR)
+    - peaks_idx: índices de picos PPG (None en RR)
+    - peaks_conf: confianza 0–1 por pico (ppg_peaks_elgendi)
+    - rr_raw: RR crudo (ms) antes de limpieza
+    - rr_nn / nn_mask: clean_rri_ms(rr_raw) (usado por Baevsky)
+    - rr_clean / clean_mask: RR final del pipeline (salvataje + MAD)
+    """
+    sensor_type: str = ""
+    sampling_rate: float = np.nan
+    signal_f: np.ndarray = None
+    peaks_idx: np.ndarray = None
+    peaks_conf: np.ndarray = None
+    rr_raw: np.ndarray = None
+    rr_nn: np.ndarray = None
+    nn_mask: np.ndarray = None
+    rr_clean: np.ndarray = None
+    clean_mask: np.ndarray = None
+
+    def set_rr_raw(self, rr_raw: np.ndarray):
+        self.rr_raw = rr_raw
+        self.rr_nn, _ap, self.nn_mask = clean_rri_ms(rr_raw)
 
 
 # ============================
-# HRV Backend (robusto)
+# Kernel HRV nativo (NumPy/SciPy, sin DataFrames)
 # ============================
 
-def _hr_basic_from_rr(rr_ms: np.ndarray):
-    rr = _finite_array(rr_ms)
-    if rr.size < 3:
-        return np.nan, np.nan, np.nan
-    hr = 60000.0 / rr
-    return float(np.nanmean(hr)), float(np.nanmax(hr)), float(np.nanmin(hr))
+HRV_ENGINE = os.environ.get("HBA_HRV_ENGINE", "native")  # "native" | "neurokit2" (referencia)
 
+_HRV_BANDS = ((0.0, 0.0033), (0.0033, 0.04), (0.04, 0.15), (0.15, 0.4), (0.4, 0.5))
+_HRV_INTERP_RATE = 100  # Hz (RR remuestreado para Welch)
 
-def compute_hrv_from_rri(rri_ms: np.ndarray, duration_minutes=None):
-    rri_ms = _finite_array(rri_ms)
 
-    if len(rri_ms) < 12:
-        return {"error": "Insuficientes intervalos RR (mínimo recomendado: 12).", "artifact_percent": np.nan}
+def _trapz(y, x):
+    # misma cuenta que np.trapz (renombrado en NumPy 2)
+    return float((np.diff(x) * (y[1:] + y[:-1]) / 2.0).sum())
 
-    # 1) limpieza robusta tipo Kubios + salvataje
-    rr_rescued, usable_ratio, art_global = _windowed_rr_salvage(rri_ms, window_beats=45, step_beats=20, max_artifact_pct=25.0)
 
-    # 2) además, clean_rri_ms (fisiológico + MAD) como segunda capa
-    rr_clean, art_mad, _mask = clean_rri_ms(rr_rescued)
+def hrv_indices_native(rr_ms: np.ndarray, sampling_rate=1000, breaks=None, freq=True):
+    """
+    RMSSD / SDNN / pNN50 / MeanNN + LF / HF / TP en un solo paso, sin pandas.
+
+    Reproduce el camino de referencia de NK2 (hrv_time / hrv_frequency sobre el
+    tren de picos a 1 kHz que arma rri_to_peaks), pero trabajando con los
+    índices de pico directamente:
+    - RR -> índices de pico en grilla de 1 ms (rri_to_peaks) -> intervalos
+    - RR remuestreado a 100 Hz (spline cuadrática) -> Welch (hann, nperseg=N/2, nfft=2*nperseg)
+    - PSD normalizada a su máximo, potencia por banda por trapecios (0 -> NaN)
+    Tolerancia vs NK2 0.2.10: diferencia relativa < 1e-9 en todos los campos
+    (ver benchmarks/bench_hrv_kernel.py).
+    breaks (de _windowed_rr_salvage): las diferencias que cruzan el borde de un
+    tramo rescatado o tocan un beat interpolado no cuentan para RMSSD/pNN50.
+    freq=False omite el Welch de toda la serie (modo epochs: lo calcula hrv_epochs).
+    Devuelve None si no hay al menos 3 picos.
+    """
+    peak_samples = rri_to_peaks(rr_ms, sampling_rate=sampling_rate)
+    if peak_samples is None:
+        return None
 
-    # artefact_percent final (mezcla conservadora)
-    if np.isfinite(art_global) and np.isfinite(art_mad):
-        artifact_percent = float(0.65 * art_global + 0.35 * art_mad)
-    elif np.isfinite(art_global):
-        artifact_percent = float(art_global)
-    else:
-        artifact_percent = float(art_mad) if np.isfinite(art_mad) else np.nan
+    rri = np.diff(peak_samples) / sampling_rate * 1000.0
+    drri = np.diff(rri)
+    if breaks is not None and len(breaks) == len(peak_samples):
+        # rri[j] = rr[j + 1] -> drri[j] une rr[j + 1] y rr[j + 2]
+        drri = drri[~np.asarray(breaks, dtype=bool)[2:]]
+
+    out = {
+        "mean_rr": float(np.nanmean(rri)),
+        "sdnn": float(np.nanstd(rri, ddof=1)),
+        "rmssd": float(np.sqrt(np.nanmean(drri ** 2))),
+        "pnn50": float(np.sum(np.abs(drri) > 50) / (drri.size + 1) * 100),
+    }
+    out.update(_hrv_band_powers(rri) if freq else {"lf": np.nan, "hf": np.nan, "tp": np.nan})
+    return out
 
-    hr_mean, hr_max, hr_min = _hr_basic_from_rr(rr_clean)
 
-    # 3) HRV con NK2 (rri o fallback peaks)
-    hrv_mode = "rri"
+def _hrv_band_powers(rri: np.ndarray):
+    nan = {"lf": np.nan, "hf": np.nan, "tp": np.nan}
     try:
-        hrv_time = nk.hrv_time(rri=rr_clean, show=False)
-        hrv_freq = nk.hrv_frequency(rri=rr_clean, show=False)
+        rri_time = np.cumsum(rri / 1000.0)
+        fs = _HRV_INTERP_RATE
+        t = np.arange(rri_time[0], rri_time[-1] + 1 / fs, 1 / fs)
+        f_interp = interpolate.interp1d(
+            rri_time, rri, kind="quadratic", bounds_error=False, fill_value=([rri[0]], [rri[-1]])
+        )
+        x = f_interp(t)
+        x = x - np.mean(x)
+
+        n = x.size
+        min_frequency = 2 * fs / (n / 2)
+        nperseg = int(2 / min_frequency * fs)
+        if nperseg > n / 2:
+            nperseg = int(n / 2)
+        freqs, power = signal.welch(
+            x, fs=fs, scaling="density", detrend=False, nfft=int(nperseg * 2),
+            average="mean", nperseg=nperseg, window="hann"
+        )
+        power = power / np.max(power)
+        keep = (freqs >= min_frequency) & (freqs <= _HRV_BANDS[-1][1])
+        freqs, power = freqs[keep], power[keep]
+
+        bands = []
+        for lo, hi in _HRV_BANDS:
+            m = (freqs >= lo) & (freqs < hi)
+            p = _trapz(power[m], freqs[m]) if np.any(m) else 0.0
+            bands.append(np.nan if p == 0.0 else p)
     except Exception:
-        peaks = rri_to_peaks(rr_clean, sampling_rate=1000)
-        if peaks is None:
-            return {"error": "No se pudo construir tren de picos desde RR.", "artifact_percent": artifact_percent}
-        hrv_mode = "peaks"
-        hrv_time = nk.hrv_time(peaks, sampling_rate=1000, show=False)
-        hrv_freq = nk.hrv_frequency(peaks, sampling_rate=1000, show=False)
+        return nan
+
+    return {"lf": bands[2], "hf": bands[3], "tp": float(np.nansum(bands))}
+
 
+def _hrv_indices_from_nk(hrv_time, hrv_freq):
     def g(df, key):
         try:
             return _as_float(df[key].iloc[0])
         except Exception:
             return np.nan
 
-    rmssd = g(hrv_time, "HRV_RMSSD")
-    sdnn = g(hrv_time, "HRV_SDNN")
-    pnn50 = g(hrv_time, "HRV_pNN50")
-    mean_rr = g(hrv_time, "HRV_MeanNN")
-    lnrmssd = np.log(rmssd) if np.isfinite(rmssd) and rmssd > 0 else np.nan
+    return {
+        "rmssd": g(hrv_time, "HRV_RMSSD"),
+        "sdnn": g(hrv_time, "HRV_SDNN"),
+        "pnn50": g(hrv_time, "HRV_pNN50"),
+        "mean_rr": g(hrv_time, "HRV_MeanNN"),
+        "lf": g(hrv_freq, "HRV_LF"),
+        "hf": g(hrv_freq, "HRV_HF"),
+        "tp": g(hrv_freq, "HRV_TP"),
+    }
 
-    lf = g(hrv_freq, "HRV_LF")
-    hf = g(hrv_freq, "HRV_HF")
-    tp = g(hrv_freq, "HRV_TP")
-    lfhf = (lf / hf) if np.isfinite(lf) and np.isfinite(hf) and hf > 0 else np.nan
 
-    freq_warning = None
-    if duration_minutes is not None:
-        try:
-            dm = float(duration_minutes)
-            if dm < 5:
-                freq_warning = "Segmento < 5 min: LF/HF y potencia espectral pueden ser menos estables."
-        except Exception:
-            pass
+# ============================
+# HRV por epochs (registros largos / Holter: noche, 24 h)
+# ============================
 
-    # 4) quality_score (0-100) y usable_ratio (0-1)
-    # cuanto menos artefacto, más score; usable_ratio rescate real de tramos
-    quality_score = np.nan
-    if np.isfinite(artifact_percent):
-        quality_score = float(np.clip(100.0 - artifact_percent, 0.0, 100.0))
+EPOCH_S = float(os.environ.get("HBA_EPOCH_SECONDS", "300"))                # epochs de 5 min
+EPOCH_MODE_MIN_MINUTES = float(os.environ.get("HBA_EPOCH_MIN_MINUTES", "60"))  # modo epochs desde 1 h de RR
+EPOCH_MIN_COVERAGE = 0.8   # epoch válido si sus latidos cubren >= 80% de EPOCH_S
+EPOCH_INTERP_RATE = 4.0    # Hz: tacograma remuestreado para el Welch por lotes (HF llega a 0.4 Hz)
+EPOCH_NIGHT_HOURS = (0, 6)  # ventana "noche" si se conoce la hora de inicio
+EPOCH_FIELDS = ("t_start_s", "duration_s", "n_beats", "valid", "mean_rr", "sdnn", "rmssd", "lnrmssd",
+                "pnn50", "hr_mean", "lf_power", "hf_power", "lf_hf", "total_power")
 
-    return {
-        "rmssd": rmssd,
-        "sdnn": sdnn,
-        "lnrmssd": lnrmssd,
-        "pnn50": pnn50,
-        "mean_rr": mean_rr,
-        "lf_power": lf,
-        "hf_power": hf,
-        "lf_hf": lfhf,
-        "total_power": tp,
-        "artifact_percent": artifact_percent,
-        "usable_ratio": float(usable_ratio) if np.isfinite(usable_ratio) else None,
-        "quality_score": quality_score,
-        "n_rr": int(len(rr_clean)),
-        "hr_mean": hr_mean,
-        "hr_max": hr_max,
-        "hr_min": hr_min,
-        "freq_warning": freq_warning,
-        "hrv_mode": hrv_mode
-    }
+
+def _epoch_band_powers(rr_ms: np.ndarray, t_beat: np.ndarray, n_epochs: int):
+    """
+    LF / HF / TP de todos los epochs en un solo Welch (axis=-1): tacograma
+    remuestreado a EPOCH_INTERP_RATE en una grilla global, cortado en filas de
+    EPOCH_S. Misma convención que _hrv_band_powers (hann, nperseg = N/2, nfft = N,
+    PSD normalizada a su máximo, bandas por trapecios, 0 -> NaN).
+    """
+    fs = EPOCH_INTERP_RATE
+    m = int(round(EPOCH_S * fs))
+    grid = np.arange(n_epochs * m) / fs
+    f_interp = interpolate.interp1d(
+        t_beat, rr_ms, kind="quadratic", bounds_error=False, fill_value=(rr_ms[0], rr_ms[-1]), assume_sorted=True
+    )
+    inside = grid <= t_beat[-1]
+    x = np.zeros(grid.size)
+    x[inside] = f_interp(grid[inside])
+    x = x.reshape(n_epochs, m)
+    inside = inside.reshape(n_epochs, m)
+    n_in = inside.sum(axis=1)
+    mean = x.sum(axis=1) / np.maximum(n_in, 1)
+    x = np.where(inside, x - mean[:, None], 0.0)  # cola del último epoch: cero tras quitar la media
+
+    nperseg = m // 2
+    freqs, power = signal.welch(x, fs=fs, scaling="density", detrend=False, nfft=m,
+                                average="mean", nperseg=nperseg, window="hann", axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        power = power / power.max(axis=1, keepdims=True)
+    min_frequency = 2 * fs / (m / 2)
+    keep = (freqs >= min_frequency) & (freqs <= _HRV_BANDS[-1][1])
+    freqs, power = freqs[keep], power[:, keep]
+
+    bands = []
+    for lo, hi in _HRV_BANDS:
+        sel = (freqs >= lo) & (freqs < hi)
+        if sel.sum() < 2:
+            bands.append(np.full(n_epochs, np.nan))
+            continue
+        f, pw = freqs[sel], power[:, sel]
+        p = (np.diff(f) * (pw[:, 1:] + pw[:, :-1]) / 2.0).sum(axis=1)
+        bands.append(np.where(p == 0.0, np.nan, p))
+    return bands[2], bands[3], np.nansum(np.vstack(bands), axis=0)
+
+
+def hrv_epochs(rr_ms: np.ndarray, breaks=None):
+    """
+    Tabla de HRV por epochs de EPOCH_S (por tiempo acumulado de RR), todo
+    vectorizado: tiempo (reduceat / bincount por epoch) y frecuencia (un Welch
+    por lotes). Memoria lineal en latidos. breaks como en hrv_indices_native.
+    Devuelve dict columnar (EPOCH_FIELDS -> listas) o None si hay < 1 epoch.
+    """
+    rr = _finite_array(rr_ms)
+    if rr.size < 3:
+        return None
+    t_end = np.cumsum(rr) / 1000.0
+    t_start = t_end - rr / 1000.0
+    ep = (t_start // EPOCH_S).astype(np.int64)
+    n_ep = int(ep[-1]) + 1
+
+    n = np.bincount(ep, minlength=n_ep)
+    dur = np.bincount(ep, weights=rr, minlength=n_ep) / 1000.0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_rr = dur * 1000.0 / n
+        dev = rr - mean_rr[ep]
+        sdnn = np.sqrt(np.bincount(ep, weights=dev * dev, minlength=n_ep) / (n - 1))
+        hr_mean = np.bincount(ep, weights=60000.0 / rr, minlength=n_ep) / n
+
+        d = np.diff(rr)
+        ok = ep[1:] == ep[:-1]
+        if breaks is not None and len(breaks) == rr.size:
+            ok &= ~np.asarray(breaks, dtype=bool)[1:]
+        e_d = ep[1:][ok]
+        d = d[ok]
+        n_d = np.bincount(e_d, minlength=n_ep)
+        rmssd = np.sqrt(np.bincount(e_d, weights=d * d, minlength=n_ep) / n_d)
+        pnn50 = np.bincount(e_d, weights=(np.abs(d) > 50).astype(float), minlength=n_ep) / (n_d + 1) * 100.0
+        lnrmssd = np.where(rmssd > 0, np.log(rmssd), np.nan)
+
+    lf, hf, tp = _epoch_band_powers(rr, t_end, n_ep)
+    valid = (dur >= EPOCH_MIN_COVERAGE * EPOCH_S) & (n_d >= 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lf_hf = np.where(np.isfinite(lf) & np.isfinite(hf) & (hf > 0), lf / hf, np.nan)
+
+    cols = {"t_start_s": np.arange(n_ep) * EPOCH_S, "duration_s": dur, "n_beats": n, "valid": valid,
+            "mean_rr": mean_rr, "sdnn": sdnn, "rmssd": rmssd, "lnrmssd": lnrmssd, "pnn50": pnn50,
+            "hr_mean": hr_mean, "lf_power": lf, "hf_power": hf, "lf_hf": lf_hf, "total_power": tp}
+    out = {}
+    for k in EPOCH_FIELDS:
+        a = cols[k]
+        if a.dtype.kind == "f":
+            a = np.where(valid | (k in ("t_start_s", "duration_s")), a, np.nan)
+        out[k] = a.tolist()
+    return out
 
 
-def _resp_rate_from_ppg_fft(ppg: np.ndarray, sampling_rate: float):
-    try:
-        rsp = nk.signal_filter(ppg, sampling_rate=sampling_rate, lowcut=0.1, highcut=0.4,
-                              method="butterworth", order=3)
-        rsp = np.asarray(rsp, dtype=float)
-        rsp = rsp - np.nanmean(rsp)
+def _finite_median(x):
+    x = _finite_array(x)
+    return float(np.median(x)) if x.size else np.nan
 
-        n = len(rsp)
-        if n < int(sampling_rate * 60):
-            return np.nan
 
-        freqs = np.fft.rfftfreq(n, d=1.0 / sampling_rate)
-        spec = np.abs(np.fft.rfft(rsp)) ** 2
+def _epoch_stats(x):
+    x = _finite_array(x)
+    if x.size == 0:
+        return None
+    p = np.percentile(x, (5, 25, 50, 75, 95))
+    return {"min": float(x.min()), "p5": float(p[0]), "p25": float(p[1]), "median": float(p[2]),
+            "p75": float(p[3]), "p95": float(p[4]), "max": float(x.max())}
 
-        mask = (freqs >= 0.1) & (freqs <= 0.4)
-        if not np.any(mask):
-            return np.nan
 
-        f0 = freqs[mask][int(np.argmax(spec[mask]))]
-        rpm = float(f0 * 60.0)
-        return rpm if np.isfinite(rpm) else np.nan
-    except Exception:
-        return np.nan
+def _epoch_clock_hours(t_start_s, start_time):
+    """Hora del día (0–24) del inicio de cada epoch; start_time ISO 8601 o "HH:MM"."""
+    s = str(start_time or "").strip()
+    if not s:
+        return None
+    try:
+        if len(s) <= 5 and ":" in s:
+            hh, mm = s.split(":")
+            h0 = int(hh) + int(mm) / 60.0
+        else:
+            dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+            h0 = dt.hour + dt.minute / 60.0 + dt.second / 3600.0
+    except ValueError:
+        return None
+    return (h0 + np.asarray(t_start_s, dtype=float) / 3600.0) % 24.0
 
 
-def _ppg_peaks_robust(ppg_f: np.ndarray, sampling_rate: float):
+def summarize_epochs(epochs: dict, start_time=None):
     """
-    Picos robustos:
-    - intenta NK2 elgendi
-    - si falla o da pocos picos, fallback a find_peaks con prominencia adaptativa
+    Resumen de la tabla de epochs: min / percentiles / max por métrica, índices
+    de 24 h (SDANN, SDNN index) y línea de base nocturna: epochs de
+    EPOCH_NIGHT_HOURS si se conoce start_time, si no el 25% de epochs con FC
+    más baja (proxy de sueño).
     """
-    p = np.asarray(ppg_f, dtype=float)
-    n = p.size
-    if n < int(sampling_rate * 10):
-        return None
+    valid = np.asarray(epochs["valid"], dtype=bool)
+    col = {k: np.asarray(epochs[k], dtype=float)[valid] for k in ("mean_rr", "sdnn", "rmssd", "lnrmssd",
+                                                                  "hr_mean", "lf_hf", "t_start_s")}
+    out = {
+        "epoch_seconds": EPOCH_S,
+        "n_epochs": int(valid.size),
+        "n_valid": int(valid.sum()),
+        "sdann": float(np.std(col["mean_rr"], ddof=1)) if col["mean_rr"].size >= 2 else np.nan,
+        "sdnn_index": float(np.mean(col["sdnn"])) if col["sdnn"].size else np.nan,
+        "stats": {k: _epoch_stats(col[k]) for k in ("rmssd", "lnrmssd", "sdnn", "hr_mean", "lf_hf")},
+        "night_baseline": None,
+    }
+    if not valid.any():
+        return out
 
-    # 1) intento NK2
-    try:
-        _peaks, info = nk.ppg_peaks(p, sampling_rate=sampling_rate, method="elgendi")
-        peaks_idx = info.get("PPG_Peaks", info.get("peaks", None))
-        if peaks_idx is not None:
-            peaks_idx = np.asarray(peaks_idx, dtype=int)
-            peaks_idx = peaks_idx[(peaks_idx > 0) & (peaks_idx < n)]
-            if peaks_idx.size >= 12:
-                return peaks_idx
-    except Exception:
-        pass
+    hours = _epoch_clock_hours(col["t_start_s"], start_time)
+    if hours is not None:
+        lo, hi = EPOCH_NIGHT_HOURS
+        night, method = (hours >= lo) & (hours < hi), "clock"
+    else:
+        night, method = col["hr_mean"] <= np.percentile(col["hr_mean"], 25), "low_hr"
+    if night.any():
+        out["night_baseline"] = {
+            "method": method,
+            "n_epochs": int(night.sum()),
+            **{k: _finite_median(col[k][night]) for k in ("rmssd", "lnrmssd", "hr_mean", "lf_hf")},
+        }
+    return out
 
-    # 2) fallback scipy.find_peaks con parámetros fisiológicos
-    # HR 40–180 -> RR 333–1500ms
-    min_dist = int((0.33) * sampling_rate)  # 333 ms
-    min_dist = max(1, min_dist)
 
-    # prominencia adaptativa por percentiles (evita detección por ruido)
-    amp = np.percentile(p, 95) - np.percentile(p, 5)
-    prom = max(0.10, 0.15 * amp)  # conservador
+# ============================
+# Preprocesado (diseños SOS memoizados, fase cero en float32, decimación, resampleo)
+# ============================
 
-    peaks, _ = signal.find_peaks(p, distance=min_dist, prominence=prom)
-    peaks = np.asarray(peaks, dtype=int)
-    peaks = peaks[(peaks > 0) & (peaks < n)]
-    if peaks.size < 12:
-        return None
-    return peaks
+PPG_BAND_HZ = (0.7, 5.0)    # pulso (42–300 bpm): deja fuera la deriva respiratoria y el ruido alto
+FILTER_ORDER = 3
+FILTER_DTYPE = np.float32   # sosfiltfilt en float32: mitad de memoria, error ~1e-6 sobre el z-score
+RESAMPLE_HZ = float(os.environ.get("HBA_RESAMPLE_HZ", "60"))  # grilla uniforme para señales con timestamps
 
 
-def compute_hrv_from_ppg(ppg: np.ndarray, sampling_rate: float, duration_minutes=None):
+@functools.lru_cache(maxsize=64)
+def _sos_design(fs: float, lowcut: float, highcut: float, order: int):
+    """Butterworth band-pass en SOS, diseñado una vez por (fs, banda, orden). No modificar."""
+    return signal.butter(order, [lowcut, highcut], btype="bandpass", output="sos", fs=fs).astype(FILTER_DTYPE)
+
+
+def bandpass(x: np.ndarray, sampling_rate: float, band_hz, order: int = FILTER_ORDER):
     """
-    HRV desde PPG (cámara):
-    - Filtrado tolerante (0.7–5.0 Hz) para evitar picos fantasmas
-    - Peaks robustos (NK2 + fallback find_peaks)
-    - RR -> limpieza Kubios-like + salvataje por ventanas
-    - HRV en NK2 con fallback
+    Band-pass de fase cero (sosfiltfilt) sobre float32 con el diseño memoizado.
+    Lanza ValueError si la banda no entra bajo Nyquist (el llamador decide el fallback).
     """
-    ppg = _finite_array(ppg)
-    if sampling_rate is None or not np.isfinite(sampling_rate) or sampling_rate <= 1:
-        return {"error": "sampling_rate inválido."}
+    sos = _sos_design(round(float(sampling_rate), 6), float(band_hz[0]), float(band_hz[1]), int(order))
+    return signal.sosfiltfilt(sos, np.asarray(x, dtype=FILTER_DTYPE))
 
-    min_seconds = 45
-    if len(ppg) < int(sampling_rate * min_seconds):
-        return {"error": f"PPG insuficiente (mínimo {min_seconds}s). Recomendado 3–5 min."}
 
-    ppg = np.asarray(ppg, dtype=float)
-    ppg = ppg - np.nanmean(ppg)
-    std = np.nanstd(ppg) + 1e-9
-    ppg = ppg / std
+def decimate_mean(x: np.ndarray, sampling_rate: float, target_fs: float):
+    """
+    Promedio por bloques de q = fs // target_fs muestras -> (x_dec, fs_dec).
+    Es el anti-alias de las bandas lentas: sus ceros caen en múltiplos de fs/q,
+    justo donde algo se replegaría sobre la banda. Una pasada O(n).
+    """
+    x = np.asarray(x, dtype=float)
+    fs = float(sampling_rate)
+    q = max(1, int(fs // target_fs))
+    m = x.size // q
+    return x[:m * q].reshape(m, q).mean(axis=1), fs / q
+
 
-    # filtro más realista para HRV en PPG (reduce ruido alta frecuencia)
+def resample_uniform(x: np.ndarray, t_ms, target_fs: float = None):
+    """
+    Señal con un timestamp por muestra (ms; cuadros de cámara con jitter, perdidos
+    o con el navegador estrangulado) -> grilla uniforme a target_fs (RESAMPLE_HZ)
+    por interpolación lineal (np.interp, una pasada vectorizada). La lineal no
+    sobreoscila con timestamps casi coincidentes, a diferencia de un spline.
+    Se descartan timestamps no crecientes (duplicados, reloj hacia atrás).
+    Devuelve (x_uniforme, target_fs, info de captura). Lanza ValueError si no sirven.
+    """
+    fs = float(target_fs or RESAMPLE_HZ)
+    x = np.asarray(x, dtype=float)
+    t = np.asarray(t_ms, dtype=float)
+    if t.shape != x.shape:
+        raise ValueError("timestamps_ms debe tener un valor por muestra.")
+    ok = np.isfinite(x) & np.isfinite(t)
+    x, t = x[ok], t[ok]
+    if t.size:
+        keep = t > np.maximum.accumulate(np.r_[-np.inf, t[:-1]])
+        x, t = x[keep], t[keep]
+    if t.size < 2:
+        raise ValueError("timestamps_ms sin suficientes valores crecientes.")
+
+    dt = np.diff(t)
+    med = float(np.median(dt))
+    grid = t[0] + np.arange(int((t[-1] - t[0]) * fs / 1000.0) + 1) * (1000.0 / fs)
+    info = {
+        "capture_fps": 1000.0 / med,
+        "frame_jitter_ms": float(1.4826 * np.median(np.abs(dt - med))),
+        "dropped_frames_pct": float(100.0 * np.count_nonzero(dt > 1.5 * med) / dt.size),
+    }
+    return np.interp(grid, t, x), fs, info
+
+
+def ppg_front_end(ppg: np.ndarray, sampling_rate: float):
+    """
+    Entrada común del PPG (batch, dashboard sin contexto y sesión en vivo):
+    z-score en float64 + band-pass PPG_BAND_HZ -> (ppg_norm, ppg_f).
+    Si la tasa no alcanza la banda, ppg_f es la señal normalizada sin filtrar.
+    """
+    x = np.asarray(ppg, dtype=float)
+    x = x - np.mean(x)
+    x = x / (np.std(x) + 1e-9)
     try:
-        ppg_f = nk.signal_filter(
-            ppg,
-            sampling_rate=sampling_rate,
-            lowcut=0.7,
-            highcut=5.0,
-            method="butterworth",
-            order=3
-        )
+        x_f = bandpass(x, sampling_rate, PPG_BAND_HZ)
     except Exception:
-        ppg_f = ppg
+        x_f = x
+    return x, x_f
 
-    peaks_idx = _ppg_peaks_robust(ppg_f, sampling_rate)
-    if peaks_idx is None or len(peaks_idx) < 12:
-        return {"error": "No se pudieron detectar picos PPG confiables (señal ruidosa o mal iluminada)."}
 
-    # RR (ms)
-    rr_ms = np.diff(peaks_idx) / sampling_rate * 1000.0
-    rr_ms = rr_ms[np.isfinite(rr_ms)]
-    if len(rr_ms) < 12:
-        return {"error": "PPG con RR insuficientes (muy pocos intervalos)."}
+# ============================
+# Respiración (PPG decimado + RSA desde RR, Welch y fusión)
+# ============================
 
-    # 1) salvataje tipo Kubios + ventanas
-    rr_rescued, usable_ratio, art_global = _windowed_rr_salvage(rr_ms, window_beats=45, step_beats=20, max_artifact_pct=28.0)
+RESP_BAND_HZ = (0.1, 0.4)       # 6–24 rpm
+RESP_RSA_BAND_HZ = (0.15, 0.4)  # banda HF: por debajo el tacograma tiene ondas de Mayer (~0.1 Hz)
+RESP_FS = 4.0                   # Hz tras decimar: la banda respiratoria queda holgada (Nyquist 2 Hz)
+RESP_SEG_S = 64.0           # segmentos de Welch (resolución 1/64 Hz ~ 0.94 rpm)
+RESP_NFFT = 1024            # zero-padding a ~0.23 rpm por bin + interpolación parabólica del pico
+RESP_MIN_S = 60.0
+RESP_AGREE_RPM = 2.0        # dos estimadores "coinciden" si difieren menos que esto
 
-    # 2) segunda capa MAD fisiológico
-    rr_clean, art_mad, _mask = clean_rri_ms(rr_rescued)
 
-    # artefactos final
+def _resp_spectrum_peak(x: np.ndarray, fs: float, band_hz=RESP_BAND_HZ):
+    """
+    Welch (hann, 50% solape, detrend lineal por segmento, mediana entre segmentos:
+    las ráfagas de movimiento no dominan) -> (rpm, confianza 0-1).
+    Confianza = fracción de la potencia en banda concentrada a ±0.03 Hz del pico.
+    """
+    n = x.size
+    if n < int(RESP_MIN_S * fs):
+        return np.nan, 0.0
+    nperseg = min(n, int(RESP_SEG_S * fs))
+    freqs, power = signal.welch(x, fs=fs, window="hann", nperseg=nperseg, noverlap=nperseg // 2,
+                                nfft=max(RESP_NFFT, nperseg), detrend="linear", average="median")
+    band = (freqs >= band_hz[0]) & (freqs <= band_hz[1])
+    p = power[band]
+    total = float(np.sum(p))
+    if not np.isfinite(total) or total <= 0:
+        return np.nan, 0.0
+    k = int(np.argmax(p))
+    f_band = freqs[band]
+    f0 = float(f_band[k])
+    if 0 < k < p.size - 1:
+        den = p[k - 1] - 2.0 * p[k] + p[k + 1]
+        if den < 0:
+            f0 += float(0.5 * (p[k - 1] - p[k + 1]) / den * (f_band[1] - f_band[0]))
+    near = np.abs(f_band - f0) <= 0.03
+    return f0 * 60.0, float(np.sum(p[near]) / total)
+
+
+def resp_from_ppg(ppg: np.ndarray, sampling_rate: float):
+    """
+    Respiración por variación de intensidad del PPG (RIIV): PPG normalizado sin
+    filtrar -> decimate_mean a ~RESP_FS -> Welch.
+    Welch corre sobre ~4 muestras/s (1 h = 14 400), no a la tasa de la cámara.
+    """
+    try:
+        x, fs = decimate_mean(ppg, sampling_rate, RESP_FS)
+        return _resp_spectrum_peak(x, fs)
+    except Exception:
+        return np.nan, 0.0
+
+
+def resp_from_rr(rr_ms: np.ndarray):
+    """Respiración por RSA: tacograma RR (ms) remuestreado a RESP_FS -> Welch."""
+    try:
+        rr = _finite_array(rr_ms)
+        if rr.size < 12:
+            return np.nan, 0.0
+        t = np.cumsum(rr) / 1000.0
+        grid = np.arange(t[0], t[-1], 1.0 / RESP_FS)
+        return _resp_spectrum_peak(np.interp(grid, t, rr), RESP_FS, RESP_RSA_BAND_HZ)
+    except Exception:
+        return np.nan, 0.0
+
+
+def fuse_resp(estimates):
+    """
+    Fusión de estimadores [(nombre, rpm, confianza)] -> (rpm, confianza, fuente).
+    - si coinciden (< RESP_AGREE_RPM): promedio ponderado, la confianza sube
+    - si no: gana el de mayor confianza, penalizado por el desacuerdo
+    """
+    valid = [(name, r, c) for name, r, c in estimates if np.isfinite(r) and c > 0]
+    if not valid:
+        return np.nan, 0.0, None
+    valid.sort(key=lambda e: e[2], reverse=True)
+    name, r1, c1 = valid[0]
+    if len(valid) == 1:
+        return r1, c1, name
+    _name2, r2, c2 = valid[1]
+    if abs(r1 - r2) < RESP_AGREE_RPM:
+        return (r1 * c1 + r2 * c2) / (c1 + c2), min(1.0, c1 + 0.5 * c2), "fused"
+    return r1, c1 * (1.0 - 0.5 * c2), name
+
+
+def respiration_estimate(ppg=None, sampling_rate=None, rr_ms=None):
+    """
+    Campos de respiración del resultado. PPG y RR son opcionales: con ambos se
+    fusionan (RIIV + RSA); con RR solo (Polar/SCG) queda el estimador RSA.
+    """
+    estimates = []
+    if ppg is not None:
+        estimates.append(("ppg", *resp_from_ppg(ppg, sampling_rate)))
+    if rr_ms is not None:
+        estimates.append(("rsa", *resp_from_rr(rr_ms)))
+    rpm, conf, source = fuse_resp(estimates)
+    out = {"resp_rate_rpm": rpm, "resp_confidence": conf, "resp_source": source}
+    for name, r, _c in estimates:
+        out[f"resp_rate_{name}_rpm"] = r
+    return out
+
+
+# ============================
+# HRV Backend (robusto)
+# ============================
+
+def _hr_basic_from_rr(rr_ms: np.ndarray):
+    rr = _finite_array(rr_ms)
+    if rr.size < 3:
+        return np.nan, np.nan, np.nan
+    hr = 60000.0 / rr
+    return float(np.nanmean(hr)), float(np.nanmax(hr)), float(np.nanmin(hr))
+
+
+def analyze_rri(rri_ms: np.ndarray, duration_minutes=None):
+    """
+    Igual que compute_hrv_from_rri, pero devuelve (result, AnalysisContext).
+    """
+    rri_ms = _finite_array(rri_ms)
+    ctx = AnalysisContext(sensor_type="rri")
+
+    if len(rri_ms) < 12:
+        return {"error": "Insuficientes intervalos RR (mínimo recomendado: 12).", "artifact_percent": np.nan}, ctx
+
+    ctx.set_rr_raw(rri_ms)
+
+    # 1) limpieza robusta tipo Kubios + salvataje
+    with _Stage("rr_salvage"):
+        rr_rescued, usable_ratio, art_global, breaks = _windowed_rr_salvage(rri_ms, window_beats=45, step_beats=20, max_artifact_pct=25.0)
+
+    # 2) además, clean_rri_ms (fisiológico + MAD) como segunda capa
+    with _Stage("rr_clean"):
+        rr_clean, art_mad, clean_mask = clean_rri_ms(rr_rescued)
+    ctx.rr_clean, ctx.clean_mask = rr_clean, clean_mask
+
+    # artefact_percent final (mezcla conservadora)
     if np.isfinite(art_global) and np.isfinite(art_mad):
-        artifact_final = float(0.65 * art_global + 0.35 * art_mad)
+        artifact_percent = float(0.65 * art_global + 0.35 * art_mad)
     elif np.isfinite(art_global):
-        artifact_final = float(art_global)
+        artifact_percent = float(art_global)
     else:
-        artifact_final = float(art_mad) if np.isfinite(art_mad) else np.nan
+        artifact_percent = float(art_mad) if np.isfinite(art_mad) else np.nan
 
     hr_mean, hr_max, hr_min = _hr_basic_from_rr(rr_clean)
 
-    # HRV con NK2 (rri fallback peaks)
-    hrv_mode = "rri"
-    try:
-        hrv_time = nk.hrv_time(rri=rr_clean, show=False)
-        hrv_freq = nk.hrv_frequency(rri=rr_clean, show=False)
-    except Exception as e:
-        peaks_bin = rri_to_peaks(rr_clean, sampling_rate=1000)
-        if peaks_bin is None:
-            return {"error": f"Fallo calculando HRV desde RR (PPG): {str(e)}", "artifact_percent": artifact_final}
-        hrv_mode = "peaks"
-        try:
-            hrv_time = nk.hrv_time(peaks_bin, sampling_rate=1000, show=False)
-            hrv_freq = nk.hrv_frequency(peaks_bin, sampling_rate=1000, show=False)
-        except Exception as e2:
-            return {"error": f"Fallo calculando HRV desde peaks (PPG): {str(e2)}", "artifact_percent": artifact_final}
+    # registros largos (noche / 24 h): frecuencia por epochs en vez de un LF/HF global
+    long_mode = float(np.sum(rr_clean)) / 60000.0 >= EPOCH_MODE_MIN_MINUTES
+    epochs = None
+    if long_mode:
+        with _Stage("hrv_epochs"):
+            epochs = hrv_epochs(rr_clean, breaks=breaks)
+
+    # 3) HRV: kernel nativo, o NK2 como referencia (rri o fallback peaks)
+    with _Stage("hrv"):
+        if HRV_ENGINE == "native":
+            hrv = hrv_indices_native(rr_clean, breaks=breaks, freq=not long_mode)
+            if hrv is None:
+                return {"error": "No se pudo construir tren de picos desde RR.", "artifact_percent": artifact_percent}, ctx
+            hrv_mode = "native"
+        else:
+            hrv_mode = "rri"
+            try:
+                hrv_time = nk.hrv_time(rri=rr_clean, show=False)
+                hrv_freq = nk.hrv_frequency(rri=rr_clean, show=False)
+            except Exception:
+                peaks = rri_to_peaks(rr_clean, sampling_rate=1000)
+                if peaks is None:
+                    return {"error": "No se pudo construir tren de picos desde RR.", "artifact_percent": artifact_percent}, ctx
+                hrv_mode = "peaks"
+                hrv_time = nk.hrv_time(peaks, sampling_rate=1000, show=False)
+                hrv_freq = nk.hrv_frequency(peaks, sampling_rate=1000, show=False)
+            hrv = _hrv_indices_from_nk(hrv_time, hrv_freq)
+
+    rmssd = hrv["rmssd"]
+    sdnn = hrv["sdnn"]
+    pnn50 = hrv["pnn50"]
+    mean_rr = hrv["mean_rr"]
+    lnrmssd = np.log(rmssd) if np.isfinite(rmssd) and rmssd > 0 else np.nan
 
-    def g(df, key):
+    lf = hrv["lf"]
+    hf = hrv["hf"]
+    tp = hrv["tp"]
+    lfhf = (lf / hf) if np.isfinite(lf) and np.isfinite(hf) and hf > 0 else np.nan
+
+    freq_warning = None
+    if epochs is not None:
+        # un LF/HF de toda la serie no tiene sentido: mediana de los epochs válidos
+        lf, hf, tp, lfhf = (_finite_median(epochs[k]) for k in ("lf_power", "hf_power", "total_power", "lf_hf"))
+        freq_warning = f"Registro largo: LF/HF y potencias = mediana de epochs de {EPOCH_S / 60:g} min (ver epochs)."
+    elif duration_minutes is not None:
         try:
-            return _as_float(df[key].iloc[0])
+            dm = float(duration_minutes)
+            if dm < 5:
+                freq_warning = "Segmento < 5 min: LF/HF y potencia espectral pueden ser menos estables."
         except Exception:
-            return np.nan
+            pass
+
+    # 4) quality_score (0-100) y usable_ratio (0-1)
+    # cuanto menos artefacto, más score; usable_ratio rescate real de tramos
+    quality_score = np.nan
+    if np.isfinite(artifact_percent):
+        quality_score = float(np.clip(100.0 - artifact_percent, 0.0, 100.0))
+
+    # 5) respiración por RSA (sin PPG no hay otro estimador)
+    with _Stage("resp_rate"):
+        resp = respiration_estimate(rr_ms=rr_clean)
+
+    extra = {}
+    if epochs is not None:
+        extra = {"epochs": epochs, "epochs_summary": summarize_epochs(epochs)}
+
+    return {
+        "rmssd": rmssd,
+        "sdnn": sdnn,
+        "lnrmssd": lnrmssd,
+        "pnn50": pnn50,
+        "mean_rr": mean_rr,
+        "lf_power": lf,
+        "hf_power": hf,
+        "lf_hf": lfhf,
+        "total_power": tp,
+        "artifact_percent": artifact_percent,
+        "usable_ratio": float(usable_ratio) if np.isfinite(usable_ratio) else None,
+        "quality_score": quality_score,
+        "n_rr": int(len(rr_clean)),
+        "hr_mean": hr_mean,
+        "hr_max": hr_max,
+        "hr_min": hr_min,
+        **resp,
+        "freq_warning": freq_warning,
+        "hrv_mode": hrv_mode,
+        **extra,
+    }, ctx
+
+
+def compute_hrv_from_rri(rri_ms: np.ndarray, duration_minutes=None):
+    return analyze_rri(rri_ms, duration_minutes=duration_minutes)[0]
+
+
+# Elgendi et al. (2013): dos medias móviles sobre la señal rectificada al cuadrado
+PPG_PEAK_WINDOW_S = 0.111   # media "pico" (= largo mínimo de bloque, umbral 2 del paper)
+PPG_BEAT_WINDOW_S = 0.667   # media "latido"
+PPG_BEAT_OFFSET = 0.02      # umbral 1 = media latido + offset * mean(señal²)
+PPG_MIN_DELAY_S = 0.3       # separación mínima entre picos
+PPG_MIN_PEAKS = 12
+PPG_LOW_CONFIDENCE = 0.5    # picos por debajo cuentan en low_confidence_peaks_pct
+
+
+def _parabolic_peak(y: np.ndarray, j: np.ndarray):
+    """
+    Vértice de la parábola por (j-1, j, j+1) -> posición fraccionaria de cada
+    máximo (|corrimiento| <= 0.5 muestra). j debe estar en [1, n-2].
+    A 30 fps una muestra son 33 ms: sin esto la cuantización infla RMSSD.
+    """
+    y0, y1, y2 = (np.asarray(y[j + d], dtype=float) for d in (-1, 0, 1))
+    den = y0 - 2.0 * y1 + y2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frac = np.where(np.abs(den) > 1e-12, 0.5 * (y0 - y2) / den, 0.0)
+    return j + np.clip(frac, -0.5, 0.5)
+
+
+def _moving_mean_nearest(x: np.ndarray, size: int):
+    """Media móvil centrada por suma acumulada, O(n) (= uniform_filter1d, mode="nearest")."""
+    size = max(1, int(size))
+    xp = np.concatenate([np.full(size // 2, x[0]), x, np.full((size - 1) // 2, x[-1])])
+    c = np.concatenate([[0.0], np.cumsum(xp)])
+    return (c[size:] - c[:-size]) / size
+
+
+def ppg_peaks_elgendi(ppg_f: np.ndarray, sampling_rate: float):
+    """
+    Detector único de picos sistólicos (Elgendi 2013) vectorizado:
+    - señal>0 al cuadrado, medias móviles pico/latido por suma acumulada
+    - bloques = tramos con media pico > umbral 1, de largo >= ventana pico
+    - pico = máximo del bloque (si no cae en el borde), por reduceat
+    - separación mínima PPG_MIN_DELAY_S (solo los conflictos se resuelven en orden)
+    Devuelve (peaks int, confianza 0–1 por pico) o (None, None) si hay < PPG_MIN_PEAKS.
+    Confianza = media de: margen del bloque sobre el umbral, amplitud del pico
+    respecto de la señal y regularidad de sus RR vecinos contra la mediana local.
+    """
+    p = np.asarray(ppg_f, dtype=float)
+    n = p.size
+    fs = float(sampling_rate)
+    if n < int(fs * 10):
+        return None, None
+
+    sq = np.square(np.maximum(p, 0.0))
+    ma_peak = _moving_mean_nearest(sq, int(np.rint(PPG_PEAK_WINDOW_S * fs)))
+    ma_beat = _moving_mean_nearest(sq, int(np.rint(PPG_BEAT_WINDOW_S * fs)))
+    thr1 = ma_beat + PPG_BEAT_OFFSET * np.mean(sq)
+
+    waves = ma_peak > thr1
+    edges = np.diff(waves.astype(np.int8))
+    beg = np.flatnonzero(edges == 1)
+    end = np.flatnonzero(edges == -1)
+    if beg.size == 0:
+        return None, None
+    end = end[end > beg[0]]
+    k = min(beg.size, end.size)
+    beg, end = beg[:k], end[:k]
+    long_enough = (end - beg) >= int(np.rint(PPG_PEAK_WINDOW_S * fs))
+    beg, end = beg[long_enough], end[long_enough]
+    if beg.size < PPG_MIN_PEAKS:
+        return None, None
+
+    # máximo por bloque [beg, end): reduceat sobre los cortes (los huecos entre bloques se descartan)
+    cuts = np.empty(2 * beg.size, dtype=np.int64)
+    cuts[0::2], cuts[1::2] = beg, end
+    if cuts[-1] >= n:
+        cuts = cuts[:-1]
+    block_max = np.maximum.reduceat(p, cuts)[0::2]
+    block_min = np.minimum.reduceat(p, cuts)[0::2]
+    block_id = np.cumsum(np.bincount(cuts[0::2], minlength=n)[:n]) - 1
+    inside = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(inside, beg, 1)
+    np.add.at(inside, end, -1)
+    inside = np.cumsum(inside[:n]) > 0
+    hit = np.flatnonzero(inside & (p == block_max[np.maximum(block_id, 0)]))
+    _ids, first = np.unique(block_id[hit], return_index=True)
+    peaks = hit[first]
+    ok = (peaks > beg[_ids]) & (peaks < end[_ids] - 1)  # máximo en el borde: no es un pico local
+    peaks, blk = peaks[ok], _ids[ok]
+
+    min_delay = int(np.rint(PPG_MIN_DELAY_S * fs))
+    keep = peaks > min_delay
+    close = np.flatnonzero(np.diff(peaks) <= min_delay) + 1
+    if close.size:
+        last = -np.inf
+        for i in range(peaks.size):
+            if keep[i] and peaks[i] - last > min_delay:
+                last = peaks[i]
+            else:
+                keep[i] = False
+    peaks, blk = peaks[keep], blk[keep]
+    if peaks.size < PPG_MIN_PEAKS:
+        return None, None
+
+    # confianza por latido
+    with np.errstate(invalid="ignore", divide="ignore"):
+        margin = ma_peak[peaks] / thr1[peaks] - 1.0
+        c_thr = np.clip(margin, 0.0, 1.0)
+        amp = np.percentile(p, 95) - np.percentile(p, 5)
+        c_amp = np.clip((block_max[blk] - block_min[blk]) / (amp + 1e-9), 0.0, 1.0)
+        rr = np.diff(peaks).astype(float)
+        med = ndimage.median_filter(rr, size=min(9, rr.size), mode="nearest")
+        dev = np.clip(1.0 - np.abs(rr / med - 1.0) / 0.3, 0.0, 1.0)
+        c_rr = np.minimum(np.r_[dev[0], dev], np.r_[dev, dev[-1]])
+    conf = (c_thr + c_amp + c_rr) / 3.0
+    return peaks.astype(int), conf
+
+
+def _ppg_peaks_robust(ppg_f: np.ndarray, sampling_rate: float):
+    """Índices de picos PPG (ppg_peaks_elgendi) o None; mantiene la firma para los llamadores."""
+    peaks, _conf = ppg_peaks_elgendi(ppg_f, sampling_rate)
+    _trace_note("peaks_method", "elgendi" if peaks is not None else "none")
+    return peaks
+
+
+def analyze_ppg(ppg: np.ndarray, sampling_rate: float, duration_minutes=None):
+    """
+    HRV desde PPG (cámara):
+    - ppg_front_end: z-score + band-pass PPG_BAND_HZ (SOS memoizado, fase cero)
+    - Picos: detector Elgendi vectorizado (ppg_peaks_elgendi) con confianza por latido
+    - RR desde picos refinados sub-muestra (_parabolic_peak)
+    - RR -> limpieza Kubios-like + salvataje por ventanas
+    - HRV en NK2 con fallback
+    Devuelve (result, AnalysisContext).
+    """
+    ppg = _finite_array(ppg)
+    ctx = AnalysisContext(sensor_type="ppg", sampling_rate=sampling_rate)
+    if sampling_rate is None or not np.isfinite(sampling_rate) or sampling_rate <= 1:
+        return {"error": "sampling_rate inválido."}, ctx
+
+    min_seconds = 45
+    if len(ppg) < int(sampling_rate * min_seconds):
+        return {"error": f"PPG insuficiente (mínimo {min_seconds}s). Recomendado 3–5 min."}, ctx
+
+    # filtro más realista para HRV en PPG (reduce ruido alta frecuencia)
+    with _Stage("ppg_filter"):
+        ppg, ppg_f = ppg_front_end(ppg, sampling_rate)
+
+    ctx.signal_f = ppg_f
+
+    with _Stage("ppg_peaks"):
+        peaks_idx, peaks_conf = ppg_peaks_elgendi(ppg_f, sampling_rate)
+    _trace_note("peaks_method", "elgendi" if peaks_idx is not None else "none")
+    ctx.peaks_idx, ctx.peaks_conf = peaks_idx, peaks_conf
+    if peaks_idx is None or len(peaks_idx) < 12:
+        return {"error": "No se pudieron detectar picos PPG confiables (señal ruidosa o mal iluminada)."}, ctx
+
+    # RR (ms) desde la posición sub-muestra de cada pico
+    peaks_pos = peaks_idx.astype(float)
+    inner = (peaks_idx > 0) & (peaks_idx < len(ppg_f) - 1)
+    peaks_pos[inner] = _parabolic_peak(ppg_f, peaks_idx[inner])
+    rr_ms = np.diff(peaks_pos) / sampling_rate * 1000.0
+    rr_ms = rr_ms[np.isfinite(rr_ms)]
+    if len(rr_ms) < 12:
+        return {"error": "PPG con RR insuficientes (muy pocos intervalos)."}, ctx
+    ctx.set_rr_raw(rr_ms)
+
+    # 1) salvataje tipo Kubios + ventanas
+    with _Stage("rr_salvage"):
+        rr_rescued, usable_ratio, art_global, breaks = _windowed_rr_salvage(rr_ms, window_beats=45, step_beats=20, max_artifact_pct=28.0)
+
+    # 2) segunda capa MAD fisiológico
+    with _Stage("rr_clean"):
+        rr_clean, art_mad, clean_mask = clean_rri_ms(rr_rescued)
+    ctx.rr_clean, ctx.clean_mask = rr_clean, clean_mask
+
+    # artefactos final
+    if np.isfinite(art_global) and np.isfinite(art_mad):
+        artifact_final = float(0.65 * art_global + 0.35 * art_mad)
+    elif np.isfinite(art_global):
+        artifact_final = float(art_global)
+    else:
+        artifact_final = float(art_mad) if np.isfinite(art_mad) else np.nan
 
-    rmssd = g(hrv_time, "HRV_RMSSD")
-    sdnn = g(hrv_time, "HRV_SDNN")
-    pnn50 = g(hrv_time, "HRV_pNN50")
-    mean_rr = g(hrv_time, "HRV_MeanNN")
+    hr_mean, hr_max, hr_min = _hr_basic_from_rr(rr_clean)
+
+    # HRV: kernel nativo, o NK2 como referencia (rri fallback peaks)
+    with _Stage("hrv"):
+        if HRV_ENGINE == "native":
+            hrv = hrv_indices_native(rr_clean, breaks=breaks)
+            if hrv is None:
+                return {"error": "Fallo calculando HRV desde RR (PPG): muy pocos picos.", "artifact_percent": artifact_final}, ctx
+            hrv_mode = "native"
+        else:
+            hrv_mode = "rri"
+            try:
+                hrv_time = nk.hrv_time(rri=rr_clean, show=False)
+                hrv_freq = nk.hrv_frequency(rri=rr_clean, show=False)
+            except Exception as e:
+                peaks_bin = rri_to_peaks(rr_clean, sampling_rate=1000)
+                if peaks_bin is None:
+                    return {"error": f"Fallo calculando HRV desde RR (PPG): {str(e)}", "artifact_percent": artifact_final}, ctx
+                hrv_mode = "peaks"
+                try:
+                    hrv_time = nk.hrv_time(peaks_bin, sampling_rate=1000, show=False)
+                    hrv_freq = nk.hrv_frequency(peaks_bin, sampling_rate=1000, show=False)
+                except Exception as e2:
+                    return {"error": f"Fallo calculando HRV desde peaks (PPG): {str(e2)}", "artifact_percent": artifact_final}, ctx
+            hrv = _hrv_indices_from_nk(hrv_time, hrv_freq)
+
+    rmssd = hrv["rmssd"]
+    sdnn = hrv["sdnn"]
+    pnn50 = hrv["pnn50"]
+    mean_rr = hrv["mean_rr"]
     lnrmssd = np.log(rmssd) if np.isfinite(rmssd) and rmssd > 0 else np.nan
 
-    lf = g(hrv_freq, "HRV_LF")
-    hf = g(hrv_freq, "HRV_HF")
-    tp = g(hrv_freq, "HRV_TP")
+    lf = hrv["lf"]
+    hf = hrv["hf"]
+    tp = hrv["tp"]
     lfhf = (lf / hf) if np.isfinite(lf) and np.isfinite(hf) and hf > 0 else np.nan
 
-    resp_rpm = _resp_rate_from_ppg_fft(ppg_f, sampling_rate)
+    with _Stage("resp_rate"):
+        resp = respiration_estimate(ppg, sampling_rate, rr_clean)
 
     freq_warning = None
     if duration_minutes is not None:
@@ -509,12 +1438,139 @@ def compute_hrv_from_ppg(ppg: np.ndarray, sampling_rate: float, duration_minutes
         "hr_mean": hr_mean,
         "hr_max": hr_max,
         "hr_min": hr_min,
-        "resp_rate_rpm": resp_rpm,
+        **resp,
         "freq_warning": freq_warning,
         "hrv_mode": hrv_mode,
         "n_rr": int(len(rr_clean)),
-        "n_peaks": int(len(peaks_idx))
-    }
+        "n_peaks": int(len(peaks_idx)),
+        "peak_confidence": float(np.median(peaks_conf)),
+        "low_confidence_peaks_pct": float(100.0 * np.mean(peaks_conf < PPG_LOW_CONFIDENCE)),
+    }, ctx
+
+
+def compute_hrv_from_ppg(ppg: np.ndarray, sampling_rate: float, duration_minutes=None):
+    return analyze_ppg(ppg, sampling_rate, duration_minutes=duration_minutes)[0]
+
+
+SCG_BAND_HZ = (4.0, 20.0)   # complejo AO/AC del SCG (el tope se limita a 0.45·fs)
+SCG_LOBE_S = 0.40           # envolvente ancha: S1+S2 en un solo lóbulo por latido
+SCG_FINE_S = 0.05           # envolvente fina: ubica el pico AO dentro del lóbulo
+SCG_MIN_BEAT_S = 0.40       # HR <= 150 bpm en reposo
+
+
+def _moving_mean(x: np.ndarray, seconds: float, sampling_rate: float):
+    k = max(1, int(round(seconds * sampling_rate)))
+    return np.convolve(x, np.ones(k) / k, mode="same"), k
+
+
+def _scg_beats(acc_f: np.ndarray, sampling_rate: float):
+    """
+    Latidos en SCG filtrado, en muestras con fracción (float):
+    - lóbulos de energía (SCG_LOBE_S) con prominencia adaptativa -> un latido c/u
+    - dentro de cada lóbulo, máximo de la envolvente fina + refinamiento parabólico
+      (a 50–60 Hz una muestra son 17–20 ms: sin esto el jitter infla RMSSD)
+    """
+    n = acc_f.size
+    if n < int(sampling_rate * 10):
+        return None
+    energy = acc_f ** 2
+    env, k = _moving_mean(energy, SCG_LOBE_S, sampling_rate)
+    env = np.sqrt(env)
+    amp = np.percentile(env, 95) - np.percentile(env, 5)
+    lobes, _ = signal.find_peaks(env, distance=max(1, int(SCG_MIN_BEAT_S * sampling_rate)),
+                                 prominence=max(1e-6, 0.20 * amp))
+    if lobes.size < 12:
+        return None
+
+    fine, _k = _moving_mean(energy, SCG_FINE_S, sampling_rate)
+    win = np.clip(lobes[:, None] + np.arange(-(k // 2), k // 2 + 1), 1, n - 2)
+    j = win[np.arange(lobes.size), np.argmax(fine[win], axis=1)]
+    beats = np.unique(_parabolic_peak(fine, j))
+    return beats if beats.size >= 12 else None
+
+
+def analyze_scg(accel_mag: np.ndarray, sampling_rate: float, duration_minutes=None):
+    """
+    HRV desde vibración (acelerómetro del teléfono apoyado en el pecho, SCG):
+    - magnitud -> band-pass SCG_BAND_HZ
+    - latidos por lóbulos de energía, refinados al pico AO (_scg_beats)
+    - RR -> mismo pipeline que Polar (analyze_rri)
+    Devuelve (result, AnalysisContext).
+    """
+    acc = _finite_array(accel_mag)
+    ctx = AnalysisContext(sensor_type="scg", sampling_rate=sampling_rate)
+    if sampling_rate is None or not np.isfinite(sampling_rate) or sampling_rate <= 1:
+        return {"error": "sampling_rate inválido."}, ctx
+
+    lowcut, highcut = SCG_BAND_HZ[0], min(SCG_BAND_HZ[1], 0.45 * sampling_rate)
+    if highcut <= lowcut + 2.0:
+        return {"error": "sampling_rate insuficiente para SCG (mínimo ~15 Hz)."}, ctx
+
+    min_seconds = 45
+    if len(acc) < int(sampling_rate * min_seconds):
+        return {"error": f"Vibración insuficiente (mínimo {min_seconds}s). Recomendado 3–5 min."}, ctx
+
+    acc = acc - np.mean(acc)
+    acc = acc / (np.std(acc) + 1e-9)
+    with _Stage("scg_filter"):
+        try:
+            acc_f = bandpass(acc, sampling_rate, (lowcut, highcut))
+        except Exception:
+            acc_f = acc
+
+    acc_f = np.asarray(acc_f, dtype=float)
+    ctx.signal_f = acc_f
+
+    with _Stage("scg_beats"):
+        beats = _scg_beats(acc_f, sampling_rate)
+    if beats is None:
+        return {"error": "No se pudieron detectar latidos en la vibración (teléfono suelto o con movimiento)."}, ctx
+    ctx.peaks_idx = np.round(beats).astype(int)
+
+    rr_ms = np.diff(beats) / sampling_rate * 1000.0
+    result, rr_ctx = analyze_rri(rr_ms, duration_minutes=duration_minutes)
+    ctx.rr_raw, ctx.rr_nn, ctx.nn_mask = rr_ctx.rr_raw, rr_ctx.rr_nn, rr_ctx.nn_mask
+    ctx.rr_clean, ctx.clean_mask = rr_ctx.rr_clean, rr_ctx.clean_mask
+    if result.get("error"):
+        return result, ctx
+
+    result["n_samples"] = int(len(acc))
+    result["sampling_rate"] = float(sampling_rate)
+    result["n_peaks"] = int(len(beats))
+    return result, ctx
+
+
+# ============================
+# Registro de sensores (sensor_type -> campo de señal + pipeline)
+# ============================
+
+# pipeline -> (función de análisis, necesita sampling_rate)
+PIPELINES = {
+    "rri": (analyze_rri, False),
+    "ppg": (analyze_ppg, True),
+    "scg": (analyze_scg, True),
+}
+
+SENSORS = {}
+SIGNAL_FIELDS = {}  # sensor_type -> campo de señal (transporte binario)
+
+
+def register_sensor(sensor_type: str, field: str, pipeline: str, sampling_rate=None):
+    """
+    Registra un sensor: qué campo del payload trae la señal, qué pipeline la
+    analiza y el sampling_rate por defecto (solo pipelines muestreados).
+    """
+    if pipeline not in PIPELINES:
+        raise ValueError(f"pipeline desconocido: {pipeline}")
+    SENSORS[sensor_type] = {"field": field, "pipeline": pipeline, "sampling_rate": sampling_rate}
+    SIGNAL_FIELDS[sensor_type] = field
+
+
+register_sensor("polar_h10", "rri_ms", "rri")
+register_sensor("rr_upload", "rri_ms", "rri")
+register_sensor("camera_ppg", "ppg", "ppg", sampling_rate=30)
+register_sensor("face_rppg", "ppg", "ppg", sampling_rate=30)
+register_sensor("vibration_scg", "accel_mag", "scg", sampling_rate=60)
 
 
 # ============================
@@ -536,6 +1592,27 @@ def baevsky_index(nn_ms: np.ndarray):
     return float(SI) if np.isfinite(SI) else np.nan
 
 
+# normas y umbrales del dashboard (una sola tabla para el cálculo por request y por cohorte)
+RMSSD_NORMS = {
+    "age_edges": (20, 30, 40, 50, 60),          # [<20, 20–29, 30–39, 40–49, 50–59, >=60]
+    "low": (35.0, 30.0, 25.0, 20.0, 18.0, 15.0),
+    "high": (80.0, 70.0, 60.0, 50.0, 45.0, 40.0),
+    "female_high_offset": 2.0,
+    "unknown_age": (25.0, 55.0),
+}
+DASHBOARD_THRESHOLDS = {
+    "sdnn": (30.0, 60.0),
+    "hr_mean": (60.0, 85.0),
+    "lf_hf": (1.5, 3.0),
+    "baevsky": (150.0, 300.0),
+    "autonomic_score": (35.0, 65.0),
+    "fatigue": (35.0, 65.0),
+}
+DASHBOARD_NORMS_VERSION = hashlib.sha1(
+    json.dumps([RMSSD_NORMS, DASHBOARD_THRESHOLDS], sort_keys=True).encode("utf-8")
+).hexdigest()[:12]
+
+
 def classify_hml(value, low, high):
     v = _as_float(value)
     if not np.isfinite(v):
@@ -552,25 +1629,14 @@ def rmssd_reference_by_age_sex(age, sex):
     s = (str(sex).upper().strip() if sex is not None else "X")
 
     if not np.isfinite(a):
-        low, high = 25.0, 55.0
+        low, high = RMSSD_NORMS["unknown_age"]
         return low, high
 
-    a = int(a)
-    if a < 20:
-        low, high = 35.0, 80.0
-    elif a < 30:
-        low, high = 30.0, 70.0
-    elif a < 40:
-        low, high = 25.0, 60.0
-    elif a < 50:
-        low, high = 20.0, 50.0
-    elif a < 60:
-        low, high = 18.0, 45.0
-    else:
-        low, high = 15.0, 40.0
+    i = bisect.bisect_right(RMSSD_NORMS["age_edges"], int(a))
+    low, high = RMSSD_NORMS["low"][i], RMSSD_NORMS["high"][i]
 
     if s == "F":
-        high += 2.0
+        high += RMSSD_NORMS["female_high_offset"]
     return float(low), float(high)
 
 
@@ -619,49 +1685,175 @@ def fatigue_scores_0_100(rmssd, sdnn, hr_mean):
     return phys, emo
 
 
+# textos fijos del dashboard: se arman una vez y el cliente los pide aparte
+# (GET /api/dashboard/static, con ETag) en vez de recibirlos en cada resultado
+SEMAPHORE_PLANS = {
+    "bajo": {"color": "rojo", "plan": [
+        {"item": "Equilibrio SNA / patrón respiratorio / visualización", "pct": 60},
+        {"item": "Tejido miofascial (40% tensión e intensidad)", "pct": 40},
+        {"item": "Ejercicios de columna", "pct": 20},
+        {"item": "Ejercicio biomecánico funcional", "pct": 10},
+        {"item": "Relax", "pct": 10},
+    ]},
+    "medio": {"color": "amarillo", "plan": [
+        {"item": "Equilibrio SNA", "pct": 40},
+        {"item": "Tejido miofascial (60% tensión e intensidad)", "pct": 60},
+        {"item": "Ejercicios de columna", "pct": 20},
+        {"item": "Ejercicios biomecánicos funcionales", "pct": 30},
+        {"item": "Relax", "pct": 10},
+    ]},
+    "alto": {"color": "verde", "plan": [
+        {"item": "Equilibrio SNA", "pct": 30},
+        {"item": "Tejido miofascial (máxima tensión e intensidad)", "pct": 100},
+        {"item": "Ejercicios biomecánicos funcionales", "pct": 40},
+        {"item": "Ejercicios de columna", "pct": 20},
+        {"item": "Relax", "pct": 10},
+    ]},
+}
+_SEMAPHORE_NONE = {"color": "gris", "plan": []}
+
+BIOMARKER_MEANINGS = [
+    {"biomarker": "HRV (RMSSD)", "meaning": "Variabilidad a corto plazo; asociada a modulación parasimpática (vagal) y recuperación."},
+    {"biomarker": "lnRMSSD", "meaning": "RMSSD en escala log; más estable para seguimiento."},
+    {"biomarker": "SDNN", "meaning": "Variabilidad global; refleja balance autonómico general."},
+    {"biomarker": "LF/HF", "meaning": "Indicador aproximado de balance simpático/parasimpático (muy sensible a respiración y duración)."},
+    {"biomarker": "Baevsky (SI)", "meaning": "Índice de estrés basado en distribución de RR; alto suele indicar mayor tensión autonómica."},
+    {"biomarker": "Score autonómico", "meaning": "Score compuesto (0–100) que resume carga autonómica con RMSSD + LF/HF + Baevsky."},
+    {"biomarker": "Fatiga física", "meaning": "Heurístico (0–100) combinando SDNN y FC media."},
+    {"biomarker": "Fatiga emocional", "meaning": "Heurístico (0–100) combinando RMSSD y FC media."},
+    {"biomarker": "Carga autonómica", "meaning": "Interpretación práctica del score autonómico (bajo/medio/alto)."},
+]
+
+DASHBOARD_DIFFERENTIATOR = {
+    "what_distinguishes": "Semáforo HBA: traduce tu HRV (RMSSD por edad/sexo) en un plan porcentual de intervención (SNA / miofascial / columna / biomecánico / relax)."
+}
+
+DASHBOARD_STATIC = {
+    "interpretation": BIOMARKER_MEANINGS,
+    "semaphore_plans": {v["color"]: v["plan"] for v in (*SEMAPHORE_PLANS.values(), _SEMAPHORE_NONE)},
+    "differentiator": DASHBOARD_DIFFERENTIATOR,
+}
+DASHBOARD_STATIC_ETAG = hashlib.sha1(
+    json.dumps(DASHBOARD_STATIC, sort_keys=True, ensure_ascii=False).encode("utf-8")
+).hexdigest()[:16]
+
+
 def semaphore_plan(rmssd_state):
-    if rmssd_state == "bajo":
-        return {"color": "rojo", "plan": [
-            {"item": "Equilibrio SNA / patrón respiratorio / visualización", "pct": 60},
-            {"item": "Tejido miofascial (40% tensión e intensidad)", "pct": 40},
-            {"item": "Ejercicios de columna", "pct": 20},
-            {"item": "Ejercicio biomecánico funcional", "pct": 10},
-            {"item": "Relax", "pct": 10},
-        ]}
-    if rmssd_state == "medio":
-        return {"color": "amarillo", "plan": [
-            {"item": "Equilibrio SNA", "pct": 40},
-            {"item": "Tejido miofascial (60% tensión e intensidad)", "pct": 60},
-            {"item": "Ejercicios de columna", "pct": 20},
-            {"item": "Ejercicios biomecánicos funcionales", "pct": 30},
-            {"item": "Relax", "pct": 10},
-        ]}
-    if rmssd_state == "alto":
-        return {"color": "verde", "plan": [
-            {"item": "Equilibrio SNA", "pct": 30},
-            {"item": "Tejido miofascial (máxima tensión e intensidad)", "pct": 100},
-            {"item": "Ejercicios biomecánicos funcionales", "pct": 40},
-            {"item": "Ejercicios de columna", "pct": 20},
-            {"item": "Relax", "pct": 10},
-        ]}
-    return {"color": "gris", "plan": []}
+    """Objeto compartido (no mutar)."""
+    return SEMAPHORE_PLANS.get(rmssd_state, _SEMAPHORE_NONE)
 
 
 def biomarker_meanings():
-    return [
-        {"biomarker": "HRV (RMSSD)", "meaning": "Variabilidad a corto plazo; asociada a modulación parasimpática (vagal) y recuperación."},
-        {"biomarker": "lnRMSSD", "meaning": "RMSSD en escala log; más estable para seguimiento."},
-        {"biomarker": "SDNN", "meaning": "Variabilidad global; refleja balance autonómico general."},
-        {"biomarker": "LF/HF", "meaning": "Indicador aproximado de balance simpático/parasimpático (muy sensible a respiración y duración)."},
-        {"biomarker": "Baevsky (SI)", "meaning": "Índice de estrés basado en distribución de RR; alto suele indicar mayor tensión autonómica."},
-        {"biomarker": "Score autonómico", "meaning": "Score compuesto (0–100) que resume carga autonómica con RMSSD + LF/HF + Baevsky."},
-        {"biomarker": "Fatiga física", "meaning": "Heurístico (0–100) combinando SDNN y FC media."},
-        {"biomarker": "Fatiga emocional", "meaning": "Heurístico (0–100) combinando RMSSD y FC media."},
-        {"biomarker": "Carga autonómica", "meaning": "Interpretación práctica del score autonómico (bajo/medio/alto)."},
-    ]
+    return BIOMARKER_MEANINGS
+
+
+# ---- Scoring columnar (cohortes): mismas fórmulas que las funciones escalares de arriba ----
+
+def _as_float_array(x, n):
+    """_as_float elemento a elemento ("" / None / texto -> NaN); None -> n NaN."""
+    if x is None:
+        return np.full(n, np.nan)
+    a = np.asarray(x)
+    if a.dtype.kind in "biuf":
+        return a.astype(float).reshape(-1)
+    return np.fromiter((_as_float(v) for v in a.reshape(-1)), dtype=float, count=a.size)
+
+
+def classify_hml_array(values, low, high):
+    """classify_hml vectorizado (low/high escalares o por fila)."""
+    v = np.asarray(values, dtype=float)
+    with np.errstate(invalid="ignore"):
+        return np.select(
+            [~np.isfinite(v), v < low, v > high], ["insuficiente", "bajo", "alto"], "medio"
+        ).astype(object)
+
+
+def rmssd_reference_arrays(age, sex):
+    """rmssd_reference_by_age_sex por fila, con la tabla RMSSD_NORMS."""
+    a = np.asarray(age, dtype=float)
+    ok = np.isfinite(a)
+    i = np.searchsorted(np.asarray(RMSSD_NORMS["age_edges"], dtype=float),
+                        np.trunc(np.where(ok, a, 0.0)), side="right")
+    low = np.asarray(RMSSD_NORMS["low"], dtype=float)[i]
+    high = np.asarray(RMSSD_NORMS["high"], dtype=float)[i]
+    fem = np.char.strip(np.char.upper(np.asarray(sex, dtype=str))) == "F"
+    high = high + np.where(fem, RMSSD_NORMS["female_high_offset"], 0.0)
+    low = np.where(ok, low, RMSSD_NORMS["unknown_age"][0])
+    high = np.where(ok, high, RMSSD_NORMS["unknown_age"][1])
+    return low, high
+
+
+def _mean_parts_100(*parts):
+    # np.mean(parts) * 100 solo sobre las partes presentes: suma en el mismo orden
+    # (p0 + p1) + p2 con ausentes = 0.0, así el redondeo es idéntico al escalar
+    total, count = 0.0, 0
+    for x, ok in parts:
+        total = total + np.where(ok, x, 0.0)
+        count = count + ok.astype(int)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count * 100.0, np.nan)
+
+
+def score_dashboard_columns(cols, n=None):
+    """
+    Estados, scores y color del semáforo de enrich_hba_dashboard para muchas
+    mediciones a la vez. cols: DataFrame o dict de columnas (rmssd, sdnn, lf_hf,
+    hr_mean, baevsky_si, age, sex; las que falten cuentan como vacías).
+    Devuelve dict de arrays de largo n, idénticos bit a bit a la ruta por request.
+    """
+    keys = ("rmssd", "sdnn", "lf_hf", "hr_mean", "baevsky_si", "age", "sex")
+    if n is None:
+        n = max((len(cols[k]) for k in keys if cols.get(k) is not None), default=0)
+    rm = _as_float_array(cols.get("rmssd"), n)
+    sd = _as_float_array(cols.get("sdnn"), n)
+    lf = _as_float_array(cols.get("lf_hf"), n)
+    hr = _as_float_array(cols.get("hr_mean"), n)
+    si = _as_float_array(cols.get("baevsky_si"), n)
+    age = _as_float_array(cols.get("age"), n)
+    sex = cols.get("sex")
+    sex = np.full(n, "X") if sex is None else np.asarray(sex, dtype=object).reshape(-1)
+    th = DASHBOARD_THRESHOLDS
+
+    rm_low, rm_high = rmssd_reference_arrays(age, sex)
+    rm_state = classify_hml_array(rm, rm_low, rm_high)
+
+    fin = np.isfinite
+    with np.errstate(invalid="ignore"):
+        auto = _mean_parts_100(
+            (np.clip((80.0 - rm) / (80.0 - 15.0), 0.0, 1.0), fin(rm)),
+            (np.clip((lf - 1.0) / (5.0 - 1.0), 0.0, 1.0), fin(lf)),
+            (np.clip((si - 50.0) / (500.0 - 50.0), 0.0, 1.0), fin(si)),
+        )
+        hr_part = (np.clip((hr - 55.0) / (95.0 - 55.0), 0.0, 1.0), fin(hr))
+        fat_phys = _mean_parts_100((np.clip((80.0 - sd) / (80.0 - 20.0), 0.0, 1.0), fin(sd)), hr_part)
+        fat_emo = _mean_parts_100((np.clip((60.0 - rm) / (60.0 - 15.0), 0.0, 1.0), fin(rm)), hr_part)
+
+    states = list(SEMAPHORE_PLANS)
+    colors = np.select([rm_state == k for k in states], [SEMAPHORE_PLANS[k]["color"] for k in states],
+                       _SEMAPHORE_NONE["color"]).astype(object)
+    return {
+        "rmssd_low": rm_low,
+        "rmssd_high": rm_high,
+        "rmssd_state": rm_state,
+        "sdnn_state": classify_hml_array(sd, *th["sdnn"]),
+        "hr_state": classify_hml_array(hr, *th["hr_mean"]),
+        "lfhf_state": classify_hml_array(lf, *th["lf_hf"]),
+        "baevsky_state": classify_hml_array(si, *th["baevsky"]),
+        "autonomic_score": auto,
+        "load_state": classify_hml_array(auto, *th["autonomic_score"]),
+        "fatigue_phys": fat_phys,
+        "fatigue_emo": fat_emo,
+        "fatigue_phys_state": classify_hml_array(fat_phys, *th["fatigue"]),
+        "fatigue_emo_state": classify_hml_array(fat_emo, *th["fatigue"]),
+        "semaphore_color": colors,
+    }
 
 
-def enrich_hba_dashboard(result: dict, payload: dict):
+def enrich_hba_dashboard(result: dict, payload: dict, ctx: AnalysisContext = None):
+    """
+    Si se pasa ctx (de analyze_rri / analyze_ppg), Baevsky usa el RR ya limpio
+    del contexto; sin ctx se recalcula desde el payload (compatibilidad).
+    """
     if result.get("error"):
         return result
 
@@ -676,26 +1868,24 @@ def enrich_hba_dashboard(result: dict, payload: dict):
 
     baevsky = np.nan
 
-    if str(result.get("sensor_type", "")).strip() == "polar_h10":
+    if ctx is not None:
+        if ctx.rr_nn is not None:
+            baevsky = baevsky_index(ctx.rr_nn)
+
+    elif str(result.get("sensor_type", "")).strip() == "polar_h10":
         rri_ms = payload.get("rri_ms", [])
         if isinstance(rri_ms, list) and len(rri_ms) >= 12:
             rr = _finite_array(np.array(rri_ms, dtype=float))
             rr_clean, _ap, _mask = clean_rri_ms(rr)
             baevsky = baevsky_index(rr_clean)
 
-    if str(result.get("sensor_type", "")).strip() == "camera_ppg":
+    elif str(result.get("sensor_type", "")).strip() == "camera_ppg":
         ppg = payload.get("ppg", [])
         sr = _as_float(payload.get("sampling_rate", result.get("sampling_rate", 30)))
         try:
             ppg_arr = _finite_array(np.array(ppg, dtype=float))
             if ppg_arr.size > 0 and np.isfinite(sr) and sr > 1:
-                p = ppg_arr - np.nanmean(ppg_arr)
-                p = p / (np.nanstd(p) + 1e-9)
-                try:
-                    p = nk.signal_filter(p, sampling_rate=sr, lowcut=0.7, highcut=5.0,
-                                         method="butterworth", order=3)
-                except Exception:
-                    pass
+                _p, p = ppg_front_end(ppg_arr, sr)
                 peaks_idx = _ppg_peaks_robust(p, sr)
                 if peaks_idx is not None and len(peaks_idx) >= 12:
                     rr_ms = np.diff(peaks_idx) / sr * 1000.0
@@ -707,24 +1897,34 @@ def enrich_hba_dashboard(result: dict, payload: dict):
     rm_low, rm_high = rmssd_reference_by_age_sex(age, sex)
     rm_state = classify_hml(rmssd, rm_low, rm_high)
 
+    th = DASHBOARD_THRESHOLDS
     auto_score = autonomic_score_0_100(rmssd, lfhf, baevsky)
-    load_state = classify_hml(auto_score, 35.0, 65.0)
+    load_state = classify_hml(auto_score, *th["autonomic_score"])
 
-    baev_state = classify_hml(baevsky, 150.0, 300.0)
+    baev_state = classify_hml(baevsky, *th["baevsky"])
 
     fat_phys, fat_emo = fatigue_scores_0_100(rmssd, sdnn, hr_mean)
-    fat_phys_state = classify_hml(fat_phys, 35.0, 65.0)
-    fat_emo_state = classify_hml(fat_emo, 35.0, 65.0)
+    fat_phys_state = classify_hml(fat_phys, *th["fatigue"])
+    fat_emo_state = classify_hml(fat_emo, *th["fatigue"])
 
     sem = semaphore_plan(rm_state)
 
+    if "_baseline" in payload:
+        baseline = payload["_baseline"]  # leída por el proceso padre (_attach_baseline)
+    else:
+        baseline = _lookup_baseline(payload)
+    if baseline is not None:
+        ref = baseline["windows"][f"{TREND_BASELINE_DAYS}d"]
+        baseline["z_score"] = baseline_deviation(lnrmssd, baseline)
+        baseline["state"] = classify_hml(baseline["z_score"], -1.0, 1.0)
+
     biomarkers = [
         {"name": "HRV (RMSSD)", "value": rmssd, "unit": "ms", "state": rm_state,
          "detail": f"Ref edad/sexo: bajo<{rm_low:.0f} / alto>{rm_high:.0f}"},
         {"name": "lnRMSSD", "value": lnrmssd, "unit": "", "state": "informativo", "detail": ""},
-        {"name": "SDNN", "value": sdnn, "unit": "ms", "state": classify_hml(sdnn, 30.0, 60.0), "detail": ""},
-        {"name": "FC media", "value": hr_mean, "unit": "bpm", "state": classify_hml(hr_mean, 60.0, 85.0), "detail": ""},
-        {"name": "LF/HF", "value": lfhf, "unit": "", "state": classify_hml(lfhf, 1.5, 3.0), "detail": result.get("freq_warning") or ""},
+        {"name": "SDNN", "value": sdnn, "unit": "ms", "state": classify_hml(sdnn, *th["sdnn"]), "detail": ""},
+        {"name": "FC media", "value": hr_mean, "unit": "bpm", "state": classify_hml(hr_mean, *th["hr_mean"]), "detail": ""},
+        {"name": "LF/HF", "value": lfhf, "unit": "", "state": classify_hml(lfhf, *th["lf_hf"]), "detail": result.get("freq_warning") or ""},
         {"name": "Índice de estrés Baevsky", "value": baevsky, "unit": "", "state": baev_state, "detail": ""},
         {"name": "Score autonómico", "value": auto_score, "unit": "/100", "state": load_state, "detail": "Más alto = más carga autonómica"},
         {"name": "Carga autonómica", "value": auto_score, "unit": "/100", "state": load_state, "detail": ""},
@@ -732,21 +1932,34 @@ def enrich_hba_dashboard(result: dict, payload: dict):
         {"name": "Fatiga física", "value": fat_phys, "unit": "/100", "state": fat_phys_state, "detail": ""},
         {"name": "Fatiga emocional", "value": fat_emo, "unit": "/100", "state": fat_emo_state, "detail": ""},
     ]
+    if baseline is not None:
+        biomarkers.append(
+            {"name": f"lnRMSSD vs línea de base ({TREND_BASELINE_DAYS} d)", "value": baseline["z_score"], "unit": "z",
+             "state": baseline["state"],
+             "detail": f"Base {ref['mean']:.2f} ± {ref['sd']:.2f} (n={ref['n']})" if np.isfinite(ref["sd"])
+             else f"Base insuficiente (n={ref['n']}, mínimo {TREND_MIN_N})"}
+        )
 
-    result["hba_dashboard"] = {
+    dash = {
         "biomarkers": biomarkers,
-        "interpretation": biomarker_meanings(),
         "norms": {"age": age, "sex": sex, "rmssd_low": rm_low, "rmssd_high": rm_high, "rmssd_state": rm_state},
-        "semaphore": sem,
-        "differentiator": {
-            "what_distinguishes": "Semáforo HBA: traduce tu HRV (RMSSD por edad/sexo) en un plan porcentual de intervención (SNA / miofascial / columna / biomecánico / relax)."
-        },
+        "baseline": baseline,
     }
+    if payload.get("static_etag") == DASHBOARD_STATIC_ETAG:
+        # el cliente ya tiene los textos fijos (GET /api/dashboard/static): solo el color
+        dash["semaphore"] = {"color": sem["color"]}
+        dash["static_etag"] = DASHBOARD_STATIC_ETAG
+    else:
+        dash["interpretation"] = biomarker_meanings()
+        dash["semaphore"] = sem
+        dash["differentiator"] = DASHBOARD_DIFFERENTIATOR
+    result["baevsky_si"] = baevsky
+    result["hba_dashboard"] = dash
     return result
 
 
 # ============================
-# Persistencia CSV
+# Persistencia (SQLite WAL, esquema = CSV_COLUMNS)
 # ============================
 
 CSV_COLUMNS = [
@@ -774,78 +1987,2011 @@ CSV_COLUMNS = [
     "resp_rate_rpm",
     "freq_warning",
     "notes",
+    "sex",
+    "baevsky_si",
 ]
 
 
-def append_to_dataset(row: dict):
-    df_row = pd.DataFrame([{c: row.get(c, "") for c in CSV_COLUMNS}])
-
-    if os.path.exists(DATASET_FILE):
-        df = pd.read_csv(DATASET_FILE)
-        for c in CSV_COLUMNS:
-            if c not in df.columns:
-                df[c] = ""
-        df = df[CSV_COLUMNS]
-        df = pd.concat([df, df_row], ignore_index=True)
-    else:
-        df = df_row
+_CSV_TEXT_COLUMNS = {"timestamp_utc", "student_id", "comorbidities", "sensor_type", "freq_warning", "notes", "sex"}
 
-    df.to_csv(DATASET_FILE, index=False)
+# scores del dashboard por medición (se recalculan en bloque al cambiar normas/umbrales)
+SCORE_COLUMNS = [
+    "rmssd_low", "rmssd_high", "rmssd_state", "sdnn_state", "hr_state", "lfhf_state", "baevsky_state",
+    "autonomic_score", "load_state", "fatigue_phys", "fatigue_emo", "fatigue_phys_state",
+    "fatigue_emo_state", "semaphore_color",
+]
+_SCORE_NUMERIC = {"rmssd_low", "rmssd_high", "autonomic_score", "fatigue_phys", "fatigue_emo"}
 
+_db_ready = set()
 
-# ============================
-# Flask
-# ============================
+_INSERT_SQL = (
+    f"INSERT INTO measurements ({', '.join(CSV_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in CSV_COLUMNS)})"
+)
 
-@app.route("/")
-def index():
-    return render_template("index.html")
 
+def _sqlite_connect(path, init):
+    """
+    Conexión SQLite compartida entre workers (WAL: lectores no bloquean al
+    escritor, el lock entre procesos lo maneja SQLite). init() una vez por proceso.
+    """
+    con = sqlite3.connect(path, timeout=30.0, isolation_level=None)
+    con.execute("PRAGMA busy_timeout = 30000")
+    if path not in _db_ready:
+        init(con)
+        _db_ready.add(path)
+    return con
 
-@app.route("/api/compute", methods=["POST"])
-def api_compute():
-    payload = request.get_json(force=True) or {}
 
-    sensor_type = str(payload.get("sensor_type", "")).strip()
-    duration_minutes = payload.get("duration_minutes", None)
+def _db_connect(path=None):
+    return _sqlite_connect(path or DATASET_DB, _db_init)
 
-    if sensor_type == "polar_h10":
-        rri_ms = payload.get("rri_ms", [])
-        result = compute_hrv_from_rri(np.array(rri_ms, dtype=float), duration_minutes=duration_minutes)
-        result["sensor_type"] = "polar_h10"
-        result["duration_minutes"] = duration_minutes
-        result = enrich_hba_dashboard(result, payload)
-        return jsonify(_sanitize_for_json(result))
 
-    if sensor_type == "camera_ppg":
-        ppg = payload.get("ppg", [])
-        sampling_rate = payload.get("sampling_rate", 30)
-        result = compute_hrv_from_ppg(np.array(ppg, dtype=float), float(sampling_rate), duration_minutes=duration_minutes)
-        result["sensor_type"] = "camera_ppg"
-        result["duration_minutes"] = duration_minutes
-        result = enrich_hba_dashboard(result, payload)
-        return jsonify(_sanitize_for_json(result))
+def _db_init(con):
+    cols = ", ".join(
+        f"{c} {'TEXT' if c in _CSV_TEXT_COLUMNS else 'REAL'}" for c in CSV_COLUMNS
+    )
+    con.execute("PRAGMA journal_mode = WAL")
+    con.execute("PRAGMA synchronous = NORMAL")
+    con.execute(f"CREATE TABLE IF NOT EXISTS measurements (id INTEGER PRIMARY KEY AUTOINCREMENT, {cols})")
+    have = {r[1] for r in con.execute("PRAGMA table_info(measurements)")}
+    for c in CSV_COLUMNS:
+        if c not in have:  # columnas agregadas después (datasets previos)
+            con.execute(f"ALTER TABLE measurements ADD COLUMN {c} {'TEXT' if c in _CSV_TEXT_COLUMNS else 'REAL'}")
+    # índice del archivo de señales crudas (ARCHIVE_DIR) y re-análisis por versión de algoritmo
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS signal_archive (measurement_id INTEGER PRIMARY KEY, sensor_type TEXT, "
+        "sampling_rate REAL, duration_minutes REAL, n_samples INTEGER, nbytes INTEGER, created REAL)"
+    )
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS signal_chunks (measurement_id INTEGER, seq INTEGER, offset INTEGER, n INTEGER, "
+        "encoding TEXT, scale REAL, x0 REAL, nbytes INTEGER, PRIMARY KEY (measurement_id, seq)) WITHOUT ROWID"
+    )
+    if "stream" not in {r[1] for r in con.execute("PRAGMA table_info(signal_chunks)")}:
+        con.execute("ALTER TABLE signal_chunks ADD COLUMN stream INTEGER DEFAULT 0")  # 0 señal, 1 timestamps
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS reanalysis (measurement_id INTEGER, algorithm_version TEXT, result TEXT, "
+        "created REAL, PRIMARY KEY (measurement_id, algorithm_version)) WITHOUT ROWID"
+    )
+    score_cols = ", ".join(f"{c} {'REAL' if c in _SCORE_NUMERIC else 'TEXT'}" for c in SCORE_COLUMNS)
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS dashboard_scores (measurement_id INTEGER PRIMARY KEY, "
+        f"norms_version TEXT, {score_cols}, scored REAL)"
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_measurements_student ON measurements (student_id, timestamp_utc)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_measurements_ts ON measurements (timestamp_utc)")
+    con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, sensor_type TEXT, sampling_rate REAL, "
+        "meta TEXT, state TEXT, n_chunks INTEGER, created REAL, updated REAL, closed INTEGER DEFAULT 0)"
+    )
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS session_chunks (session_id TEXT, seq INTEGER, data BLOB, "
+        "PRIMARY KEY (session_id, seq))"
+    )
+    # agregados diarios de lnRMSSD por estudiante (tendencia / línea de base)
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS student_daily (student_id TEXT, day TEXT, n INTEGER, s REAL, ss REAL, "
+        "PRIMARY KEY (student_id, day)) WITHOUT ROWID"
+    )
+    _migrate_csv_once(con)
+    _backfill_student_daily_once(con)
 
-    return jsonify(_sanitize_for_json({"error": "sensor_type inválido. Use 'camera_ppg' o 'polar_h10'."})), 400
 
+def _dataset_values(row: dict):
+    vals = []
+    for c in CSV_COLUMNS:
+        v = row.get(c, "")
+        if c in _CSV_TEXT_COLUMNS:
+            vals.append("" if v is None else str(v))
+        else:
+            f = _as_float(v)
+            vals.append(f if np.isfinite(f) else None)
+    return vals
 
-@app.route("/api/save", methods=["POST"])
-def api_save():
-    payload = request.get_json(force=True) or {}
 
-    student_id = str(payload.get("student_id", "")).strip()
-    age = payload.get("age", "")
-    comorbidities = str(payload.get("comorbidities", "")).strip()
-    notes = str(payload.get("notes", "")).strip()
+def _migrate_csv_once(con):
+    """Importa dataset_hba.csv (formato anterior) una sola vez."""
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        done = con.execute("SELECT value FROM meta WHERE key = 'csv_migrated'").fetchone()
+        if done is None:
+            n = 0
+            if os.path.exists(DATASET_FILE):
+                with open(DATASET_FILE, newline="", encoding="utf-8") as fh:
+                    rows = (_dataset_values(r) for r in csv.DictReader(fh))
+                    cur = con.executemany(_INSERT_SQL, rows)
+                    n = cur.rowcount
+            con.execute("INSERT INTO meta (key, value) VALUES ('csv_migrated', ?)",
+                        (f"{datetime.utcnow().isoformat()}Z rows={n}",))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
 
-    metrics = payload.get("metrics", {}) or {}
 
-    row = {
-        "timestamp_utc": datetime.utcnow().isoformat() + "Z",
-        "student_id": student_id,
-        "age": age,
-        "comorbidities": comorbidities,
-        "sensor_type": metrics.get("sensor_type", ""),
+def append_to_dataset(row: dict):
+    """
+    Append O(1) (no reescribe el dataset) + agregado diario del estudiante en la
+    misma transacción. Devuelve el id de la fila.
+    """
+    vals = _dataset_values(row)
+    con = _db_connect()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        cur = con.execute(_INSERT_SQL, vals)
+        row_id = int(cur.lastrowid)
+        student_id = vals[CSV_COLUMNS.index("student_id")]
+        lnrmssd = vals[CSV_COLUMNS.index("lnrmssd")]
+        day = vals[CSV_COLUMNS.index("timestamp_utc")][:10]
+        if student_id and lnrmssd is not None and len(day) == 10:
+            con.execute(_UPSERT_DAILY_SQL, (student_id, day, lnrmssd, lnrmssd * lnrmssd))
+        scores = score_dashboard_columns({c: [vals[CSV_COLUMNS.index(c)]] for c in _SCORE_INPUTS}, n=1)
+        con.executemany(_UPSERT_SCORES_SQL, _score_rows([row_id], scores, time.time()))
+        con.execute("COMMIT")
+        return row_id
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+
+
+_SCORE_INPUTS = ("rmssd", "sdnn", "lf_hf", "hr_mean", "baevsky_si", "age", "sex")
+_UPSERT_SCORES_SQL = (
+    f"INSERT OR REPLACE INTO dashboard_scores (measurement_id, norms_version, {', '.join(SCORE_COLUMNS)}, scored) "
+    f"VALUES ({', '.join('?' for _ in range(len(SCORE_COLUMNS) + 3))})"
+)
+
+
+def _score_rows(ids, scores, now):
+    cols = []
+    for c in SCORE_COLUMNS:
+        a = scores[c]
+        cols.append(np.where(np.isfinite(a), a, None).tolist() if c in _SCORE_NUMERIC else a.tolist())
+    return ((i, DASHBOARD_NORMS_VERSION, *vals, now) for i, *vals in zip(ids, *cols))
+
+
+def rescore_dataset(student_id=None, chunk=RESCORE_CHUNK_ROWS):
+    """
+    Recalcula los scores del dashboard de todo el dataset (o de un estudiante) con
+    las normas actuales: lectura por chunks (paginada por id, fuera del lock de
+    escritura) + score_dashboard_columns + upsert en bloque, una transacción corta
+    por chunk (/api/save no espera el recorrido entero). Devuelve resumen (filas,
+    colores, versión).
+    """
+    t0 = time.perf_counter()
+    sql = f"SELECT id, {', '.join(_SCORE_INPUTS)} FROM measurements WHERE id > ?"
+    if student_id:
+        sql += " AND student_id = ?"
+    sql += " ORDER BY id LIMIT ?"
+    n, colors, now, last_id = 0, {}, time.time(), 0
+    con = _db_connect()
+    try:
+        while True:
+            rows = con.execute(sql, (last_id, student_id, chunk) if student_id else (last_id, chunk)).fetchall()
+            if not rows:
+                break
+            cols = list(zip(*rows))
+            last_id = cols[0][-1]
+            data = {c: np.array(cols[i + 1], dtype=float) for i, c in enumerate(_SCORE_INPUTS) if c != "sex"}
+            data["sex"] = cols[_SCORE_INPUTS.index("sex") + 1]
+            scores = score_dashboard_columns(data, n=len(rows))
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                con.executemany(_UPSERT_SCORES_SQL, _score_rows(cols[0], scores, now))
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+            for color, k in zip(*np.unique(scores["semaphore_color"].astype(str), return_counts=True)):
+                colors[str(color)] = colors.get(str(color), 0) + int(k)
+            n += len(rows)
+    finally:
+        con.close()
+    return {"ok": True, "rows": n, "norms_version": DASHBOARD_NORMS_VERSION, "semaphore": colors,
+            "seconds": round(time.perf_counter() - t0, 3)}
+
+
+def iter_dataset_csv(student_id=None):
+    """Exporta el dataset como CSV (CSV_COLUMNS) por chunks, sin cargarlo entero."""
+    con = _db_connect()
+    try:
+        sql = f"SELECT {', '.join(CSV_COLUMNS)} FROM measurements"
+        args = ()
+        if student_id:
+            sql += " WHERE student_id = ?"
+            args = (student_id,)
+        sql += " ORDER BY id"
+
+        buf = io.StringIO()
+        w = csv.writer(buf, lineterminator="\n")
+        w.writerow(CSV_COLUMNS)
+        cur = con.execute(sql, args)
+        while True:
+            rows = cur.fetchmany(1000)
+            if not rows:
+                break
+            w.writerows(("" if v is None else v for v in r) for r in rows)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate(0)
+        if buf.tell():
+            yield buf.getvalue()
+    finally:
+        con.close()
+
+
+# ============================
+# Tendencia por estudiante (línea de base lnRMSSD rolling 7/30 días)
+# ============================
+
+TREND_WINDOWS_DAYS = (7, 30)
+TREND_BASELINE_DAYS = 30     # ventana contra la que se calcula el z-score
+TREND_MIN_N = 3              # mínimo de mediciones para dar SD / z
+
+_UPSERT_DAILY_SQL = (
+    "INSERT INTO student_daily (student_id, day, n, s, ss) VALUES (?, ?, 1, ?, ?) "
+    "ON CONFLICT (student_id, day) DO UPDATE SET n = n + 1, s = s + excluded.s, ss = ss + excluded.ss"
+)
+
+
+def _backfill_student_daily_once(con):
+    """Arma student_daily desde measurements (filas previas / migradas) una sola vez."""
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        done = con.execute("SELECT value FROM meta WHERE key = 'student_daily_backfilled'").fetchone()
+        if done is None:
+            con.execute("DELETE FROM student_daily")
+            cur = con.execute(
+                "INSERT INTO student_daily (student_id, day, n, s, ss) "
+                "SELECT student_id, substr(timestamp_utc, 1, 10), COUNT(*), SUM(lnrmssd), SUM(lnrmssd * lnrmssd) "
+                "FROM measurements WHERE student_id <> '' AND lnrmssd IS NOT NULL "
+                "GROUP BY student_id, substr(timestamp_utc, 1, 10)"
+            )
+            con.execute("INSERT INTO meta (key, value) VALUES ('student_daily_backfilled', ?)",
+                        (f"{datetime.utcnow().isoformat()}Z days={cur.rowcount}",))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+
+def _window_stats(n, s, ss):
+    mean = s / n if n else np.nan
+    sd = float(np.sqrt(max(0.0, (ss - s * s / n) / (n - 1)))) if n >= TREND_MIN_N else np.nan
+    return {"n": int(n), "mean": mean, "sd": sd}
+
+
+def student_baseline(student_id: str, as_of=None):
+    """
+    Línea de base del estudiante al día as_of (YYYY-MM-DD, default hoy UTC):
+    media ± SD de lnRMSSD en las ventanas TREND_WINDOWS_DAYS (inclusive as_of).
+    Lee como máximo max(TREND_WINDOWS_DAYS) filas de student_daily (PK), sin
+    importar cuántas mediciones tenga el dataset.
+    """
+    end = datetime.strptime(as_of, "%Y-%m-%d").date() if as_of else datetime.utcnow().date()
+    first = end - timedelta(days=max(TREND_WINDOWS_DAYS) - 1)
+    con = _db_connect()
+    try:
+        days = con.execute(
+            "SELECT day, n, s, ss FROM student_daily WHERE student_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+            (student_id, first.isoformat(), end.isoformat()),
+        ).fetchall()
+        last = con.execute(
+            "SELECT timestamp_utc, lnrmssd FROM measurements WHERE student_id = ? AND lnrmssd IS NOT NULL "
+            "AND timestamp_utc < ? ORDER BY timestamp_utc DESC LIMIT 1",
+            (student_id, (end + timedelta(days=1)).isoformat()),
+        ).fetchone()
+    finally:
+        con.close()
+
+    windows = {}
+    for w in TREND_WINDOWS_DAYS:
+        since = (end - timedelta(days=w - 1)).isoformat()
+        n = s_ = ss = 0.0
+        for day, dn, ds, dss in days:
+            if day >= since:
+                n, s_, ss = n + dn, s_ + ds, ss + dss
+        windows[f"{w}d"] = _window_stats(n, s_, ss)
+
+    return {
+        "student_id": student_id,
+        "as_of": end.isoformat(),
+        "windows": windows,
+        "daily": [{"day": day, "n": int(dn), "lnrmssd_mean": ds / dn} for day, dn, ds, _dss in days],
+        "latest": {"timestamp_utc": last[0], "lnrmssd": last[1]} if last else None,
+    }
+
+
+def _lookup_baseline(payload: dict):
+    student_id = str(payload.get("student_id", "") or "").strip()
+    if not student_id:
+        return None
+    try:
+        return student_baseline(student_id)
+    except (sqlite3.Error, ValueError):
+        return None
+
+
+def _attach_baseline(payload: dict):
+    """
+    Copia del payload con "_baseline" ya resuelta en este proceso, para que el
+    hijo de análisis aislado no abra la base del dataset (ni repita su DDL).
+    """
+    payload = dict(payload)
+    payload["_baseline"] = _lookup_baseline(payload)
+    return payload
+
+
+def baseline_deviation(lnrmssd, baseline: dict):
+    """z-score de lnRMSSD contra la ventana TREND_BASELINE_DAYS (NaN si no hay base suficiente)."""
+    ref = baseline["windows"][f"{TREND_BASELINE_DAYS}d"]
+    v = _as_float(lnrmssd)
+    if not np.isfinite(v) or not np.isfinite(ref["sd"]) or ref["sd"] <= 0:
+        return np.nan
+    return float((v - ref["mean"]) / ref["sd"])
+
+
+def student_trend(student_id: str, as_of=None):
+    out = student_baseline(student_id, as_of)
+    latest = out["latest"]
+    out["latest_z"] = baseline_deviation(latest["lnrmssd"], out) if latest else np.nan
+    w7, ref = out["windows"]["7d"], out["windows"][f"{TREND_BASELINE_DAYS}d"]
+    # tendencia semanal: media 7 d expresada en SD de la base (estilo Plews)
+    out["trend_7d_z"] = (
+        float((w7["mean"] - ref["mean"]) / ref["sd"])
+        if w7["n"] and np.isfinite(ref["sd"]) and ref["sd"] > 0 else np.nan
+    )
+    return out
+
+
+# ============================
+# Archivo de señales crudas (append-only + índice por fila, lectura con memmap)
+# ============================
+
+ARCHIVE_DIR = os.environ.get("HBA_ARCHIVE_DIR", "signal_archive")
+ARCHIVE_FILE = "signals.bin"
+ARCHIVE_CHUNK = 65536                 # muestras por chunk (cada uno con su escala / origen)
+ARCHIVE_RR_STEP_MS = 0.125            # cuantización RR (Polar resuelve ~1 ms: 1/1024 s)
+ARCHIVE_DELTA_MAX = 32000             # |delta| máximo por muestra (int16 con margen)
+ARCHIVE_LOSSLESS = os.environ.get("HBA_ARCHIVE_LOSSLESS", "0") == "1"  # solo float32 (sin cuantizar)
+ARCHIVE_TS_STREAM = 1                 # timestamps_ms por muestra (chunks con seq a continuación de la señal)
+REANALYSIS_JOB = "archive_reanalysis"  # sensor_type de los jobs de re-análisis
+REANALYSIS_COMMIT_ROWS = 50
+
+
+def _archive_path():
+    return os.path.join(ARCHIVE_DIR, ARCHIVE_FILE)
+
+
+def _encode_chunk(x: np.ndarray, step=None):
+    """
+    Chunk -> (encoding, scale, x0, bytes):
+    - "d16": x ~= x0 + scale * cumsum(d), d int16 (cuantiza valores, no deltas:
+      error <= scale / 2 por muestra, sin deriva). scale fijo (RR) o
+      max|dx| / ARCHIVE_DELTA_MAX (señales muestreadas)
+    - "f4": float32 tal cual si hay no finitos, saltos que no entran en int16 o
+      HBA_ARCHIVE_LOSSLESS=1 (en PPG la cuantización puede mover algún pico una
+      muestra: re-analizar la misma versión no reproduce exacto el RMSSD guardado)
+    """
+    x = np.asarray(x, dtype=float)
+    if not ARCHIVE_LOSSLESS and x.size and np.isfinite(x).all():
+        x0 = float(x[0])
+        scale = step or float(np.abs(np.diff(x)).max(initial=0.0)) / ARCHIVE_DELTA_MAX or 1.0
+        d = np.diff(np.rint((x - x0) / scale).astype(np.int64), prepend=0)
+        if np.abs(d).max() <= np.iinfo(np.int16).max:
+            return "d16", scale, x0, d.astype("<i2").tobytes()
+    return "f4", 1.0, 0.0, x.astype("<f4").tobytes()
+
+
+def _decode_chunk(raw: np.ndarray, encoding: str, scale: float, x0: float):
+    # raw: vista uint8 del memmap (solo se leen las páginas de este chunk)
+    if encoding == "d16":
+        return x0 + scale * np.cumsum(raw.view("<i2"), dtype=np.int64)
+    return raw.view("<f4").astype(float)
+
+
+def archive_signal(measurement_id: int, sensor_type: str, x: np.ndarray, sampling_rate=None, duration_minutes=None,
+                   timestamps_ms=None):
+    """
+    Agrega la señal cruda de una medición al archivo (append bajo flock, entre
+    workers) y su índice (offset por chunk) a dataset_hba.sqlite. Con
+    timestamps_ms (señales muestreadas) se archivan como segundo stream para que
+    el re-análisis use la misma grilla que /api/compute. Devuelve bytes escritos.
+    """
+    spec = SENSORS[sensor_type]
+    x = np.asarray(x, dtype=float).reshape(-1)
+    if x.size == 0:
+        raise ValueError("señal vacía.")
+    step = ARCHIVE_RR_STEP_MS if spec["pipeline"] == "rri" else None
+    chunks = [_encode_chunk(x[i:i + ARCHIVE_CHUNK], step) for i in range(0, x.size, ARCHIVE_CHUNK)]
+    sizes = [min(ARCHIVE_CHUNK, x.size - i) for i in range(0, x.size, ARCHIVE_CHUNK)]
+    streams = [0] * len(chunks)
+    if timestamps_ms is not None and spec["sampling_rate"]:
+        t = np.asarray(timestamps_ms, dtype=float).reshape(-1)
+        if t.size != x.size:
+            raise ValueError("timestamps_ms debe tener un valor por muestra.")
+        chunks += [_encode_chunk(t[i:i + ARCHIVE_CHUNK]) for i in range(0, t.size, ARCHIVE_CHUNK)]
+        sizes += sizes
+        streams += [ARCHIVE_TS_STREAM] * (len(chunks) - len(streams))
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with open(_archive_path(), "ab") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(b"".join(c[3] for c in chunks))
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+    rows = []
+    for seq, ((enc, scale, x0, raw), n, stream) in enumerate(zip(chunks, sizes, streams)):
+        rows.append((measurement_id, seq, stream, offset, n, enc, scale, x0, len(raw)))
+        offset += len(raw)
+    nbytes = sum(r[-1] for r in rows)
+    sr = _as_float(sampling_rate)
+    dm = _as_float(duration_minutes)
+    con = _db_connect()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        con.execute(
+            "INSERT OR REPLACE INTO signal_archive (measurement_id, sensor_type, sampling_rate, duration_minutes, "
+            "n_samples, nbytes, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (measurement_id, sensor_type, sr if np.isfinite(sr) else None, dm if np.isfinite(dm) else None,
+             int(x.size), nbytes, time.time()),
+        )
+        con.execute("DELETE FROM signal_chunks WHERE measurement_id = ?", (measurement_id,))
+        con.executemany(
+            "INSERT INTO signal_chunks (measurement_id, seq, stream, offset, n, encoding, scale, x0, nbytes) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows,
+        )
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+    return nbytes
+
+
+def _archive_memmap():
+    path = _archive_path()
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+def _archive_read(con, mm, measurement_id: int, stream: int = 0):
+    chunks = con.execute(
+        "SELECT offset, nbytes, encoding, scale, x0 FROM signal_chunks WHERE measurement_id = ? AND stream = ? "
+        "ORDER BY seq", (measurement_id, stream),
+    ).fetchall()
+    if mm is None or not chunks or chunks[-1][0] + chunks[-1][1] > mm.size:
+        return None
+    parts = [_decode_chunk(mm[off:off + nb], enc, scale, x0) for off, nb, enc, scale, x0 in chunks]
+    return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+
+def load_signal(measurement_id: int):
+    """(meta, señal float64) de una medición archivada, o None. meta["timestamps_ms"]: ndarray o None."""
+    con = _db_connect()
+    try:
+        row = con.execute(
+            "SELECT sensor_type, sampling_rate, duration_minutes, n_samples FROM signal_archive "
+            "WHERE measurement_id = ?", (measurement_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        mm = _archive_memmap()
+        x = _archive_read(con, mm, measurement_id)
+        t = _archive_read(con, mm, measurement_id, ARCHIVE_TS_STREAM) if x is not None else None
+    finally:
+        con.close()
+    if x is None:
+        return None
+    meta = {"sensor_type": row[0], "sampling_rate": row[1], "duration_minutes": row[2], "n_samples": row[3],
+            "timestamps_ms": t}
+    return meta, x
+
+
+def reanalysis_submit(payload: dict):
+    """
+    Encola un re-análisis del archivo (todo, un estudiante o ids puntuales) como
+    job de /api/jobs: corre en los mismos runners y se consulta / cancela igual.
+    """
+    meta = {}
+    student_id = str(payload.get("student_id", "") or "").strip()
+    if student_id:
+        meta["student_id"] = student_id
+    if payload.get("ids") is not None:
+        try:
+            meta["ids"] = [int(i) for i in payload["ids"]]
+        except (TypeError, ValueError):
+            return {"error": "ids: se espera una lista de enteros."}, 400
+    sql, args = _reanalysis_query(meta)
+    con = _db_connect()
+    try:
+        n = con.execute(f"SELECT COUNT(*) FROM ({sql})", args).fetchone()[0]
+    finally:
+        con.close()
+
+    jid = uuid.uuid4().hex
+    con = _jobs_connect()
+    try:
+        con.execute(
+            "INSERT INTO jobs (id, status, sensor_type, meta, signal, n_samples, created) "
+            "VALUES (?, 'queued', ?, ?, NULL, ?, ?)",
+            (jid, REANALYSIS_JOB, json.dumps(meta), int(n), time.time()),
+        )
+    finally:
+        con.close()
+    start_job_runners()
+    return {"job_id": jid, "status": "queued", "rows": int(n), "poll": f"/api/jobs/{jid}"}, 202
+
+
+def _reanalysis_query(meta: dict):
+    sql = ("SELECT a.measurement_id, a.sensor_type, a.sampling_rate, a.duration_minutes, m.rmssd "
+           "FROM signal_archive a LEFT JOIN measurements m ON m.id = a.measurement_id")
+    where, args = [], []
+    if meta.get("student_id"):
+        where.append("m.student_id = ?")
+        args.append(meta["student_id"])
+    if meta.get("ids") is not None:
+        where.append(f"a.measurement_id IN ({', '.join('?' for _ in meta['ids'])})" if meta["ids"] else "0")
+        args.extend(meta["ids"])
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY a.measurement_id", args
+
+
+def _reanalysis_row(row: dict):
+    """Una medición archivada: remuestreo (si hay timestamps) + PIPELINES sin caché. (result, status, None)."""
+    x, sr = row["x"], row["sampling_rate"]
+    try:
+        if row["timestamps_ms"] is not None:
+            # misma grilla uniforme que compute_payload (no el fps medio guardado)
+            x, sr, _capture = resample_uniform(x, row["timestamps_ms"])
+        result, _ctx = run_pipeline(row["kind"], x, sr, row["duration_minutes"])
+    except ValueError as e:
+        return {"error": str(e)}, 400, None
+    return result, 200, None
+
+
+def _reanalysis_isolated(row: dict, cancel_marker, heartbeat):
+    # como un job: slot de análisis del host, proceso hijo con memoria acotada y JOB_TIMEOUT_S por fila
+    slot = _wait_run_slot(cancel_marker, heartbeat)
+    if slot is None:
+        return {"error": "Análisis cancelado."}, 409, None
+    try:
+        return _run_isolated(row, cancel_marker, JOB_TIMEOUT_S, target=_reanalysis_row, heartbeat=heartbeat)
+    finally:
+        _release_slot(slot)
+
+
+def reanalyze_archive(meta: dict, cancel_marker=None, heartbeat=None):
+    """
+    Recorre el archivo fila a fila (memmap: una señal en memoria por vez), corre
+    el pipeline actual (PIPELINES, sin caché) y guarda el resultado en
+    reanalysis (measurement_id, ALGORITHM_VERSION). Con ANALYSIS_ISOLATED cada
+    fila corre en un proceso hijo (_run_isolated). heartbeat() renueva el lease
+    del job entre filas y mientras espera. Devuelve (resumen, http_status).
+    """
+    t0 = time.perf_counter()
+    sql, args = _reanalysis_query(meta)
+    read = _db_connect()
+    write = _db_connect()
+    done, errors, missing, changes = 0, 0, 0, []
+    pending = []
+
+    def flush():
+        write.execute("BEGIN IMMEDIATE")
+        write.executemany(
+            "INSERT OR REPLACE INTO reanalysis (measurement_id, algorithm_version, result, created) "
+            "VALUES (?, ?, ?, ?)", pending,
+        )
+        write.execute("COMMIT")
+        pending.clear()
+
+    try:
+        mm = _archive_memmap()
+        for mid, sensor_type, sr, dm, rmssd_saved in read.execute(sql, args):
+            if heartbeat is not None:
+                heartbeat()
+            x = _archive_read(read, mm, mid) if sensor_type in SENSORS else None
+            if x is None:
+                missing += 1
+                continue
+            spec = SENSORS[sensor_type]
+            row = {"kind": spec["pipeline"], "x": x, "sampling_rate": sr, "duration_minutes": dm,
+                   "timestamps_ms": _archive_read(read, mm, mid, ARCHIVE_TS_STREAM) if spec["sampling_rate"] else None}
+            if cancel_marker is not None and not os.path.exists(cancel_marker):
+                status = 409
+            elif ANALYSIS_ISOLATED:
+                result, status, _trace = _reanalysis_isolated(row, cancel_marker, heartbeat)
+            else:
+                result, status, _trace = _reanalysis_row(row)
+            if status == 409:
+                if pending:
+                    flush()
+                return {"error": "Análisis cancelado.", "rows": done}, 409
+            errors += bool(result.get("error"))
+            old, new = _as_float(rmssd_saved), _as_float(result.get("rmssd"))
+            if np.isfinite(old) and np.isfinite(new):
+                changes.append(new - old)
+            pending.append((mid, ALGORITHM_VERSION, json_dumps(result), time.time()))
+            done += 1
+            if len(pending) >= REANALYSIS_COMMIT_ROWS:
+                flush()
+        if pending:
+            flush()
+    finally:
+        read.close()
+        write.close()
+
+    ch = np.abs(np.asarray(changes, dtype=float))
+    return {
+        "ok": True,
+        "algorithm_version": ALGORITHM_VERSION,
+        "rows": done,
+        "errors": errors,
+        "missing": missing,
+        "rmssd_abs_change_ms": {"median": float(np.median(ch)), "max": float(ch.max()), "n": int(ch.size)}
+        if ch.size else None,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }, 200
+
+
+# ============================
+# Transporte binario (float32 LE) para señales
+# ============================
+
+_BINARY_DTYPES = {"float32": "<f4", "f4": "<f4", "float64": "<f8", "f8": "<f8"}
+_BINARY_META_HEADERS = {
+    "X-HBA-Sensor-Type": "sensor_type",
+    "X-HBA-Sampling-Rate": "sampling_rate",
+    "X-HBA-Duration-Minutes": "duration_minutes",
+    "X-HBA-Age": "age",
+    "X-HBA-Sex": "sex",
+    "X-HBA-Student-Id": "student_id",
+    "X-HBA-Static-ETag": "static_etag",
+}
+TIMESTAMPS_HEADER = "X-HBA-Timestamps"  # "ms": el cuerpo trae n muestras + n timestamps (ms)
+
+
+def _binary_dtype(name):
+    dt = _BINARY_DTYPES.get(str(name or "float32").strip().lower())
+    if dt is None:
+        raise ValueError(f"dtype no soportado. Use: {', '.join(_BINARY_DTYPES)}.")
+    return dt
+
+
+def _frombuffer(buf: bytes, dtype: str):
+    if len(buf) % np.dtype(dtype).itemsize:
+        raise ValueError("Largo del buffer binario no es múltiplo del tamaño de muestra.")
+    return np.frombuffer(buf, dtype=dtype)  # sin copia (solo lectura)
+
+
+def decode_b64_fields(payload: dict):
+    """
+    Sobre JSON: "<campo>_b64" (Float32Array en base64) -> payload[campo] como ndarray.
+    Ej.: {"sensor_type": "camera_ppg", "ppg_b64": "...", "dtype": "float32", "sampling_rate": 30}
+    Los timestamps por muestra viajan igual: "timestamps_ms_b64" -> payload["timestamps_ms"].
+    """
+    for key in [k for k in payload if k.endswith("_b64")]:
+        raw = payload.pop(key)
+        try:
+            buf = base64.b64decode(raw, validate=True)
+        except (binascii.Error, TypeError) as e:
+            raise ValueError(f"{key}: base64 inválido ({e}).")
+        payload[key[:-4]] = _frombuffer(buf, _binary_dtype(payload.get("dtype")))
+    return payload
+
+
+def payload_from_request(req):
+    """
+    Payload de /api/compute desde:
+    - application/octet-stream: cuerpo = muestras float32 LE, metadatos en headers X-HBA-*;
+      con "X-HBA-Timestamps: ms" el cuerpo sigue con un timestamp (ms) por muestra
+    - JSON (compatibilidad), con campos <campo>_b64 opcionales
+    Lanza ValueError si el formato es inválido.
+    """
+    if req.mimetype == "application/octet-stream":
+        payload = {}
+        for header, key in _BINARY_META_HEADERS.items():
+            v = req.headers.get(header)
+            if v is not None:
+                v = unquote(v)
+                payload[key] = _as_float(v) if key in ("sampling_rate", "duration_minutes") else v
+        field = SIGNAL_FIELDS.get(str(payload.get("sensor_type", "")).strip())
+        if field is None:
+            raise ValueError(f"X-HBA-Sensor-Type inválido. Use: {', '.join(SIGNAL_FIELDS)}.")
+        data = _frombuffer(req.get_data(cache=False), _binary_dtype(req.headers.get("X-HBA-Dtype")))
+        if req.headers.get(TIMESTAMPS_HEADER):
+            if data.size % 2:
+                raise ValueError("Cuerpo con timestamps: se esperan n muestras + n timestamps.")
+            data, payload["timestamps_ms"] = data[:data.size // 2], data[data.size // 2:]
+        payload[field] = data
+        return payload
+
+    payload = req.get_json(force=True) or {}
+    if not isinstance(payload, dict):
+        raise ValueError("Se espera un objeto JSON.")
+    return decode_b64_fields(payload)
+
+
+# ============================
+# Cache de resultados (content-addressed, compartido entre workers)
+# ============================
+
+# subir ALGORITHM_VERSION cuando cambie cualquier etapa de la señal
+ALGORITHM_VERSION = "2026.10.6"
+CACHE_DB = "cache_hba.sqlite"
+CACHE_ENABLED = os.environ.get("HBA_RESULT_CACHE", "1") == "1"
+CACHE_MAX_BYTES = int(os.environ.get("HBA_CACHE_MAX_BYTES", str(256 * 2**20)))
+CACHE_TTL_S = float(os.environ.get("HBA_CACHE_TTL_S", str(7 * 86400)))
+
+
+def _cache_init(con):
+    con.execute("PRAGMA journal_mode = WAL")
+    con.execute("PRAGMA synchronous = NORMAL")
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT, rr_nn BLOB, "
+        "size INTEGER, created REAL, last_access REAL)"
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_results_lru ON results (last_access)")
+    con.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+    con.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0), ('evictions', 0)")
+
+
+def _cache_connect():
+    return _sqlite_connect(CACHE_DB, _cache_init)
+
+
+def _cache_key(kind: str, x: np.ndarray, sampling_rate, duration_minutes):
+    h = hashlib.sha256()
+    head = [ALGORITHM_VERSION, HRV_ENGINE, kind, repr(_as_float(sampling_rate)), json.dumps(duration_minutes)]
+    h.update("|".join(head).encode("utf-8"))
+    h.update(np.ascontiguousarray(x, dtype="<f8").tobytes())
+    return h.hexdigest()
+
+
+def _cache_get(key: str):
+    con = _cache_connect()
+    try:
+        now = time.time()
+        con.execute("BEGIN IMMEDIATE")
+        row = con.execute("SELECT result, rr_nn, created FROM results WHERE key = ?", (key,)).fetchone()
+        if row is not None and now - row[2] > CACHE_TTL_S:
+            con.execute("DELETE FROM results WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            con.execute("UPDATE counters SET value = value + 1 WHERE name = 'misses'")
+        else:
+            con.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+            con.execute("UPDATE counters SET value = value + 1 WHERE name = 'hits'")
+        con.execute("COMMIT")
+    finally:
+        con.close()
+    if row is None:
+        return None
+    ctx = AnalysisContext()
+    if row[1] is not None:
+        ctx.rr_nn = np.frombuffer(row[1], dtype="<f8")
+    return json.loads(row[0]), ctx
+
+
+def _cache_put(key: str, result: dict, ctx: AnalysisContext):
+    blob = None if ctx.rr_nn is None else np.asarray(ctx.rr_nn, dtype="<f8").tobytes()
+    text = json.dumps(result)
+    size = len(text) + (len(blob) if blob else 0)
+    now = time.time()
+    con = _cache_connect()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        con.execute(
+            "INSERT OR REPLACE INTO results (key, result, rr_nn, size, created, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, text, blob, size, now, now),
+        )
+        con.execute("DELETE FROM results WHERE created < ?", (now - CACHE_TTL_S,))
+        total = con.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total > CACHE_MAX_BYTES:
+            # LRU: borra los menos usados hasta quedar en ~90% del presupuesto
+            evicted = 0
+            for old_key, old_size in con.execute("SELECT key, size FROM results ORDER BY last_access").fetchall():
+                if total <= 0.9 * CACHE_MAX_BYTES:
+                    break
+                con.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                total -= old_size
+                evicted += 1
+            con.execute("UPDATE counters SET value = value + ? WHERE name = 'evictions'", (evicted,))
+        con.execute("COMMIT")
+    finally:
+        con.close()
+
+
+def cache_stats():
+    con = _cache_connect()
+    try:
+        counters = dict(con.execute("SELECT name, value FROM counters").fetchall())
+        entries, size = con.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+    finally:
+        con.close()
+    lookups = counters.get("hits", 0) + counters.get("misses", 0)
+    return {
+        "enabled": CACHE_ENABLED,
+        "algorithm_version": ALGORITHM_VERSION,
+        "hits": counters.get("hits", 0),
+        "misses": counters.get("misses", 0),
+        "evictions": counters.get("evictions", 0),
+        "hit_ratio": counters.get("hits", 0) / lookups if lookups else None,
+        "entries": entries,
+        "bytes": size,
+        "max_bytes": CACHE_MAX_BYTES,
+        "ttl_s": CACHE_TTL_S,
+    }
+
+
+def run_pipeline(kind: str, x: np.ndarray, sampling_rate=None, duration_minutes=None):
+    """PIPELINES[kind] sin caché (analyze_rri / analyze_ppg / analyze_scg). Devuelve (result, ctx)."""
+    analyze, sampled = PIPELINES[kind]
+    if sampled:
+        return analyze(x, _as_float(sampling_rate), duration_minutes=duration_minutes)
+    return analyze(x, duration_minutes=duration_minutes)
+
+
+def analyze_cached(kind: str, x: np.ndarray, sampling_rate=None, duration_minutes=None):
+    """
+    Pipeline registrado (PIPELINES[kind]) con cache: la clave es el hash de la señal +
+    sampling_rate + duración + versión de algoritmo. Solo se guarda la parte de
+    señal (result + RR para Baevsky); el dashboard se recalcula siempre.
+    """
+    x = np.asarray(x, dtype=float)
+    key = _cache_key(kind, x, sampling_rate, duration_minutes) if CACHE_ENABLED else None
+    if key is not None:
+        try:
+            hit = _cache_get(key)
+        except sqlite3.Error:
+            hit = None
+        if hit is not None:
+            _trace_note("cache", "hit")
+            return hit
+        _trace_note("cache", "miss")
+
+    result, ctx = run_pipeline(kind, x, sampling_rate, duration_minutes)
+
+    if key is not None:
+        try:
+            _cache_put(key, result, ctx)
+        except sqlite3.Error:
+            pass
+    return dict(result), ctx
+
+
+# ============================
+# Cómputo por payload (sync + batch)
+# ============================
+
+BATCH_MAX_ITEMS = 1000
+BATCH_WORKERS = int(os.environ.get("HBA_BATCH_WORKERS", "0")) or (os.cpu_count() or 1)  # ítems en paralelo
+BATCH_SLOT_WAIT_S = float(os.environ.get("HBA_BATCH_SLOT_WAIT_S", "120"))  # espera por slot "run"; luego 503 del ítem
+
+_batch_executor = None
+_batch_lock = threading.Lock()
+
+
+def compute_payload(payload: dict):
+    """Pipeline completo de /api/compute para un payload. Devuelve (result, http_status)."""
+    sensor_type = str(payload.get("sensor_type", "")).strip()
+    duration_minutes = payload.get("duration_minutes", None)
+
+    spec = SENSORS.get(sensor_type)
+    if spec is None:
+        return {"error": f"sensor_type inválido. Use: {', '.join(SENSORS)}."}, 400
+
+    x = np.asarray(payload.get(spec["field"], []), dtype=float)
+    _trace_note("kind", spec["pipeline"])
+    _trace_note("n_input", int(x.size))
+    sampling_rate = payload.get("sampling_rate", spec["sampling_rate"]) if spec["sampling_rate"] else None
+    capture = None
+    if spec["sampling_rate"] and payload.get("timestamps_ms") is not None:
+        # un timestamp por cuadro: se analiza sobre la grilla uniforme, no con el fps medio
+        try:
+            with _Stage("resample"):
+                x, sampling_rate, capture = resample_uniform(x, payload.get("timestamps_ms"))
+        except ValueError as e:
+            return {"error": str(e)}, 400
+    result, ctx = analyze_cached(spec["pipeline"], x, sampling_rate, duration_minutes=duration_minutes)
+    result["sensor_type"] = sensor_type
+    result["duration_minutes"] = duration_minutes
+    if capture is not None:
+        result.update(capture)
+    if result.get("epochs") and payload.get("start_time"):
+        # la hora de inicio no entra en la caché: solo cambia la ventana "noche" del resumen
+        result["epochs_summary"] = summarize_epochs(result["epochs"], payload.get("start_time"))
+    with _Stage("dashboard"):
+        return enrich_hba_dashboard(result, payload, ctx=ctx), 200
+
+
+def compute_traced(payload: dict):
+    """
+    compute_payload con traza por etapa (_Stage) si hay métricas o debug de timings.
+    Devuelve (result, http_status, trace|None).
+    """
+    if not (METRICS_ENABLED or TIMINGS_DEBUG):
+        result, status = compute_payload(payload)
+        return result, status, None
+    trace = {"stages": {}}
+    token = _trace_var.set(trace)
+    try:
+        result, status = compute_payload(payload)
+    finally:
+        _trace_var.reset(token)
+    return result, status, trace
+
+
+def _compute_batch_item(index: int, payload: dict):
+    """
+    Un ítem del lote, desde un hilo del pool: el análisis corre en un hijo aislado
+    (_run_isolated: forkserver, ANALYSIS_TIMEOUT_S y ANALYSIS_MAX_MEM_MB como
+    /api/compute), así un ítem colgado o que revienta solo afecta a su respuesta.
+    Cada ítem toma un slot "run" del host como los jobs: el lote no supera ANALYSIS_WORKERS.
+    La traza vuelve aparte para que el worker web la sume a /metrics.
+    """
+    t0 = time.perf_counter()
+    out, trace = {"index": index}, None
+    if "id" in payload:
+        out["id"] = payload.get("id")
+    try:
+        if ANALYSIS_ISOLATED:
+            result, status, trace = _run_batch_isolated(payload)
+        else:
+            result, status, trace = compute_traced(payload)
+        out["status"] = status
+        out["result"] = result
+    except Exception as e:
+        out["status"] = 500
+        out["error"] = f"{type(e).__name__}: {e}"
+    return out, trace, time.perf_counter() - t0
+
+
+def _run_batch_isolated(payload: dict):
+    slot = None
+    deadline = time.monotonic() + BATCH_SLOT_WAIT_S
+    try:
+        while True:
+            slot = _try_slot("run", ANALYSIS_WORKERS)
+            if slot is not None:
+                break
+            if time.monotonic() >= deadline:
+                return {"error": "Servidor ocupado: no se liberó un worker de análisis a tiempo."}, 503, None
+            time.sleep(_ANALYSIS_POLL_S)
+        return _run_isolated(payload, None, ANALYSIS_TIMEOUT_S)
+    finally:
+        _release_slot(slot)
+
+
+def _batch_pool():
+    # hilos que solo esperan a sus hijos aislados; se crea perezosamente en cada worker (nunca antes del fork)
+    global _batch_executor
+    with _batch_lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="hba-batch")
+    return _batch_executor
+
+
+def _iter_ndjson(stream):
+    for raw in stream:
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield e
+
+
+# ============================
+# Análisis aislado (proceso por job: timeout, memoria, cancelación, cola acotada)
+# ============================
+
+ANALYSIS_ISOLATED = os.environ.get("HBA_ANALYSIS_ISOLATED", "1") == "1"
+ANALYSIS_WORKERS = int(os.environ.get("HBA_ANALYSIS_WORKERS", "0")) or (os.cpu_count() or 1)
+ANALYSIS_MAX_QUEUE = int(os.environ.get("HBA_ANALYSIS_MAX_QUEUE", "0")) or 4 * ANALYSIS_WORKERS
+ANALYSIS_QUEUE_WAIT_S = float(os.environ.get("HBA_ANALYSIS_QUEUE_WAIT_S", "5"))
+ANALYSIS_TIMEOUT_S = float(os.environ.get("HBA_ANALYSIS_TIMEOUT_S", "25"))  # < timeout de gunicorn (30 s)
+ANALYSIS_MAX_MEM_MB = float(os.environ.get("HBA_ANALYSIS_MAX_MEM_MB", "1024"))
+ANALYSIS_SLOTS_DIR = os.environ.get("HBA_ANALYSIS_SLOTS_DIR") or os.path.join(tempfile.gettempdir(), "hba_analysis")
+_ANALYSIS_POLL_S = 0.05
+
+_mp_context = None
+_mp_lock = threading.Lock()
+
+
+def _analysis_mp_context():
+    """
+    forkserver: los hijos salen de un proceso limpio (sin hilos ni locks de gunicorn)
+    que ya importó app + motor científico, así que cada job arranca en ms.
+    """
+    global _mp_context
+    with _mp_lock:
+        if _mp_context is None:
+            # Python 3.11 (runtime.txt) no aplica el sys.path del padre antes de la
+            # precarga: si el cwd no es el directorio de app.py, "import app" falla en
+            # silencio y cada hijo la re-importa (~0.2 s). El forkserver hereda el entorno.
+            here = os.path.dirname(os.path.abspath(__file__))
+            paths = [p for p in os.environ.get("PYTHONPATH", "").split(os.pathsep) if p]
+            if here not in paths:
+                os.environ["PYTHONPATH"] = os.pathsep.join([here] + paths)
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload([__name__] + [m._name for m in _engine_modules()])
+            _mp_context = ctx
+    return _mp_context
+
+
+def _try_slot(kind: str, n: int):
+    """
+    Toma un slot libre de ANALYSIS_SLOTS_DIR/<kind>_<i>.lock (flock, compartido entre
+    workers de gunicorn). Devuelve el fd (cerrarlo libera el slot) o None si no hay.
+    """
+    os.makedirs(ANALYSIS_SLOTS_DIR, exist_ok=True)
+    for i in range(n):
+        fd = os.open(os.path.join(ANALYSIS_SLOTS_DIR, f"{kind}_{i}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except OSError:
+            os.close(fd)
+    return None
+
+
+def _release_slot(fd):
+    if fd is not None:
+        os.close(fd)
+
+
+def _active_marker(request_id):
+    rid = str(request_id or "")
+    if not rid or len(rid) > 64 or not rid.replace("-", "").replace("_", "").isalnum():
+        return None
+    return os.path.join(ANALYSIS_SLOTS_DIR, f"active_{rid}")
+
+
+def cancel_analysis(request_id: str):
+    """Cancela un análisis en curso (cualquier worker): borra su marcador activo."""
+    marker = _active_marker(request_id)
+    if marker is None:
+        return False
+    try:
+        os.unlink(marker)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _limit_memory(max_mb):
+    # presupuesto = memoria virtual actual del hijo + max_mb (RLIMIT_AS)
+    if not max_mb or max_mb <= 0:
+        return
+    try:
+        import resource
+
+        with open("/proc/self/statm") as fh:
+            vsz = int(fh.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+        _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = vsz + int(max_mb * 2 ** 20)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    except (ImportError, OSError, ValueError):
+        pass
+
+
+def _analysis_child(conn, payload: dict, max_mb, db_ready, target):
+    # bases que el padre ya inicializó: el hijo no repite DDL/migraciones (BEGIN IMMEDIATE)
+    _db_ready.update(db_ready)
+    _limit_memory(max_mb)
+    try:
+        out = target(payload)
+    except MemoryError:
+        out = ({"error": f"El análisis excedió el presupuesto de memoria ({max_mb:.0f} MB)."}, 413, None)
+    except Exception as e:
+        out = ({"error": f"{type(e).__name__}: {e}"}, 500, None)
+    try:
+        conn.send(out)
+    finally:
+        conn.close()
+
+
+def _run_isolated(payload: dict, marker, timeout_s, target=None, heartbeat=None):
+    """
+    target(payload) -> (result, status, trace) en un proceso hijo (compute_traced
+    por defecto). heartbeat() se llama mientras espera (lease de jobs largos).
+    """
+    ctx = _analysis_mp_context()
+    if target is None:
+        target = compute_traced
+        payload = _attach_baseline(payload)
+        if CACHE_ENABLED and CACHE_DB not in _db_ready:
+            _cache_connect().close()  # DDL de la caché una vez por worker, no en cada hijo
+    recv, send = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_analysis_child,
+                       args=(send, payload, ANALYSIS_MAX_MEM_MB, frozenset(_db_ready), target), daemon=True)
+    proc.start()
+    send.close()
+
+    out = None
+    deadline = time.monotonic() + timeout_s
+    try:
+        while True:
+            if recv.poll(_ANALYSIS_POLL_S):
+                try:
+                    out = recv.recv()
+                    _engine_state["forkserver_ok"] = True
+                except EOFError:
+                    out = None  # el hijo murió sin responder (OOM killer, señal)
+                break
+            if not proc.is_alive() and not recv.poll(0):
+                break
+            if time.monotonic() >= deadline:
+                out = ({"error": f"El análisis excedió {timeout_s:g}s."}, 504, None)
+                break
+            if marker is not None and not os.path.exists(marker):
+                out = ({"error": "Análisis cancelado."}, 409, None)
+                break
+            if heartbeat is not None:
+                heartbeat()
+    finally:
+        if proc.is_alive():
+            proc.kill()
+        proc.join()
+        recv.close()
+
+    if out is None:
+        return {"error": f"El proceso de análisis terminó inesperadamente (código {proc.exitcode})."}, 500, None
+    return out
+
+
+def run_analysis(payload: dict, request_id=None, source="compute"):
+    """
+    compute_payload fuera del worker web, en un proceso hijo con timeout
+    (ANALYSIS_TIMEOUT_S) y presupuesto de memoria (ANALYSIS_MAX_MEM_MB).
+    - a lo sumo ANALYSIS_WORKERS análisis a la vez en todo el host
+    - a lo sumo ANALYSIS_MAX_QUEUE admitidos (corriendo + esperando): el resto recibe 503 al instante
+    - request_id (X-HBA-Request-Id) permite cancelarlo desde otro request
+    Devuelve (result, http_status).
+    """
+    t0 = time.perf_counter()
+    result, status, trace = _run_analysis(payload, request_id)
+    seconds = time.perf_counter() - t0
+    metrics_record(source, result, status, trace, seconds)
+    if TIMINGS_DEBUG:
+        result["timings"] = timings_block(trace, seconds)
+    return result, status
+
+
+def _run_analysis(payload: dict, request_id):
+    if not ANALYSIS_ISOLATED:
+        return compute_traced(payload)
+
+    ticket = _try_slot("queue", ANALYSIS_MAX_QUEUE)
+    if ticket is None:
+        return {"error": "Servidor ocupado: demasiados análisis en cola. Reintente en unos segundos."}, 503, None
+
+    marker = _active_marker(request_id)
+    slot = None
+    try:
+        if marker is not None:
+            open(marker, "w").close()
+        deadline = time.monotonic() + ANALYSIS_QUEUE_WAIT_S
+        while True:
+            slot = _try_slot("run", ANALYSIS_WORKERS)
+            if slot is not None:
+                break
+            if marker is not None and not os.path.exists(marker):
+                return {"error": "Análisis cancelado."}, 409, None
+            if time.monotonic() >= deadline:
+                return {"error": "Servidor ocupado: no se liberó un worker de análisis a tiempo."}, 503, None
+            time.sleep(_ANALYSIS_POLL_S)
+        result, status, trace = _run_isolated(payload, marker, ANALYSIS_TIMEOUT_S)
+        if status == 504:
+            result["error"] += " Para grabaciones largas use el modo asíncrono (/api/jobs)."
+        return result, status, trace
+    finally:
+        _release_slot(slot)
+        _release_slot(ticket)
+        if marker is not None:
+            try:
+                os.unlink(marker)
+            except FileNotFoundError:
+                pass
+
+
+# ============================
+# Jobs asíncronos (cola SQLite local, sin broker externo)
+# ============================
+
+JOBS_DB = "jobs_hba.sqlite"
+JOB_TIMEOUT_S = float(os.environ.get("HBA_JOB_TIMEOUT_S", "900"))
+JOB_TTL_S = float(os.environ.get("HBA_JOB_TTL_S", str(86400)))
+JOB_MAX_QUEUED = int(os.environ.get("HBA_JOB_MAX_QUEUED", "200"))
+JOB_MAX_ATTEMPTS = 2          # un job "running" huérfano (worker muerto) se reintenta una vez
+JOB_HEARTBEAT_S = 30.0        # lease: un job vivo renueva heartbeat; huérfano = sin heartbeat en JOB_TIMEOUT_S + 60
+JOB_RUNNERS = int(os.environ.get("HBA_JOB_RUNNERS", "1"))  # hilos por worker de gunicorn
+JOB_LONGPOLL_MAX_S = 25.0
+_JOB_IDLE_S = 0.5
+
+_job_threads = []
+_job_lock = threading.Lock()
+
+
+def _jobs_init(con):
+    con.execute("PRAGMA journal_mode = WAL")
+    con.execute("PRAGMA synchronous = NORMAL")
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, sensor_type TEXT, meta TEXT, "
+        "signal BLOB, n_samples INTEGER, result TEXT, http_status INTEGER, attempts INTEGER DEFAULT 0, "
+        "created REAL, started REAL, finished REAL)"
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, created)")
+    if "heartbeat" not in {r[1] for r in con.execute("PRAGMA table_info(jobs)")}:
+        con.execute("ALTER TABLE jobs ADD COLUMN heartbeat REAL")
+
+
+def _jobs_connect():
+    return _sqlite_connect(JOBS_DB, _jobs_init)
+
+
+def job_submit(payload: dict):
+    """
+    Encola un payload de /api/compute. La señal se guarda como float64 LE (BLOB),
+    seguida de los otros campos ndarray (timestamps_ms binarios / _b64; largos en
+    meta["_arrays"]), y el resto del payload como JSON. Devuelve (respuesta, http_status).
+    """
+    sensor_type = str(payload.get("sensor_type", "")).strip()
+    spec = SENSORS.get(sensor_type)
+    if spec is None:
+        return {"error": f"sensor_type inválido. Use: {', '.join(SENSORS)}."}, 400
+    try:
+        x = np.asarray(payload.get(spec["field"], []), dtype=float)
+    except (TypeError, ValueError):
+        return {"error": f"{spec['field']}: se espera una lista numérica."}, 400
+    arrays = {k: v for k, v in payload.items() if k != spec["field"] and isinstance(v, np.ndarray)}
+    meta = {k: v for k, v in payload.items() if k != spec["field"] and k not in arrays}
+    if arrays:
+        meta["_arrays"] = {k: int(v.size) for k, v in arrays.items()}
+    blob = b"".join([x.astype("<f8").tobytes()] + [np.asarray(v, dtype="<f8").tobytes() for v in arrays.values()])
+
+    jid = uuid.uuid4().hex
+    now = time.time()
+    con = _jobs_connect()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        con.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (now - JOB_TTL_S,))
+        queued = con.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        if queued >= JOB_MAX_QUEUED:
+            con.execute("ROLLBACK")
+            return {"error": "Cola de análisis llena. Reintente en unos minutos."}, 503
+        con.execute(
+            "INSERT INTO jobs (id, status, sensor_type, meta, signal, n_samples, created) "
+            "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+            (jid, sensor_type, json.dumps(meta), blob, int(x.size), now),
+        )
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+
+    start_job_runners()
+    return {"job_id": jid, "status": "queued", "poll": f"/api/jobs/{jid}"}, 202
+
+
+def _job_claim():
+    """Toma el job más antiguo en cola (o uno huérfano) de forma atómica entre procesos."""
+    now = time.time()
+    con = _jobs_connect()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        row = con.execute(
+            "SELECT id, sensor_type, meta, signal, attempts FROM jobs "
+            "WHERE status = 'queued' OR (status = 'running' AND COALESCE(heartbeat, started) < ?) "
+            "ORDER BY created LIMIT 1",
+            (now - JOB_TIMEOUT_S - 60.0,),
+        ).fetchone()
+        if row is not None and row[4] >= JOB_MAX_ATTEMPTS:
+            con.execute(
+                "UPDATE jobs SET status = 'error', http_status = 500, result = ?, signal = NULL, finished = ? "
+                "WHERE id = ?",
+                (json.dumps({"error": "El análisis se interrumpió repetidamente (worker reiniciado)."}), now, row[0]),
+            )
+            row = None
+        elif row is not None:
+            con.execute("UPDATE jobs SET status = 'running', started = ?, heartbeat = ?, attempts = attempts + 1 "
+                        "WHERE id = ?", (now, now, row[0]))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+    return row
+
+
+def _job_lease(jid):
+    """heartbeat() para un job en curso: renueva jobs.heartbeat a lo sumo cada JOB_HEARTBEAT_S."""
+    last = [time.monotonic()]
+
+    def heartbeat():
+        now = time.monotonic()
+        if now - last[0] < JOB_HEARTBEAT_S:
+            return
+        last[0] = now
+        try:
+            con = _jobs_connect()
+            try:
+                con.execute("UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = 'running'", (time.time(), jid))
+            finally:
+                con.close()
+        except sqlite3.Error:
+            pass  # se reintenta en el próximo latido
+
+    return heartbeat
+
+
+def _wait_run_slot(marker, heartbeat=None):
+    """Espera un slot "run" sin 503 (la cola es la tabla jobs). None si el job se canceló."""
+    while True:
+        slot = _try_slot("run", ANALYSIS_WORKERS)
+        if slot is not None:
+            return slot
+        if marker is not None and not os.path.exists(marker):
+            return None
+        if heartbeat is not None:
+            heartbeat()
+        time.sleep(_ANALYSIS_POLL_S)
+
+
+def _job_execute(jid, sensor_type, meta_json, blob):
+    heartbeat = _job_lease(jid)
+    if sensor_type == REANALYSIS_JOB:
+        marker = _active_marker(f"job-{jid}")
+        os.makedirs(ANALYSIS_SLOTS_DIR, exist_ok=True)
+        open(marker, "w").close()
+        try:
+            result, status = reanalyze_archive(json.loads(meta_json), cancel_marker=marker, heartbeat=heartbeat)
+        finally:
+            try:
+                os.unlink(marker)
+            except FileNotFoundError:
+                pass
+        return result, status, None
+
+    payload = json.loads(meta_json)
+    payload["sensor_type"] = sensor_type
+    data = np.frombuffer(blob, dtype="<f8")
+    arrays = payload.pop("_arrays", {})
+    end = data.size - sum(arrays.values())
+    payload[SENSORS[sensor_type]["field"]] = data[:end]
+    for k, n in arrays.items():
+        payload[k] = data[end:end + n]
+        end += n
+
+    if not ANALYSIS_ISOLATED:
+        return compute_traced(payload)
+
+    # mismo proceso aislado que /api/compute, con el timeout largo de los jobs;
+    # la cola ya es esta tabla: se espera el slot sin 503
+    marker = _active_marker(f"job-{jid}")
+    open(marker, "w").close()
+    slot = None
+    try:
+        slot = _wait_run_slot(marker, heartbeat)
+        if slot is None:
+            return {"error": "Análisis cancelado."}, 409, None
+        return _run_isolated(payload, marker, JOB_TIMEOUT_S, heartbeat=heartbeat)
+    finally:
+        _release_slot(slot)
+        try:
+            os.unlink(marker)
+        except FileNotFoundError:
+            pass
+
+
+def _job_finish(jid, result: dict, status: int):
+    state = "done" if status == 200 else ("cancelled" if status == 409 else "error")
+    con = _jobs_connect()
+    try:
+        con.execute(
+            "UPDATE jobs SET status = ?, result = ?, http_status = ?, signal = NULL, finished = ? "
+            "WHERE id = ? AND status = 'running'",
+            (state, json_dumps(result), int(status), time.time(), jid),
+        )
+    finally:
+        con.close()
+
+
+def _job_runner_loop():
+    while True:
+        try:
+            row = _job_claim()
+        except sqlite3.Error:
+            row = None
+        if row is None:
+            time.sleep(_JOB_IDLE_S)
+            continue
+        jid, sensor_type, meta_json, blob, _attempts = row
+        t0 = time.perf_counter()
+        try:
+            result, status, trace = _job_execute(jid, sensor_type, meta_json, blob)
+        except Exception as e:
+            result, status, trace = {"error": f"{type(e).__name__}: {e}"}, 500, None
+        seconds = time.perf_counter() - t0
+        metrics_record("job", result, status, trace, seconds)
+        if TIMINGS_DEBUG:
+            result["timings"] = timings_block(trace, seconds)
+        try:
+            _job_finish(jid, result, status)
+        except sqlite3.Error:
+            pass  # queda "running": se reintenta al vencer como huérfano
+
+
+def start_job_runners():
+    """Arranca (una vez por proceso) los hilos que consumen la cola de jobs."""
+    with _job_lock:
+        _job_threads[:] = [t for t in _job_threads if t.is_alive()]
+        for i in range(len(_job_threads), JOB_RUNNERS):
+            t = threading.Thread(target=_job_runner_loop, name=f"hba-jobs-{i}", daemon=True)
+            t.start()
+            _job_threads.append(t)
+
+
+def _job_view(row):
+    jid, status, sensor_type, n_samples, result, http_status, created, started, finished = row
+    out = {
+        "job_id": jid, "status": status, "sensor_type": sensor_type, "n_samples": n_samples,
+        "created": created, "started": started, "finished": finished,
+    }
+    if result is not None:
+        out["http_status"] = http_status
+        out["result"] = json.loads(result)
+    return out
+
+
+def job_status(jid: str, wait_s: float = 0.0):
+    """Estado del job; con wait_s > 0 hace long-poll hasta que termine (o venza wait_s)."""
+    start_job_runners()
+    deadline = time.monotonic() + min(max(0.0, wait_s), JOB_LONGPOLL_MAX_S)
+    con = _jobs_connect()
+    try:
+        while True:
+            row = con.execute(
+                "SELECT id, status, sensor_type, n_samples, result, http_status, created, started, finished "
+                "FROM jobs WHERE id = ?", (jid,)
+            ).fetchone()
+            if row is None:
+                return {"error": "Job inexistente o vencido."}, 404
+            if row[1] not in ("queued", "running") or time.monotonic() >= deadline:
+                break
+            time.sleep(_JOB_IDLE_S)
+        out = _job_view(row)
+        if row[1] == "queued":
+            out["queue_position"] = con.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?", (row[6],)
+            ).fetchone()[0]
+    finally:
+        con.close()
+    return out, 200
+
+
+def job_cancel(jid: str):
+    con = _jobs_connect()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        row = con.execute("SELECT status FROM jobs WHERE id = ?", (jid,)).fetchone()
+        if row is None:
+            con.execute("ROLLBACK")
+            return {"error": "Job inexistente o vencido."}, 404
+        if row[0] == "queued":
+            con.execute(
+                "UPDATE jobs SET status = 'cancelled', http_status = 409, result = ?, signal = NULL, finished = ? "
+                "WHERE id = ?",
+                (json.dumps({"error": "Análisis cancelado."}), time.time(), jid),
+            )
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+    if row[0] == "running":
+        cancel_analysis(f"job-{jid}")  # el runner lo marca "cancelled" al cortar el proceso
+    elif row[0] != "queued":
+        return {"error": f"El job ya terminó ({row[0]})."}, 409
+    return {"job_id": jid, "cancelled": True}, 200
+
+
+# ============================
+# Sesiones en vivo (push de chunks RR / PPG)
+# ============================
+
+SESSION_TTL_S = 3600.0
+SESSION_SPECTRAL_S = 300.0   # ring buffer de RR limpio para LF/HF rolling
+SESSION_SPECTRAL_MIN_S = 60.0
+SESSION_PPG_TAIL_S = 20.0    # ventana PPG re-analizada en cada push
+SESSION_PIPELINES = ("rri", "ppg")  # los que tienen estado incremental
+SESSION_PUSH_RETRIES = 5     # pushes concurrentes a la misma sesión: se recalcula sobre el estado nuevo
+
+
+def _session_spec(sensor_type):
+    spec = SENSORS.get(sensor_type)
+    return spec if spec is not None and spec["pipeline"] in SESSION_PIPELINES else None
+
+
+def _rr_stream_init():
+    return {
+        "n_in": 0, "t_total_ms": 0.0,
+        "ctx": [],                 # últimos beats (contexto de mediana local)
+        "n_cls": 0, "n_bad": 0,    # máscara Kubios-like incremental
+        "n_good": 0, "mean": 0.0, "m2": 0.0,        # Welford (SDNN / MeanNN)
+        "last": None, "last_good": False,
+        "n_diff": 0, "ssd": 0.0, "nn50": 0,         # RMSSD / pNN50 (pares buenos)
+        "ring": [],                # RR limpio de los últimos SESSION_SPECTRAL_S
+    }
+
+
+def _rr_stream_push(st: dict, rr_new: np.ndarray):
+    """
+    Actualiza el estado RR con un chunk. Costo O(chunk): la mediana local solo
+    necesita los últimos half beats de contexto, los acumuladores son sumas.
+    """
+    rr_new = _finite_array(rr_new)
+    if rr_new.size == 0:
+        return st
+    st["n_in"] += int(rr_new.size)
+    st["t_total_ms"] += float(np.sum(rr_new))
+
+    half = _kubios_window(11) // 2
+    buf = np.concatenate([np.asarray(st["ctx"], dtype=float), rr_new])
+    start = 0 if st["n_cls"] == 0 else half
+    stop = buf.size - half
+    if stop <= start:
+        st["ctx"] = buf.tolist()
+        return st
+
+    med = _local_median(buf, 2 * half + 1)
+    drr_abs = np.abs(np.diff(buf, prepend=buf[0]))
+    bad = _kubios_bad_from_median(buf, med, drr_abs)[start:stop]
+    vals = buf[start:stop]
+    st["ctx"] = buf[stop - half:].tolist()
+    st["n_cls"] += int(vals.size)
+    st["n_bad"] += int(np.sum(bad))
+
+    good = vals[~bad]
+    if good.size:
+        n_a, n_b = st["n_good"], int(good.size)
+        mean_b = float(np.mean(good))
+        m2_b = float(np.sum((good - mean_b) ** 2))
+        delta = mean_b - st["mean"]
+        n = n_a + n_b
+        st["mean"] += delta * n_b / n
+        st["m2"] += m2_b + delta ** 2 * n_a * n_b / n
+        st["n_good"] = n
+
+    seq, ok = vals, ~bad
+    if st["last"] is not None:
+        seq = np.r_[st["last"], vals]
+        ok = np.r_[st["last_good"], ok]
+    pair = ok[:-1] & ok[1:]
+    d = np.diff(seq)[pair]
+    st["n_diff"] += int(d.size)
+    st["ssd"] += float(np.sum(d ** 2))
+    st["nn50"] += int(np.sum(np.abs(d) > 50))
+    st["last"], st["last_good"] = float(vals[-1]), bool(~bad[-1])
+
+    ring = np.r_[np.asarray(st["ring"], dtype=float), good]
+    keep = np.cumsum(ring[::-1]) <= SESSION_SPECTRAL_S * 1000.0
+    st["ring"] = ring[ring.size - int(np.sum(keep)):].tolist()
+    return st
+
+
+def _rr_stream_metrics(st: dict):
+    rmssd = float(np.sqrt(st["ssd"] / st["n_diff"])) if st["n_diff"] else np.nan
+    sdnn = float(np.sqrt(st["m2"] / (st["n_good"] - 1))) if st["n_good"] > 1 else np.nan
+    mean_rr = float(st["mean"]) if st["n_good"] else np.nan
+
+    lf = hf = np.nan
+    ring = np.asarray(st["ring"], dtype=float)
+    if ring.size and np.sum(ring) >= SESSION_SPECTRAL_MIN_S * 1000.0:
+        hrv = hrv_indices_native(ring)
+        if hrv is not None:
+            lf, hf = hrv["lf"], hrv["hf"]
+
+    return {
+        "rmssd": rmssd,
+        "lnrmssd": np.log(rmssd) if np.isfinite(rmssd) and rmssd > 0 else np.nan,
+        "sdnn": sdnn,
+        "pnn50": 100.0 * st["nn50"] / st["n_diff"] if st["n_diff"] else np.nan,
+        "mean_rr": mean_rr,
+        "hr_mean": 60000.0 / mean_rr if np.isfinite(mean_rr) and mean_rr > 0 else np.nan,
+        "lf_power": lf,
+        "hf_power": hf,
+        "lf_hf": (lf / hf) if np.isfinite(lf) and np.isfinite(hf) and hf > 0 else np.nan,
+        "artifact_percent": 100.0 * st["n_bad"] / st["n_cls"] if st["n_cls"] else np.nan,
+        "n_rr": st["n_in"],
+        "elapsed_s": st["t_total_ms"] / 1000.0,
+        "spectral_window_s": float(np.sum(ring)) / 1000.0,
+    }
+
+
+def _ppg_stream_init():
+    return {"tail": [], "tail_start": 0, "last_peak": None, "n_samples": 0}
+
+
+def _ppg_stream_push(st: dict, rr_st: dict, ppg_new: np.ndarray, sampling_rate: float):
+    """
+    Re-analiza solo la cola (SESSION_PPG_TAIL_S) + el chunk nuevo: picos con el
+    mismo filtro/detector del batch, se aceptan los posteriores al último pico
+    confirmado (y no pegados al borde) y sus RR alimentan el estado RR.
+    """
+    ppg_new = _finite_array(ppg_new)
+    fs = float(sampling_rate)
+    st["n_samples"] += int(ppg_new.size)
+    buf = np.concatenate([np.asarray(st["tail"], dtype=float), ppg_new])
+
+    if buf.size >= int(fs * 10):
+        _p, p = ppg_front_end(buf, fs)
+        peaks = _ppg_peaks_robust(p, fs)
+        if peaks is not None:
+            peaks = peaks[peaks < buf.size - int(fs)] + st["tail_start"]
+            if st["last_peak"] is not None:
+                peaks = peaks[peaks > st["last_peak"] + int(0.33 * fs)]
+            if peaks.size:
+                seq = peaks if st["last_peak"] is None else np.r_[st["last_peak"], peaks]
+                _rr_stream_push(rr_st, np.diff(seq) / fs * 1000.0)
+                st["last_peak"] = int(peaks[-1])
+
+    k = min(buf.size, int(fs * SESSION_PPG_TAIL_S))
+    st["tail_start"] += int(buf.size - k)
+    st["tail"] = buf[buf.size - k:].tolist()
+    return st
+
+
+def session_open(payload: dict):
+    sensor_type = str(payload.get("sensor_type", "")).strip()
+    spec = _session_spec(sensor_type)
+    if spec is None:
+        valid = [k for k in SENSORS if _session_spec(k)]
+        return {"error": f"sensor_type inválido para sesión. Use: {', '.join(valid)}."}, 400
+    is_ppg = spec["pipeline"] == "ppg"
+    sr = _as_float(payload.get("sampling_rate", spec["sampling_rate"] if is_ppg else np.nan))
+    if is_ppg and not (np.isfinite(sr) and sr > 1):
+        return {"error": "sampling_rate inválido."}, 400
+
+    meta = {k: payload.get(k) for k in ("age", "sex", "student_id", "duration_minutes") if k in payload}
+    state = {"rr": _rr_stream_init()}
+    if is_ppg:
+        state["ppg"] = _ppg_stream_init()
+
+    sid = uuid.uuid4().hex
+    now = time.time()
+    con = _db_connect()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        old = [r[0] for r in con.execute("SELECT id FROM sessions WHERE updated < ?", (now - SESSION_TTL_S,))]
+        con.executemany("DELETE FROM session_chunks WHERE session_id = ?", ((i,) for i in old))
+        con.executemany("DELETE FROM sessions WHERE id = ?", ((i,) for i in old))
+        con.execute(
+            "INSERT INTO sessions (id, sensor_type, sampling_rate, meta, state, n_chunks, created, updated) "
+            "VALUES (?, ?, ?, ?, ?, 0, ?, ?)",
+            (sid, sensor_type, sr if np.isfinite(sr) else None, json.dumps(meta), json.dumps(state), now, now),
+        )
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+    return {"session_id": sid, "sensor_type": sensor_type, "field": spec["field"]}, 200
+
+
+def _session_row(con, sid):
+    return con.execute(
+        "SELECT sensor_type, sampling_rate, meta, state, n_chunks, closed FROM sessions WHERE id = ?", (sid,)
+    ).fetchone()
+
+
+def _session_view(sid, sensor_type, state):
+    out = _rr_stream_metrics(state["rr"])
+    out["session_id"] = sid
+    out["sensor_type"] = sensor_type
+    if "ppg" in state:
+        out["n_samples"] = state["ppg"]["n_samples"]
+    return out
+
+
+def session_push(sid: str, payload: dict):
+    """
+    Control optimista: el estado se lee y se actualiza (filtro, picos, Welch) fuera
+    de toda transacción; la escritura es corta y solo aplica si n_chunks no cambió.
+    Así el lock de escritura de la base compartida no espera al análisis del chunk.
+    """
+    con = _db_connect()
+    try:
+        for attempt in range(SESSION_PUSH_RETRIES):
+            if attempt:
+                time.sleep(0.01 * attempt)  # espaciar reintentos: evita que dos pushes se pisen en bucle
+            row = _session_row(con, sid)
+            if row is None or row[5]:
+                return {"error": "Sesión inexistente o cerrada."}, 404
+            sensor_type, sr, _meta, state_json, n_chunks, _closed = row
+            chunk = payload.get("_binary", payload.get(SENSORS[sensor_type]["field"]))
+            chunk = np.asarray(chunk if chunk is not None else [], dtype=float)
+            state = json.loads(state_json)
+            if "ppg" in state:
+                _ppg_stream_push(state["ppg"], state["rr"], chunk, sr)
+            else:
+                _rr_stream_push(state["rr"], chunk)
+            state_json = json.dumps(state)
+
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                cur = con.execute(
+                    "UPDATE sessions SET state = ?, n_chunks = ?, updated = ? WHERE id = ? AND n_chunks = ? AND closed = 0",
+                    (state_json, n_chunks + 1, time.time(), sid, n_chunks))
+                if cur.rowcount != 1:
+                    con.execute("ROLLBACK")
+                    continue  # otro push (o el cierre) ganó: recalcular sobre el estado nuevo
+                con.execute("INSERT INTO session_chunks (session_id, seq, data) VALUES (?, ?, ?)",
+                            (sid, n_chunks, chunk.astype("<f8").tobytes()))
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+            return _session_view(sid, sensor_type, state), 200
+    finally:
+        con.close()
+    return {"error": "Sesión con pushes concurrentes: reintente."}, 409
+
+
+def session_status(sid: str):
+    con = _db_connect()
+    try:
+        row = _session_row(con, sid)
+    finally:
+        con.close()
+    if row is None:
+        return {"error": "Sesión inexistente."}, 404
+    out = _session_view(sid, row[0], json.loads(row[3]))
+    out["closed"] = bool(row[5])
+    return out, 200
+
+
+def session_close(sid: str, payload: dict = None):
+    """Cierra la sesión y corre el pipeline batch sobre la señal completa (= /api/compute)."""
+    con = _db_connect()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        row = _session_row(con, sid)
+        if row is None or row[5]:
+            con.execute("ROLLBACK")
+            return {"error": "Sesión inexistente o cerrada."}, 404
+        sensor_type, sr, meta_json, _state, _n, _closed = row
+        blobs = [r[0] for r in con.execute(
+            "SELECT data FROM session_chunks WHERE session_id = ? ORDER BY seq", (sid,))]
+        con.execute("DELETE FROM session_chunks WHERE session_id = ?", (sid,))
+        con.execute("UPDATE sessions SET closed = 1, updated = ? WHERE id = ?", (time.time(), sid))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+
+    data = np.frombuffer(b"".join(blobs), dtype="<f8")
+    final = json.loads(meta_json)
+    final.update({k: v for k, v in (payload or {}).items() if k in ("age", "sex", "student_id", "duration_minutes", "static_etag")})
+    final["sensor_type"] = sensor_type
+    final[SENSORS[sensor_type]["field"]] = data
+    if SENSORS[sensor_type]["sampling_rate"]:
+        final["sampling_rate"] = sr
+        final.setdefault("duration_minutes", data.size / sr / 60.0)
+    else:
+        final.setdefault("duration_minutes", float(np.sum(data[np.isfinite(data)])) / 60000.0)
+
+    result, status = run_analysis(final, source="session")
+    result["session_id"] = sid
+    return result, status
+
+
+# ============================
+# Flask
+# ============================
+
+@app.route("/")
+def index():
+    return render_template("index.html")
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Readiness: 200 cuando el motor de análisis ya está cargado, 503 mientras no."""
+    warm = engine_warm()
+    body = {
+        "ok": warm,
+        "engine_warm": warm,
+        "modules": {m._name: m.loaded for m in _engine_modules()},
+        "forkserver_ok": _engine_state["forkserver_ok"],
+        "warm_seconds": _engine_state["warm_seconds"],
+        "pid": os.getpid(),
+    }
+    return jsonify(body), (200 if warm else 503)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Histogramas por etapa y contadores de fallback (formato Prometheus, suma de workers)."""
+    return Response(metrics_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route("/api/dashboard/static", methods=["GET"])
+def api_dashboard_static():
+    """
+    Textos fijos del dashboard (interpretación, planes del semáforo por color,
+    diferenciador). El cliente los guarda y envía "static_etag" (o X-HBA-Static-ETag)
+    en /api/compute para recibir resultados sin esos textos.
+    """
+    resp = jsonify({**DASHBOARD_STATIC, "etag": DASHBOARD_STATIC_ETAG})
+    resp.set_etag(DASHBOARD_STATIC_ETAG)
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+
+@app.route("/api/compute", methods=["POST"])
+def api_compute():
+    try:
+        payload = payload_from_request(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result, status = run_analysis(payload, request.headers.get("X-HBA-Request-Id"))
+    return jsonify(result), status
+
+
+@app.route("/api/compute/<request_id>/cancel", methods=["POST"])
+def api_compute_cancel(request_id):
+    if cancel_analysis(request_id):
+        return jsonify({"ok": True, "request_id": request_id})
+    return jsonify({"error": "No hay un análisis en curso con ese request_id."}), 404
+
+
+@app.route("/api/compute_batch", methods=["POST"])
+def api_compute_batch():
+    """
+    Lote de payloads (lista JSON, {"items": [...]} o NDJSON, una medición por línea).
+    Responde NDJSON en orden de finalización: {"index", "id"?, "status", "result"}.
+    """
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        items = _iter_ndjson(request.stream)
+    else:
+        body = request.get_json(force=True, silent=True)
+        if isinstance(body, dict):
+            body = body.get("items")
+        if not isinstance(body, list):
+            return jsonify({"error": "Se espera una lista de payloads, {\"items\": [...]} o NDJSON."}), 400
+        items = iter(body)
+
+    futures = {}
+    early = []
+    pool = _batch_pool()
+    for i, payload in enumerate(items):
+        if i >= BATCH_MAX_ITEMS:
+            early.append({"index": i, "status": 413, "error": f"Lote limitado a {BATCH_MAX_ITEMS} ítems."})
+            break
+        if isinstance(payload, Exception) or not isinstance(payload, dict):
+            early.append({"index": i, "status": 400, "error": "Ítem inválido (se espera un objeto JSON)."})
+            continue
+        futures[pool.submit(_compute_batch_item, i, payload)] = i
+
+    def generate():
+        for out in early:
+            yield json_dumps(out) + "\n"
+        for fut in as_completed(futures):
+            try:
+                out, trace, seconds = fut.result()
+            except Exception as e:
+                out, trace, seconds = {"index": futures[fut], "status": 500, "error": f"Fallo en worker: {e}"}, None, 0.0
+            metrics_record("batch", out.get("result") or {}, out["status"], trace, seconds)
+            if TIMINGS_DEBUG and "result" in out:
+                out["result"]["timings"] = timings_block(trace, seconds)
+            yield json_dumps(out) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/api/jobs", methods=["POST"])
+def api_job_submit():
+    """Igual que /api/compute (JSON o binario), pero responde 202 con job_id y corre en segundo plano."""
+    try:
+        payload = payload_from_request(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    out, status = job_submit(payload)
+    return jsonify(out), status
+
+
+@app.route("/api/jobs/<jid>", methods=["GET"])
+def api_job_status(jid):
+    wait = _as_float(request.args.get("wait", 0))
+    out, status = job_status(jid, wait if np.isfinite(wait) else 0.0)
+    return jsonify(out), status
+
+
+@app.route("/api/jobs/<jid>", methods=["DELETE"])
+def api_job_cancel(jid):
+    out, status = job_cancel(jid)
+    return jsonify(out), status
+
+
+@app.route("/api/cache/stats", methods=["GET"])
+def api_cache_stats():
+    return jsonify(cache_stats())
+
+
+@app.route("/api/session", methods=["POST"])
+def api_session_open():
+    payload = request.get_json(force=True, silent=True) or {}
+    out, status = session_open(payload)
+    return jsonify(out), status
+
+
+@app.route("/api/session/<sid>", methods=["GET"])
+def api_session_status(sid):
+    out, status = session_status(sid)
+    return jsonify(out), status
+
+
+@app.route("/api/session/<sid>/push", methods=["POST"])
+def api_session_push(sid):
+    try:
+        if request.mimetype == "application/octet-stream":
+            # chunk binario: el campo lo define el sensor de la sesión
+            dtype = _binary_dtype(request.headers.get("X-HBA-Dtype"))
+            payload = {"_binary": _frombuffer(request.get_data(cache=False), dtype)}
+        else:
+            payload = decode_b64_fields(request.get_json(force=True, silent=True) or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    out, status = session_push(sid, payload)
+    return jsonify(out), status
+
+
+@app.route("/api/session/<sid>/close", methods=["POST"])
+def api_session_close(sid):
+    payload = request.get_json(force=True, silent=True) or {}
+    out, status = session_close(sid, payload)
+    return jsonify(out), status
+
+
+@app.route("/api/save", methods=["POST"])
+def api_save():
+    payload = request.get_json(force=True) or {}
+
+    student_id = str(payload.get("student_id", "")).strip()
+    age = payload.get("age", "")
+    comorbidities = str(payload.get("comorbidities", "")).strip()
+    notes = str(payload.get("notes", "")).strip()
+
+    metrics = payload.get("metrics", {}) or {}
+
+    row = {
+        "timestamp_utc": datetime.utcnow().isoformat() + "Z",
+        "student_id": student_id,
+        "age": age,
+        "comorbidities": comorbidities,
+        "sensor_type": metrics.get("sensor_type", ""),
         "duration_minutes": metrics.get("duration_minutes", ""),
         "rmssd": metrics.get("rmssd", ""),
         "sdnn": metrics.get("sdnn", ""),
@@ -865,10 +4011,83 @@ def api_save():
         "resp_rate_rpm": metrics.get("resp_rate_rpm", ""),
         "freq_warning": metrics.get("freq_warning", ""),
         "notes": notes,
+        "sex": payload.get("sex") or ((metrics.get("hba_dashboard") or {}).get("norms") or {}).get("sex") or "",
+        "baevsky_si": metrics.get("baevsky_si", ""),
     }
 
-    append_to_dataset(row)
-    return jsonify({"ok": True, "file": DATASET_FILE})
+    row_id = append_to_dataset(row)
+    out = {"ok": True, "file": DATASET_DB, "id": row_id}
+
+    # señal cruda (opcional): {"sensor_type", "sampling_rate", "<campo>" o "<campo>_b64", "dtype"}
+    sig = payload.get("signal")
+    if isinstance(sig, dict):
+        try:
+            sig = decode_b64_fields(dict(sig))
+            sensor_type = str(sig.get("sensor_type") or row["sensor_type"]).strip()
+            spec = SENSORS.get(sensor_type)
+            if spec is None or sig.get(spec["field"]) is None:
+                raise ValueError("señal sin sensor_type válido o sin muestras.")
+            x = np.asarray(sig[spec["field"]], dtype=float)
+            out["archived_bytes"] = archive_signal(row_id, sensor_type, x, sig.get("sampling_rate"),
+                                                   sig.get("duration_minutes", row["duration_minutes"]),
+                                                   sig.get("timestamps_ms"))
+        except (ValueError, TypeError, OSError, sqlite3.Error) as e:
+            out["archive_error"] = str(e)  # las métricas ya quedaron guardadas
+    return jsonify(out)
+
+
+@app.route("/api/archive/<int:measurement_id>", methods=["GET"])
+def api_archive_signal(measurement_id):
+    """Señal archivada como float32 LE con headers X-HBA-* (se puede re-enviar tal cual a /api/compute)."""
+    got = load_signal(measurement_id)
+    if got is None:
+        return jsonify({"error": "Medición sin señal archivada."}), 404
+    meta, x = got
+    headers = {"X-HBA-Sensor-Type": meta["sensor_type"]}
+    if meta["sampling_rate"] is not None:
+        headers["X-HBA-Sampling-Rate"] = repr(meta["sampling_rate"])
+    if meta["duration_minutes"] is not None:
+        headers["X-HBA-Duration-Minutes"] = repr(meta["duration_minutes"])
+    if meta["timestamps_ms"] is not None:
+        headers[TIMESTAMPS_HEADER] = "ms"
+        x = np.concatenate([x, meta["timestamps_ms"]])
+    return Response(x.astype("<f4").tobytes(), mimetype="application/octet-stream", headers=headers)
+
+
+@app.route("/api/archive/reanalyze", methods=["POST"])
+def api_archive_reanalyze():
+    """Re-analiza las señales archivadas con el algoritmo actual (job; ver /api/jobs/<id>)."""
+    payload = request.get_json(force=True, silent=True) or {}
+    out, status = reanalysis_submit(payload)
+    return jsonify(out), status
+
+
+@app.route("/api/dashboard/rescore", methods=["POST"])
+def api_dashboard_rescore():
+    """Recalcula en bloque los scores guardados (dashboard_scores) con las normas actuales."""
+    payload = request.get_json(force=True, silent=True) or {}
+    student_id = str(payload.get("student_id", "") or "").strip() or None
+    return jsonify(rescore_dataset(student_id))
+
+
+@app.route("/api/students/<student_id>/trend", methods=["GET"])
+def api_student_trend(student_id):
+    as_of = str(request.args.get("as_of", "")).strip() or None
+    try:
+        out = student_trend(student_id.strip(), as_of)
+    except ValueError:
+        return jsonify({"error": "as_of inválido. Use YYYY-MM-DD."}), 400
+    return jsonify(out)
+
+
+@app.route("/api/dataset.csv", methods=["GET"])
+def api_dataset_csv():
+    student_id = str(request.args.get("student_id", "")).strip() or None
+    return Response(
+        stream_with_context(iter_dataset_csv(student_id)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={DATASET_FILE}"},
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,80 @@
+"""
+Benchmark del motor de artefactos RR (_kubios_like_artifact_mask / _windowed_rr_salvage).
+
+Compara la mediana local por loop Python (implementación previa) contra el filtro
+de mediana 1D (O(n log w) desde scipy 1.15, O(n·w) antes) y muestra el escalado
+con n (beats) y w (ventana); el salvataje
+trabaja con rangos de índices sobre un único buffer (tiempo y pico de memoria
+con 100k beats ~ 24 h de RR subido):
+
+    python benchmarks/bench_artifact_mask.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def _loop_mask(rr, win=11):
+    # referencia: mediana local beat a beat (versión anterior)
+    n = rr.size
+    w = app._kubios_window(win)
+    half = w // 2
+    med_local = np.zeros(n)
+    for i in range(n):
+        med_local[i] = np.median(rr[max(0, i - half):min(n, i + half + 1)])
+    return app._kubios_bad_from_median(rr, med_local, np.abs(np.diff(rr, prepend=rr[0])))
+
+
+def _synthetic_rr(n, seed=0):
+    rng = np.random.default_rng(seed)
+    rr = 850.0 + 40.0 * np.sin(np.arange(n) / 4.0) + rng.normal(0.0, 25.0, n)
+    k = rng.integers(0, n, max(1, n // 50))
+    rr[k] *= rng.choice([0.6, 1.9], k.size)
+    return rr
+
+
+def _best_of(fn, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    print(f"{'n':>8} {'w':>3} {'loop_s':>9} {'vect_s':>9} {'ns/beat':>8} {'igual':>6}")
+    for n in (1_000, 10_000, 100_000):
+        rr = _synthetic_rr(n)
+        for w in (7, 11, 21):
+            fast = app._kubios_like_artifact_mask(rr, win=w)
+            t_vec = _best_of(lambda: app._kubios_like_artifact_mask(rr, win=w))
+            if n <= 10_000:
+                same = bool(np.array_equal(fast, _loop_mask(rr, win=w)))
+                t_loop = _best_of(lambda: _loop_mask(rr, win=w), repeat=1)
+            else:
+                same, t_loop = "-", np.nan
+            print(f"{n:>8} {w:>3} {t_loop:>9.4f} {t_vec:>9.4f} {1e9 * t_vec / n:>8.1f} {str(same):>6}")
+
+    print()
+    print(f"{'n':>8} {'salvage_s':>10} {'peak_MB':>8} {'B/beat':>7} {'usable':>7}")
+    for n in (1_000, 10_000, 100_000):
+        rr = _synthetic_rr(n, seed=1)
+        run = lambda: app._windowed_rr_salvage(rr, window_beats=45, step_beats=20, max_artifact_pct=25.0)  # noqa: E731
+        t = _best_of(run)
+        tracemalloc.start()
+        _rr, usable, _art, _breaks = run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{n:>8} {t:>10.4f} {peak / 2**20:>8.2f} {peak / n:>7.1f} {usable:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark de /api/compute_batch: throughput (ítems/s) vs ítems en paralelo
+(cada ítem en un hijo aislado del forkserver).
+
+    python benchmarks/bench_compute_batch.py [--items 48] [--minutes 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def _ppg_payload(minutes, fs, seed):
+    rng = np.random.default_rng(seed)
+    n_beats = int(minutes * 60 * 1.3)
+    rr = 0.8 + 0.05 * np.sin(np.arange(n_beats) / 3.0) + rng.normal(0.0, 0.03, n_beats)
+    t = np.arange(int(minutes * 60 * fs)) / fs
+    ph = np.interp(t, np.cumsum(rr), np.arange(n_beats))
+    ppg = np.sin(2 * np.pi * ph) + 0.3 * np.sin(2 * np.pi * 0.25 * t) + rng.normal(0.0, 0.2, t.size)
+    return {"sensor_type": "camera_ppg", "ppg": ppg.tolist(), "sampling_rate": fs,
+            "duration_minutes": minutes, "age": 30, "id": seed}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=48)
+    ap.add_argument("--minutes", type=float, default=5.0)
+    args = ap.parse_args()
+
+    body = json.dumps([_ppg_payload(args.minutes, 30, i) for i in range(args.items)])
+    client = app.app.test_client()
+
+    cpus = os.cpu_count() or 1
+    workers = sorted({1, 2, 4, 8, cpus} & set(range(1, cpus + 1)))
+    base = None
+    print(f"{'workers':>7} {'items/s':>9} {'speedup':>8}")
+    for w in workers:
+        app._batch_executor = ThreadPoolExecutor(max_workers=w)
+        client.post("/api/compute_batch", data=json.dumps([_ppg_payload(1, 30, 0)] * w),
+                     content_type="application/json")  # warm-up (forkserver + imports)
+        t0 = time.perf_counter()
+        r = client.post("/api/compute_batch", data=body, content_type="application/json")
+        n = sum(1 for line in r.data.splitlines() if line.strip())
+        dt = time.perf_counter() - t0
+        app._batch_executor.shutdown()
+        rate = n / dt
+        base = base or rate
+        print(f"{w:>7} {rate:>9.2f} {rate / base:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
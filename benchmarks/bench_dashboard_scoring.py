@@ -0,0 +1,90 @@
+"""
+Scoring del dashboard para cohortes: loop por fila con las funciones escalares
+(ruta por request de enrich_hba_dashboard) contra score_dashboard_columns.
+Verifica igualdad bit a bit en todas las columnas (NaN == NaN):
+
+    python benchmarks/bench_dashboard_scoring.py [--rows 1000 10000 100000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def _cohort(n, seed=0):
+    rng = np.random.default_rng(seed)
+
+    def col(lo, hi, missing=0.1):
+        x = rng.uniform(lo, hi, n)
+        x[rng.random(n) < missing] = np.nan
+        return x
+
+    return {
+        "rmssd": col(5, 120), "sdnn": col(5, 150), "lf_hf": col(0, 8), "hr_mean": col(40, 120),
+        "baevsky_si": col(0, 900), "age": col(-5, 90),
+        "sex": rng.choice(np.array(["F", "M", " f ", None, ""], dtype=object), n),
+    }
+
+
+def _loop(c):
+    th = app.DASHBOARD_THRESHOLDS
+    out = {k: [] for k in app.SCORE_COLUMNS}
+    for rm, sd, lf, hr, si, age, sex in zip(*(c[k] for k in app._SCORE_INPUTS)):
+        low, high = app.rmssd_reference_by_age_sex(age, sex)
+        state = app.classify_hml(rm, low, high)
+        auto = app.autonomic_score_0_100(rm, lf, si)
+        fp, fe = app.fatigue_scores_0_100(rm, sd, hr)
+        row = {
+            "rmssd_low": low, "rmssd_high": high, "rmssd_state": state,
+            "sdnn_state": app.classify_hml(sd, *th["sdnn"]), "hr_state": app.classify_hml(hr, *th["hr_mean"]),
+            "lfhf_state": app.classify_hml(lf, *th["lf_hf"]), "baevsky_state": app.classify_hml(si, *th["baevsky"]),
+            "autonomic_score": auto, "load_state": app.classify_hml(auto, *th["autonomic_score"]),
+            "fatigue_phys": fp, "fatigue_emo": fe,
+            "fatigue_phys_state": app.classify_hml(fp, *th["fatigue"]),
+            "fatigue_emo_state": app.classify_hml(fe, *th["fatigue"]),
+            "semaphore_color": app.semaphore_plan(state)["color"],
+        }
+        for k, v in row.items():
+            out[k].append(v)
+    return out
+
+
+def _mismatches(ref, vec):
+    bad = 0
+    for k in app.SCORE_COLUMNS:
+        if k in app._SCORE_NUMERIC:
+            a = np.asarray(ref[k], dtype=float)
+            b = vec[k].astype(float)
+            diff = (a.view(np.uint64) != b.view(np.uint64)) & ~(np.isnan(a) & np.isnan(b))
+            bad += int(np.count_nonzero(diff))
+        else:
+            bad += int(np.count_nonzero(np.asarray(ref[k], dtype=object) != vec[k]))
+    return bad
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    args = ap.parse_args()
+
+    print(f"{'rows':>8} {'loop_s':>9} {'vect_s':>9} {'speedup':>8} {'us/row':>7} {'distintos':>9}")
+    for n in args.rows:
+        c = _cohort(n)
+        t0 = time.perf_counter()
+        ref = _loop(c)
+        t_loop = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        vec = app.score_dashboard_columns(c)
+        t_vec = time.perf_counter() - t0
+        print(f"{n:>8} {t_loop:>9.4f} {t_vec:>9.4f} {t_loop / t_vec:>8.1f} {1e6 * t_vec / n:>7.2f} "
+              f"{_mismatches(ref, vec):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark de /api/save: latencia de append_to_dataset vs tamaño del dataset,
+lectura de tendencia por estudiante (student_trend) y escritura concurrente
+desde varios procesos (sin pérdida de filas).
+
+    python benchmarks/bench_dataset_store.py [--max-rows 1000000]
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def _row(i):
+    return {
+        "timestamp_utc": f"2024-01-01T00:00:{i % 60:02d}Z",
+        "student_id": f"s{i % 300}",
+        "age": 20 + i % 40,
+        "sensor_type": "polar_h10",
+        "rmssd": 40.0 + (i % 17),
+        "lnrmssd": 3.7,
+        "notes": "",
+    }
+
+
+def _fill(db, n_target):
+    con = app._db_connect(db)
+    try:
+        have = con.execute("SELECT COUNT(*) FROM measurements").fetchone()[0]
+        con.execute("BEGIN")
+        con.executemany(app._INSERT_SQL, (app._dataset_values(_row(i)) for i in range(have, n_target)))
+        con.execute("COMMIT")
+    finally:
+        con.close()
+
+
+def _writer(db, k):
+    app.DATASET_DB = db
+    for i in range(k):
+        app.append_to_dataset(_row(i))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--max-rows", type=int, default=1_000_000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.DATASET_FILE = os.path.join(tmp, "no_csv.csv")
+        app.DATASET_DB = os.path.join(tmp, "bench.sqlite")
+
+        print(f"{'rows':>9} {'p50_ms':>8} {'p95_ms':>8} {'trend_p50_ms':>13}")
+        for n in (1_000, 10_000, 100_000, args.max_rows):
+            if n > args.max_rows:
+                continue
+            _fill(app.DATASET_DB, n)
+            lat = []
+            for i in range(200):
+                t0 = time.perf_counter()
+                app.append_to_dataset(_row(i))
+                lat.append(1000.0 * (time.perf_counter() - t0))
+            tr = []
+            for i in range(200):
+                t0 = time.perf_counter()
+                app.student_trend(f"s{i % 300}", "2024-01-01")
+                tr.append(1000.0 * (time.perf_counter() - t0))
+            print(f"{n:>9} {np.percentile(lat, 50):>8.3f} {np.percentile(lat, 95):>8.3f} "
+                  f"{np.percentile(tr, 50):>13.3f}")
+
+        db = os.path.join(tmp, "concurrent.sqlite")
+        procs, k = 4, 250
+        ps = [mp.Process(target=_writer, args=(db, k)) for _ in range(procs)]
+        t0 = time.perf_counter()
+        for p in ps:
+            p.start()
+        for p in ps:
+            p.join()
+        con = app._db_connect(db)
+        n = con.execute("SELECT COUNT(*) FROM measurements").fetchone()[0]
+        con.close()
+        print(f"\nconcurrente: {procs} procesos x {k} saves -> {n} filas "
+              f"({'OK' if n == procs * k else 'PERDIDA'}) en {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark del kernel HRV nativo (hrv_indices_native) vs NK2 (hrv_time + hrv_frequency
+sobre el tren de picos de rri_to_peaks, el camino de referencia).
+
+Reporta tiempo, pico de memoria (tracemalloc) y la diferencia relativa máxima
+por campo, que es la tolerancia documentada del kernel:
+
+    python benchmarks/bench_hrv_kernel.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import neurokit2 as nk  # noqa: E402
+
+warnings.filterwarnings("ignore")
+
+
+def _synthetic_rr(minutes, seed=0):
+    rng = np.random.default_rng(seed)
+    n = int(minutes * 60 / 0.8)
+    return 800.0 + 50.0 * np.sin(np.arange(n) / 4.0) + rng.normal(0.0, 30.0, n)
+
+
+def _reference(rr):
+    peaks = app.rri_to_peaks(rr, sampling_rate=1000)
+    return app._hrv_indices_from_nk(
+        nk.hrv_time(peaks, sampling_rate=1000, show=False),
+        nk.hrv_frequency(peaks, sampling_rate=1000, show=False),
+    )
+
+
+def _measure(fn, rr, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(rr)
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn(rr)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, best, peak
+
+
+def main():
+    print(f"{'min':>4} {'n_rr':>6} {'nk2_ms':>8} {'nat_ms':>8} {'nk2_MB':>7} {'nat_MB':>7} {'max_rel_diff':>13}")
+    for minutes in (1, 5, 30):
+        rr = _synthetic_rr(minutes)
+        ref, t_ref, m_ref = _measure(_reference, rr)
+        nat, t_nat, m_nat = _measure(app.hrv_indices_native, rr)
+        diffs = [
+            abs(nat[k] - ref[k]) / max(abs(ref[k]), 1e-12)
+            for k in ref if np.isfinite(ref[k]) and np.isfinite(nat[k])
+        ]
+        print(f"{minutes:>4} {rr.size:>6} {1e3 * t_ref:>8.2f} {1e3 * t_nat:>8.2f} "
+              f"{m_ref / 2**20:>7.2f} {m_nat / 2**20:>7.2f} {max(diffs):>13.2e}")
+
+
+if __name__ == "__main__":
+    main()
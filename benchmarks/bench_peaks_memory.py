@@ -0,0 +1,61 @@
+"""
+Memoria del fallback de referencia NK2: tren de picos denso (versión previa de
+rri_to_peaks, un int64 por milisegundo) vs índices dispersos int32.
+
+    python benchmarks/bench_peaks_memory.py [--measure-dense]
+
+Sin --measure-dense el tamaño del tren denso se informa calculado (24 h ~ 690 MB).
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+warnings.filterwarnings("ignore")
+
+
+def _dense_peaks(rri_ms, sampling_rate=1000):
+    # implementación previa (referencia)
+    peak_samples = np.unique(np.round(np.cumsum(rri_ms) / 1000.0 * sampling_rate).astype(int))
+    peaks = np.zeros(int(peak_samples[-1] + sampling_rate), dtype=int)
+    peaks[peak_samples] = 1
+    return peaks
+
+
+def _peak_mb(fn, *args, **kwargs):
+    tracemalloc.start()
+    fn(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--measure-dense", action="store_true")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'dur':>6} {'n_rr':>7} {'denso_MB':>9} {'disperso_MB':>12} {'nk_hrv_time_MB':>15}")
+    for label, seconds in (("5 min", 300), ("1 h", 3600), ("24 h", 86400)):
+        n = int(seconds / 0.85)
+        rr = 850.0 + rng.normal(0.0, 30.0, n)
+        if args.measure_dense:
+            dense = _peak_mb(_dense_peaks, rr)
+        else:
+            dense = (np.sum(rr) + 1000.0) * 8 / 2**20
+        sparse = _peak_mb(app.rri_to_peaks, rr, sampling_rate=1000)
+        peaks = app.rri_to_peaks(rr, sampling_rate=1000)
+        nk_time = _peak_mb(app.nk.hrv_time, peaks, sampling_rate=1000, show=False)
+        print(f"{label:>6} {n:>7} {dense:>9.1f} {sparse:>12.2f} {nk_time:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Benchmark por etapa del pipeline (tiempo y pico de memoria) sobre señales sintéticas
+deterministas: RR con ectópicos/latidos perdidos y PPG de cámara (30/60 fps) con
+ruido de movimiento, de 1, 5, 30 min y 24 h.
+
+    python benchmarks/bench_pipeline_stages.py [--minutes 1 5 30 1440] [--full]
+        [--isolated] [--out resultados.json] [--compare base.json --tolerance 1.25]
+
+- tiempo: mejor de N repeticiones (perf_counter), sin tracemalloc activo
+- memoria: pico de tracemalloc en una corrida aparte (NumPy reporta sus buffers)
+- e2e: POST /api/compute con el cliente de prueba de Flask y la caché apagada;
+  por defecto en proceso (HBA_ANALYSIS_ISOLATED=0), --isolated mide también el subproceso
+- --out escribe JSON (con commit git y versiones) para comparar entre commits con --compare
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app  # noqa: E402
+from synthetic import synth_ppg, synth_rr  # noqa: E402
+
+
+def _timeit(fn, min_time=0.3, max_reps=20):
+    best, total, reps = np.inf, 0.0, 0
+    while reps < max_reps and (reps == 0 or total < min_time):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best, total, reps = min(best, dt), total + dt, reps + 1
+    return best, reps
+
+
+def _peak_mb(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def _rr_stages(rr, ctx):
+    rr_clean = ctx.rr_clean if ctx is not None and ctx.rr_clean is not None else app.clean_rri_ms(rr)[0]
+    return [
+        ("clean_rri_ms", lambda: app.clean_rri_ms(rr)),
+        ("kubios_mask", lambda: app._kubios_like_artifact_mask(rr)),
+        ("windowed_salvage", lambda: app._windowed_rr_salvage(rr, window_beats=45, step_beats=20, max_artifact_pct=25.0)),
+        ("hrv_native", lambda: app.hrv_indices_native(rr_clean)),
+        ("hrv_epochs", lambda: app.hrv_epochs(rr_clean)),
+        ("resp_rsa", lambda: app.resp_from_rr(rr_clean)),
+    ]
+
+
+def _cases(minutes, full):
+    for m in minutes:
+        yield "rr", None, m
+    for fs in (30.0, 60.0):
+        for m in minutes:
+            if m < 1440 or full:
+                yield "ppg", fs, m
+
+
+def run_case(kind, fs, minutes, client, seed=0):
+    if kind == "rr":
+        x = synth_rr(minutes, seed=seed)
+        payload = {"sensor_type": "polar_h10", "rri_ms": x.tolist(), "duration_minutes": minutes, "age": 30, "sex": "F"}
+        analyze = lambda: app.analyze_rri(x, minutes)  # noqa: E731
+    else:
+        x = synth_ppg(minutes, fs=fs, seed=seed)
+        payload = {"sensor_type": "camera_ppg", "ppg": x.tolist(), "sampling_rate": fs,
+                   "duration_minutes": minutes, "age": 30, "sex": "F"}
+        analyze = lambda: app.analyze_ppg(x, fs, minutes)  # noqa: E731
+
+    result, ctx = analyze()
+    stages = []
+    if kind == "ppg":
+        xs = (x - x.mean()) / (x.std() + 1e-9)
+        ppg_f = ctx.signal_f
+        stages += [
+            ("ppg_filter", lambda: app.bandpass(xs, fs, app.PPG_BAND_HZ)),
+            ("ppg_peaks", lambda: app._ppg_peaks_robust(ppg_f, fs)),
+            ("resp_ppg", lambda: app.resp_from_ppg(xs, fs)),
+        ]
+    if ctx.rr_raw is not None:
+        stages += _rr_stages(ctx.rr_raw, ctx)
+    stages.append(("analyze_" + kind, analyze))
+
+    enriched = app.enrich_hba_dashboard(dict(result), payload, ctx)
+    stages += [
+        ("enrich_dashboard", lambda: app.enrich_hba_dashboard(dict(result), payload, ctx)),
+        ("json_encode", lambda: app.json_dumps(enriched)),
+    ]
+    body = json.dumps(payload)
+
+    def e2e():
+        r = client.post("/api/compute", data=body, content_type="application/json")
+        assert r.status_code == 200, r.get_json()
+    e2e()  # calentamiento (forkserver / imports)
+    stages.append(("api_compute_e2e", e2e))
+
+    n = int(x.size)
+    rows = []
+    for name, fn in stages:
+        t, reps = _timeit(fn)
+        rows.append({"case": f"{kind}{'' if fs is None else int(fs)}_{minutes:g}min", "kind": kind,
+                     "sampling_rate": fs, "minutes": minutes, "n": n, "stage": name,
+                     "time_ms": t * 1000.0, "reps": reps, "peak_mb": _peak_mb(fn),
+                     "artifact_percent": result.get("artifact_percent")})
+    return rows
+
+
+def _meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    import scipy
+    return {"commit": commit, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "numpy": np.__version__, "scipy": scipy.__version__,
+            "neurokit2": app.nk.__version__, "hrv_engine": app.HRV_ENGINE,
+            "isolated": app.ANALYSIS_ISOLATED, "cpus": os.cpu_count()}
+
+
+def compare(rows, base_path, tolerance):
+    """Imprime la razón actual/base por etapa; devuelve cuántas etapas empeoraron > tolerance."""
+    with open(base_path, encoding="utf-8") as f:
+        base = {(r["case"], r["stage"]): r for r in json.load(f)["rows"]}
+    print(f"\n{'case':<16} {'stage':<18} {'base_ms':>10} {'ms':>10} {'ratio':>7} {'mem_ratio':>9}")
+    worse = 0
+    for r in rows:
+        b = base.get((r["case"], r["stage"]))
+        if b is None:
+            continue
+        ratio = r["time_ms"] / max(b["time_ms"], 1e-9)
+        mem = r["peak_mb"] / max(b["peak_mb"], 1e-9)
+        flag = " <-" if ratio > tolerance else ""
+        worse += ratio > tolerance
+        print(f"{r['case']:<16} {r['stage']:<18} {b['time_ms']:>10.2f} {r['time_ms']:>10.2f} {ratio:>7.2f} {mem:>9.2f}{flag}")
+    return worse
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--minutes", type=float, nargs="+", default=[1, 5, 30, 1440])
+    ap.add_argument("--full", action="store_true", help="incluye PPG de 24 h (lento)")
+    ap.add_argument("--isolated", action="store_true", help="e2e con análisis en subproceso")
+    ap.add_argument("--engine", choices=("native", "neurokit2"), default=None)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None)
+    ap.add_argument("--compare", default=None)
+    ap.add_argument("--tolerance", type=float, default=1.25)
+    args = ap.parse_args()
+
+    os.environ["HBA_RESULT_CACHE"] = "0"  # también para el forkserver de --isolated
+    app.CACHE_ENABLED = False
+    app.ANALYSIS_ISOLATED = args.isolated
+    if args.engine:
+        app.HRV_ENGINE = args.engine
+    client = app.app.test_client()
+
+    rows = []
+    print(f"{'case':<16} {'n':>9} {'stage':<18} {'ms':>10} {'reps':>5} {'peak_MB':>8}")
+    for kind, fs, minutes in _cases(args.minutes, args.full):
+        for r in run_case(kind, fs, minutes, client, seed=args.seed):
+            rows.append(r)
+            print(f"{r['case']:<16} {r['n']:>9} {r['stage']:<18} {r['time_ms']:>10.2f} {r['reps']:>5} {r['peak_mb']:>8.1f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": _meta(), "rows": rows}, f, indent=1)
+        print(f"\nguardado: {args.out}")
+    if args.compare:
+        sys.exit(1 if compare(rows, args.compare, args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Detector de picos PPG: cascada anterior (nk.ppg_peaks elgendi + fallback find_peaks)
+contra ppg_peaks_elgendi (vectorizado, con confianza por latido).
+
+Reporta tiempo por señal, F1 de picos con tolerancia ±50 ms, diferencia de RR medio y
+RMSSD, y la confianza media. Sin --recording usa PPG sintético (synthetic.py); con
+--recording evalúa un registro de cámara real (.csv / .npy / float32 crudo):
+
+    python benchmarks/bench_ppg_peaks.py [--seeds 4] [--recording ppg.csv --fs 30]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import signal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from synthetic import synth_ppg  # noqa: E402
+
+TOL_S = 0.05
+
+
+def _cascade_reference(p, fs):
+    # referencia: _ppg_peaks_robust anterior (NK2 elgendi -> find_peaks)
+    n = p.size
+    try:
+        _peaks, info = app.nk.ppg_peaks(p, sampling_rate=fs, method="elgendi")
+        idx = np.asarray(info["PPG_Peaks"], dtype=int)
+        idx = idx[(idx > 0) & (idx < n)]
+        if idx.size >= 12:
+            return idx
+    except Exception:
+        pass
+    amp = np.percentile(p, 95) - np.percentile(p, 5)
+    idx, _ = signal.find_peaks(p, distance=max(1, int(0.33 * fs)), prominence=max(0.10, 0.15 * amp))
+    idx = idx[(idx > 0) & (idx < n)]
+    return idx if idx.size >= 12 else None
+
+
+def _f1(ref, new, tol):
+    if ref is None or new is None or not ref.size or not new.size:
+        return np.nan
+    j = np.clip(np.searchsorted(new, ref), 1, new.size - 1)
+    near = np.minimum(np.abs(new[j] - ref), np.abs(new[j - 1] - ref))
+    tp = int(np.count_nonzero(near <= tol))
+    return 2.0 * tp / (ref.size + new.size)
+
+
+def _rr_stats(peaks, fs):
+    rr = np.diff(peaks) * 1000.0 / fs
+    return float(np.mean(rr)), float(np.sqrt(np.mean(np.diff(rr) ** 2)))
+
+
+def _load(path):
+    if path.endswith(".npy"):
+        x = np.load(path)
+    elif path.endswith(".csv") or path.endswith(".txt"):
+        x = np.loadtxt(path, delimiter=",", ndmin=2)[:, -1]
+    else:
+        x = np.fromfile(path, dtype="<f4")
+    return np.asarray(x, dtype=float).ravel()
+
+
+def _filtered(x, fs):
+    xs = (x - np.mean(x)) / (np.std(x) + 1e-9)
+    return np.asarray(app.nk.signal_filter(xs, sampling_rate=fs, lowcut=0.7, highcut=5.0,
+                                           method="butterworth", order=3), dtype=float)
+
+
+def _timed(fn, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def _row(label, x, fs):
+    p = _filtered(x, fs)
+    ref, t_ref = _timed(lambda: _cascade_reference(p, fs))
+    (new, conf), t_new = _timed(lambda: app.ppg_peaks_elgendi(p, fs))
+    f1 = _f1(ref, new, TOL_S * fs)
+    d_rr = d_rmssd = np.nan
+    if ref is not None and new is not None:
+        (rr0, rm0), (rr1, rm1) = _rr_stats(ref, fs), _rr_stats(new, fs)
+        d_rr, d_rmssd = rr1 - rr0, rm1 - rm0
+    c = float(np.mean(conf)) if conf is not None else np.nan
+    print(f"{label:<22} {1000 * t_ref:>8.2f} {1000 * t_new:>8.2f} {t_ref / t_new:>7.1f} "
+          f"{f1:>6.3f} {d_rr:>8.2f} {d_rmssd:>9.2f} {c:>5.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seeds", type=int, default=4)
+    ap.add_argument("--minutes", type=float, default=5.0)
+    ap.add_argument("--recording", default=None, help="PPG de cámara (.csv/.npy/float32)")
+    ap.add_argument("--fs", type=float, default=30.0)
+    args = ap.parse_args()
+
+    print(f"{'señal':<22} {'ms_cas':>8} {'ms_new':>8} {'speedup':>7} {'F1':>6} {'dRR_ms':>8} "
+          f"{'dRMSSD_ms':>9} {'conf':>5}")
+    if args.recording:
+        _row(os.path.basename(args.recording)[:22], _load(args.recording), args.fs)
+        return
+    for fs in (30.0, 60.0):
+        for noise in (0.15, 0.5):
+            for seed in range(args.seeds):
+                x = synth_ppg(args.minutes, fs=fs, seed=seed, noise=noise)
+                _row(f"fs={fs:.0f} ruido={noise} s={seed}", x, fs)
+
+
+if __name__ == "__main__":
+    main()
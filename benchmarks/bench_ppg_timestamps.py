@@ -0,0 +1,57 @@
+"""
+PPG de cámara con tiempos de cuadro irregulares (jitter + cuadros perdidos,
+synthetic.synth_ppg_timed): fps medio (lo que hacía el cliente) contra
+timestamps por muestra remuestreados en el servidor (resample_uniform).
+Error de RMSSD contra el RR verdadero entre picos, por fps de captura:
+
+    python benchmarks/bench_ppg_timestamps.py [--seeds 6] [--minutes 5] [--jitter 6]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from synthetic import synth_ppg_timed  # noqa: E402
+
+
+def _rmssd(rr):
+    return float(np.sqrt(np.mean(np.diff(rr) ** 2)))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seeds", type=int, default=6)
+    ap.add_argument("--minutes", type=float, default=5.0)
+    ap.add_argument("--jitter", type=float, default=6.0, help="jitter de cuadro (ms, desvío)")
+    ap.add_argument("--drop", type=float, default=0.03, help="fracción de cuadros perdidos")
+    args = ap.parse_args()
+
+    print(f"{'fps':>4} {'KB':>6} | {'err_fps_medio':>13} {'err_timestamps':>14} | {'ms_resample':>11} "
+          f"{'jitter_ms':>9} {'perdidos%':>9}")
+    for fps in (15.0, 30.0, 60.0):
+        err_mean, err_ts, t_rs, info = [], [], [], {}
+        for seed in range(args.seeds):
+            y, t_ms, rr_true = synth_ppg_timed(args.minutes, fps=fps, seed=seed, jitter_ms=args.jitter,
+                                               drop_rate=args.drop)
+            truth = _rmssd(rr_true)
+            fs_mean = 1000.0 / float(np.mean(np.diff(t_ms)))
+            res, _ctx = app.analyze_ppg(y, fs_mean, args.minutes)
+            err_mean.append(res.get("rmssd", np.nan) - truth)
+
+            t0 = time.perf_counter()
+            yu, fs, info = app.resample_uniform(y, t_ms)
+            t_rs.append(time.perf_counter() - t0)
+            res, _ctx = app.analyze_ppg(yu, fs, args.minutes)
+            err_ts.append(res.get("rmssd", np.nan) - truth)
+        kb = 2 * 4 * y.size / 1024.0  # float32: muestras + timestamps
+        print(f"{fps:>4.0f} {kb:>6.0f} | {np.nanmean(np.abs(err_mean)):>13.2f} {np.nanmean(np.abs(err_ts)):>14.2f} | "
+              f"{1000 * np.median(t_rs):>11.3f} {info['frame_jitter_ms']:>9.2f} {info['dropped_frames_pct']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Front-end de preprocesado: nk.signal_filter (rediseña el Butterworth en cada
+llamada, float64) contra bandpass / ppg_front_end (SOS memoizado, sosfiltfilt
+en float32). Reporta tiempo, error máximo sobre el z-score y picos distintos:
+
+    python benchmarks/bench_preprocess.py [--minutes 1 5 60] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from synthetic import synth_ppg  # noqa: E402
+
+
+def _best(fn, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--minutes", type=float, nargs="+", default=[1.0, 5.0, 60.0])
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    lo, hi = app.PPG_BAND_HZ
+    print(f"{'min':>5} {'fs':>4} {'ms_nk':>8} {'ms_new':>8} {'speedup':>7} {'max_err':>9} {'picos_dif':>9}")
+    for minutes in args.minutes:
+        for fs in (30.0, 60.0):
+            xs, _f = app.ppg_front_end(synth_ppg(minutes, fs=fs, seed=0), fs)
+            ref, t_nk = _best(lambda: app.nk.signal_filter(xs, sampling_rate=fs, lowcut=lo, highcut=hi,
+                                                           method="butterworth", order=app.FILTER_ORDER),
+                              args.repeat)
+            new, t_new = _best(lambda: app.bandpass(xs, fs, app.PPG_BAND_HZ), args.repeat)
+            p_ref, _c = app.ppg_peaks_elgendi(ref, fs)
+            p_new, _c = app.ppg_peaks_elgendi(new, fs)
+            diff = np.setxor1d(p_ref, p_new).size if p_ref is not None and p_new is not None else -1
+            print(f"{minutes:>5.0f} {fs:>4.0f} {1000 * t_nk:>8.2f} {1000 * t_new:>8.2f} {t_nk / t_new:>7.1f} "
+                  f"{np.max(np.abs(ref - new)):>9.2e} {diff:>9}")
+    print(f"diseños en caché: {app._sos_design.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
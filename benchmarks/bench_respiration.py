@@ -0,0 +1,78 @@
+"""
+Validación y costo de la frecuencia respiratoria sobre señales sintéticas con
+respiración conocida (synthetic.py: RSA en el RR + deriva respiratoria en el PPG).
+
+Compara la FFT de largo completo anterior (PPG filtrado 0.7–5 Hz -> band-pass 0.1–0.4
+-> rfft) contra el estimador actual: PPG decimado + Welch, RSA desde el RR limpio y
+la fusión de ambos.
+
+    python benchmarks/bench_respiration.py [--seeds 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from synthetic import synth_ppg  # noqa: E402
+
+
+def _fft_reference(ppg_f, fs):
+    # referencia: versión anterior (_resp_rate_from_ppg_fft sobre el PPG ya filtrado)
+    rsp = np.asarray(app.nk.signal_filter(ppg_f, sampling_rate=fs, lowcut=0.1, highcut=0.4,
+                                          method="butterworth", order=3), dtype=float)
+    rsp = rsp - np.nanmean(rsp)
+    if rsp.size < int(fs * 60):
+        return np.nan
+    freqs = np.fft.rfftfreq(rsp.size, d=1.0 / fs)
+    spec = np.abs(np.fft.rfft(rsp)) ** 2
+    mask = (freqs >= 0.1) & (freqs <= 0.4)
+    return float(freqs[mask][int(np.argmax(spec[mask]))] * 60.0)
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seeds", type=int, default=3)
+    args = ap.parse_args()
+
+    cases = [(m, fs, amp) for m in (1, 5, 60) for fs in (30.0, 60.0) for amp in (0.4, 0.1)]
+    rates = (8.0, 12.0, 15.0, 18.0, 22.0)
+
+    print(f"{'min':>4} {'fs':>4} {'amp':>4} | {'MAE_fft':>8} {'MAE_ppg':>8} {'MAE_rsa':>8} {'MAE_fus':>8} "
+          f"{'conf':>5} | {'ms_fft':>8} {'ms_new':>8}")
+    for minutes, fs, amp in cases:
+        err = {"fft": [], "ppg": [], "rsa": [], "fused": []}
+        conf, t_fft, t_new = [], [], []
+        for rate in rates:
+            for seed in range(args.seeds):
+                x = synth_ppg(minutes, fs=fs, seed=seed, resp_rpm=rate, resp_amp=amp)
+                _res, ctx = app.analyze_ppg(x, fs, minutes)
+                if ctx.rr_clean is None:
+                    continue
+                xs = (x - x.mean()) / (x.std() + 1e-9)
+                ref, dt = _timed(lambda: _fft_reference(ctx.signal_f, fs))
+                t_fft.append(dt)
+                out, dt = _timed(lambda: app.respiration_estimate(xs, fs, ctx.rr_clean))
+                t_new.append(dt)
+                err["fft"].append(abs(ref - rate))
+                err["ppg"].append(abs(out["resp_rate_ppg_rpm"] - rate))
+                err["rsa"].append(abs(out["resp_rate_rsa_rpm"] - rate))
+                err["fused"].append(abs(out["resp_rate_rpm"] - rate))
+                conf.append(out["resp_confidence"])
+        mae = {k: np.nanmean(v) if v else np.nan for k, v in err.items()}
+        print(f"{minutes:>4} {fs:>4.0f} {amp:>4.1f} | {mae['fft']:>8.2f} {mae['ppg']:>8.2f} {mae['rsa']:>8.2f} "
+              f"{mae['fused']:>8.2f} {np.mean(conf):>5.2f} | {1000 * np.median(t_fft):>8.2f} {1000 * np.median(t_new):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
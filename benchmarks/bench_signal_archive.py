@@ -0,0 +1,64 @@
+"""
+Archivo de señales crudas (archive_signal / load_signal): tamaño contra el JSON
+que manda el cliente, tiempo de escritura y de lectura por memmap, error de
+cuantización y cuánto se mueve el RMSSD al re-analizar la señal archivada.
+Escribe en un directorio temporal (no toca el dataset real):
+
+    python benchmarks/bench_signal_archive.py [--lossless]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from synthetic import synth_ppg, synth_rr  # noqa: E402
+
+
+def _cases():
+    yield "camera_ppg", 30.0, 5, synth_ppg(5, fs=30.0, seed=3).astype(np.float32)
+    yield "camera_ppg", 60.0, 5, synth_ppg(5, fs=60.0, seed=3).astype(np.float32)
+    yield "polar_h10", None, 5, np.round(synth_rr(5, seed=3))
+    yield "polar_h10", None, 1440, np.round(synth_rr(1440, seed=3))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lossless", action="store_true", help="HBA_ARCHIVE_LOSSLESS=1 (float32)")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="hba_archive_")
+    app.ARCHIVE_DIR = tmp
+    app.DATASET_DB = os.path.join(tmp, "bench.sqlite")
+    app.ARCHIVE_LOSSLESS = args.lossless
+
+    print(f"{'case':<20} {'n':>8} {'json_KB':>8} {'arch_KB':>8} {'ratio':>6} {'write_ms':>9} "
+          f"{'read_ms':>8} {'max_err':>9} {'d_rmssd':>8}")
+    for mid, (sensor, fs, minutes, x) in enumerate(_cases(), start=1):
+        field = app.SENSORS[sensor]["field"]
+        json_bytes = len(json.dumps({field: x.tolist()}))
+        t0 = time.perf_counter()
+        nbytes = app.archive_signal(mid, sensor, x, fs, minutes)
+        t_write = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        _meta, y = app.load_signal(mid)
+        t_read = time.perf_counter() - t0
+        err = float(np.abs(y - x.astype(float)).max())
+
+        kind = app.SENSORS[sensor]["pipeline"]
+        r0 = app.run_pipeline(kind, x.astype(float), fs, minutes)[0].get("rmssd")
+        r1 = app.run_pipeline(kind, y, fs, minutes)[0].get("rmssd")
+        case = f"{sensor}{'' if fs is None else int(fs)}_{minutes}min"
+        print(f"{case:<20} {x.size:>8} {json_bytes / 1024:>8.1f} {nbytes / 1024:>8.1f} "
+              f"{nbytes / json_bytes:>6.3f} {1000 * t_write:>9.2f} {1000 * t_read:>8.2f} {err:>9.2e} "
+              f"{abs(r1 - r0):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark de arranque: `import app` en frío y gunicorn con / sin preload.
+
+Mide el tiempo hasta que "/" responde 200 y hasta que /healthz (motor
+caliente) responde 200, más el RSS de los workers:
+
+    python benchmarks/bench_startup.py [--workers 2]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _status(url):
+    try:
+        with urllib.request.urlopen(url, timeout=2) as r:
+            return r.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def _rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return float("nan")
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as fh:
+            return [int(p) for p in fh.read().split()]
+    except OSError:
+        return []
+
+
+def _import_time():
+    code = ("import time, resource; t = time.perf_counter(); import app; "
+            "print(time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    t, rss = out.stdout.split()
+    return float(t), float(rss)
+
+
+def _gunicorn(preload, workers, timeout=120.0):
+    port = _free_port()
+    env = dict(os.environ, HBA_PRELOAD="1" if preload else "0", HBA_WARM="1")
+    cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "app:app"]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    t_index = t_ready = None
+    try:
+        while time.perf_counter() - t0 < timeout:
+            if t_index is None and _status(f"http://127.0.0.1:{port}/") == 200:
+                t_index = time.perf_counter() - t0
+            if t_index is not None and _status(f"http://127.0.0.1:{port}/healthz") == 200:
+                t_ready = time.perf_counter() - t0
+                break
+            time.sleep(0.02)
+        rss = [_rss_mb(p) for p in _children(proc.pid)]
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return t_index, t_ready, rss
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=2)
+    args = ap.parse_args()
+
+    t, rss = _import_time()
+    print(f"import app (frío): {t:.3f}s, RSS {rss:.0f} MB")
+    print()
+    print(f"{'modo':>10} {'t_index_s':>10} {'t_healthz_s':>12} {'RSS_workers_MB':>16}")
+    for preload in (False, True):
+        t_index, t_ready, rss = _gunicorn(preload, args.workers)
+        rss_txt = "/".join(f"{r:.0f}" for r in rss)
+        print(f"{'preload' if preload else 'post_fork':>10} {t_index or float('nan'):>10.3f} "
+              f"{t_ready or float('nan'):>12.3f} {rss_txt:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Formato de subida de PPG: JSON (lista de floats) vs base64 en JSON vs binario
+float32 LE. Compara bytes del cuerpo y tiempo de parseo en el servidor
+(payload_from_request + conversión a float64, como en compute_payload):
+
+    python benchmarks/bench_upload_format.py [--fps 60]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def _parse_time(data, content_type, headers=None, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        with app.app.test_request_context("/api/compute", method="POST", data=data,
+                                          content_type=content_type, headers=headers or {}):
+            t0 = time.perf_counter()
+            payload = app.payload_from_request(app.request)
+            np.array(payload["ppg"], dtype=float)
+            best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fps", type=float, default=60.0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'min':>4} {'muestras':>9} {'json_KB':>9} {'b64_KB':>8} {'bin_KB':>8} "
+          f"{'json_ms':>8} {'b64_ms':>7} {'bin_ms':>7}")
+    for minutes in (1, 5, 30):
+        n = int(minutes * 60 * args.fps)
+        ppg = rng.standard_normal(n)  # z-score como manda main.js
+        meta = {"sensor_type": "camera_ppg", "sampling_rate": args.fps, "duration_minutes": minutes}
+
+        body_json = json.dumps({**meta, "ppg": ppg.tolist()}).encode()
+        f32 = ppg.astype("<f4").tobytes()
+        body_b64 = json.dumps({**meta, "ppg_b64": base64.b64encode(f32).decode(), "dtype": "float32"}).encode()
+        headers = {"X-HBA-Sensor-Type": "camera_ppg", "X-HBA-Sampling-Rate": str(args.fps),
+                   "X-HBA-Duration-Minutes": str(minutes)}
+
+        t_json = _parse_time(body_json, "application/json")
+        t_b64 = _parse_time(body_b64, "application/json")
+        t_bin = _parse_time(f32, "application/octet-stream", headers)
+        print(f"{minutes:>4} {n:>9} {len(body_json) / 1024:>9.0f} {len(body_b64) / 1024:>8.0f} "
+              f"{len(f32) / 1024:>8.0f} {1e3 * t_json:>8.2f} {1e3 * t_b64:>7.2f} {1e3 * t_bin:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Generadores sintéticos deterministas (misma semilla -> misma señal) para los benchmarks.
+
+- synth_rr: RR (ms) con RSA + onda LF, ectópicos (prematuro + compensatorio) y latidos perdidos
+- synth_ppg: PPG tipo cámara (30/60 fps) desde los mismos latidos, con deriva
+  respiratoria, ruido blanco y ráfagas de movimiento
+- synth_ppg_timed: PPG con tiempos de cuadro irregulares (jitter + cuadros perdidos)
+- resp_rpm: frecuencia respiratoria real (RSA del RR y deriva del PPG), para validar estimadores
+"""
+import numpy as np
+
+
+def _beat_rr(minutes, seed, hr_bpm=72.0, resp_rpm=15.0):
+    rng = np.random.default_rng(seed)
+    n = int(minutes * 60.0 * hr_bpm / 60.0 * 1.1) + 10
+    base = 60000.0 / hr_bpm
+    t = np.cumsum(np.full(n, base)) / 1000.0
+    rr = (base
+          + 35.0 * np.sin(2 * np.pi * (resp_rpm / 60.0) * t)   # RSA (HF)
+          + 25.0 * np.sin(2 * np.pi * 0.10 * t + 1.0)    # LF
+          + rng.normal(0.0, 12.0, n))
+    rr = rr[np.cumsum(rr) <= minutes * 60000.0]
+    return rr, rng
+
+
+def synth_rr(minutes, seed=0, ectopic_rate=0.01, missed_rate=0.005, hr_bpm=72.0, resp_rpm=15.0):
+    """RR (ms) de `minutes` minutos con artefactos típicos de banda/Holter."""
+    rr, rng = _beat_rr(minutes, seed, hr_bpm, resp_rpm)
+    n = rr.size
+    if n < 4:
+        return rr
+
+    # ectópicos: RR corto (~65%) seguido de pausa compensatoria
+    idx = rng.choice(n - 1, size=int(n * ectopic_rate), replace=False)
+    short = 0.65 * rr[idx]
+    rr[idx + 1] += rr[idx] - short
+    rr[idx] = short
+
+    # latidos perdidos: dos RR se funden en uno (~2x)
+    miss = np.sort(rng.choice(n - 1, size=int(n * missed_rate), replace=False))
+    miss = miss[np.diff(miss, prepend=-2) > 1]
+    rr[miss + 1] += rr[miss]
+    return np.delete(rr, miss)
+
+
+def _pulse(t, beats):
+    # fase de latido -> onda de pulso (sistólica + dicrota)
+    k = np.clip(np.searchsorted(beats, t), 1, beats.size - 1)
+    ph = (t - beats[k - 1]) / (beats[k] - beats[k - 1])
+    ph = np.where(t < beats[0], t / beats[0], ph) % 1.0
+    return np.exp(-((ph - 0.15) / 0.07) ** 2) + 0.35 * np.exp(-((ph - 0.45) / 0.10) ** 2)
+
+
+def synth_ppg(minutes, fs=30.0, seed=0, motion_rate_per_min=0.5, noise=0.15, hr_bpm=72.0,
+              resp_rpm=15.0, resp_amp=0.4):
+    """PPG de cámara (sin unidades) a `fs` fps con ruido de movimiento."""
+    rr, rng = _beat_rr(minutes, seed, hr_bpm, resp_rpm)
+    beats = np.cumsum(rr) / 1000.0
+    n = int(minutes * 60.0 * fs)
+    t = np.arange(n) / fs
+    pulse = _pulse(t, beats)
+
+    ppg = pulse + resp_amp * np.sin(2 * np.pi * (resp_rpm / 60.0) * t + 0.3) + rng.normal(0.0, noise, n)
+
+    # movimiento: ráfagas de 1–4 s de gran amplitud y baja frecuencia
+    for _ in range(int(minutes * motion_rate_per_min)):
+        start = int(rng.uniform(0, max(1, n - 4 * fs)))
+        length = int(rng.uniform(1.0, 4.0) * fs)
+        seg = np.arange(length) / fs
+        ppg[start:start + length] += rng.uniform(2.0, 6.0) * np.sin(2 * np.pi * rng.uniform(0.5, 2.0) * seg)
+    return ppg
+
+
+def synth_ppg_timed(minutes, fps=30.0, seed=0, jitter_ms=6.0, drop_rate=0.03, noise=0.15, hr_bpm=72.0):
+    """
+    PPG de cámara con tiempos de cuadro reales: jitter gaussiano + cuadros perdidos
+    (drop_rate). Devuelve (ppg, t_ms, peak_rr_ms): peak_rr_ms es el RR verdadero
+    entre picos sistólicos (fase 0.15 de cada latido), referencia para RMSSD.
+    """
+    rr, rng = _beat_rr(minutes, seed, hr_bpm)
+    beats = np.cumsum(rr) / 1000.0
+    n = int(minutes * 60.0 * fps)
+    t = np.arange(n) / fps + rng.normal(0.0, jitter_ms / 1000.0, n)
+    t = np.sort(t[rng.random(n) >= drop_rate])
+    ppg = _pulse(t, beats) + 0.4 * np.sin(2 * np.pi * 0.25 * t + 0.3) + rng.normal(0.0, noise, t.size)
+    peaks = beats[:-1] + 0.15 * np.diff(beats)
+    return ppg, 1000.0 * t, 1000.0 * np.diff(peaks[peaks < t[-1]])
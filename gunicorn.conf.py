@@ -0,0 +1,43 @@
+"""
+Config de gunicorn (se lee sola: `gunicorn app:app`).
+
+HBA_PRELOAD=1  -> carga app + motor científico en el master antes del fork
+                  (workers comparten memoria copy-on-write, arranque por worker ~0).
+HBA_WARM=1     -> sin preload, cada worker precalienta el motor en un hilo
+                  después del fork; "/" responde mientras tanto (default).
+HBA_THREADS=4  -> hilos por worker (gthread): mientras un request espera su
+                  análisis en el proceso aislado (run_analysis), los demás hilos
+                  siguen atendiendo "/" y /api/save.
+HBA_METRICS_DIR -> archivos por proceso que /metrics suma; se vacía al arrancar.
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+preload_app = os.environ.get("HBA_PRELOAD", "0") == "1"
+worker_class = "gthread"
+threads = int(os.environ.get("HBA_THREADS", "4"))
+_warm = os.environ.get("HBA_WARM", "1") == "1"
+
+
+def on_starting(server):
+    # mismo default que app.METRICS_DIR (el master no importa app sin preload)
+    metrics_dir = os.environ.get("HBA_METRICS_DIR") or os.path.join(tempfile.gettempdir(), "hba_metrics")
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def when_ready(server):
+    if preload_app:
+        import app
+
+        server.log.info("Motor HBA precargado en el master (%.2fs)", app.warm_engine())
+
+
+def post_fork(server, worker):
+    import app
+
+    if _warm and not preload_app:
+        threading.Thread(target=app.warm_engine, name="hba-warm", daemon=True).start()
+    # consumidores de /api/jobs: retoman la cola aunque nadie consulte tras un reinicio
+    app.start_job_runners()
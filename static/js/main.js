@@ -40,6 +40,11 @@ let bleDevice = null;
 let bleChar = null;
 let rrIntervalsMs = [];
 let lastMetrics = null;
+let lastSignal = null;    // payload del último cálculo: su señal cruda se archiva al guardar
+
+// Textos fijos del dashboard (GET /api/dashboard/static): se piden una vez y se
+// envía su etag en cada cálculo para no recibirlos repetidos
+let dashStatic = null;
 
 // Vibración
 let motionListening = false;
@@ -47,6 +52,10 @@ let vibSamples = [];
 let vibTimestamps = [];
 let vibLastGravity = {x:0,y:0,z:0};
 
+// Sesión en vivo (/api/session): métricas rolling mientras se mide
+let liveSession = null;   // {id, pushed, inflight}
+let livePushTimer = null;
+
 // Wake lock
 let wakeLockSentinel = null;
 
@@ -439,7 +448,8 @@ function buildCards(metrics){
     {k:"LF/HF", v: metrics.lf_hf, u:"ratio"},
     {k:"Total Power", v: metrics.total_power, u:"ms²"},
     {k:"Artefactos", v: metrics.artifact_percent, u:"%"},
-    {k:"Resp (estim.)", v: metrics.resp_rate_rpm, u:"rpm"},
+    {k:"Resp (estim.)", v: metrics.resp_rate_rpm,
+     u: Number.isFinite(metrics.resp_confidence) ? `rpm · confianza ${Math.round(100 * metrics.resp_confidence)}%` : "rpm"},
   ];
 
   items.forEach(it => {
@@ -591,7 +601,7 @@ function buildHBADashboard(metrics){
     }
   }
 
-  const meanings = Array.isArray(dash.interpretation) ? dash.interpretation : [];
+  const meanings = Array.isArray(dash.interpretation) ? dash.interpretation : (dashStatic?.interpretation || []);
   if(meaning){
     if(!meanings.length){
       const h = document.createElement("div");
@@ -633,7 +643,7 @@ function buildHBADashboard(metrics){
   if(sema){
     const s = dash.semaphore || {};
     const color = String(s.color || "gris").toUpperCase();
-    const plan = Array.isArray(s.plan) ? s.plan : [];
+    const plan = Array.isArray(s.plan) ? s.plan : (dashStatic?.semaphore_plans?.[s.color || "gris"] || []);
 
     const cls = _stateToCardClass(String(dash.norms?.rmssd_state || ""));
     const c = document.createElement("div");
@@ -648,7 +658,7 @@ function buildHBADashboard(metrics){
       <div class="v" style="text-transform:uppercase">${color}</div>
       <div class="u">Plan según RMSSD (edad/sexo):</div>
       ${itemsHtml || `<div class="u">—</div>`}
-      <div class="u" style="margin-top:10px;"><b>Diferenciador:</b> ${dash.differentiator?.what_distinguishes || "Semáforo HBA"}</div>
+      <div class="u" style="margin-top:10px;"><b>Diferenciador:</b> ${(dash.differentiator || dashStatic?.differentiator)?.what_distinguishes || "Semáforo HBA"}</div>
     `;
     sema.appendChild(c);
   }
@@ -1371,6 +1381,7 @@ async function connectPolarH10(){
 async function startPolarH10(){
   rrIntervalsMs = [];
   await connectPolarH10();
+  await liveSessionOpen({ sensor_type: "polar_h10", duration_minutes: selectedDurationMin });
 }
 
 async function stopPolarH10(){
@@ -1385,6 +1396,86 @@ async function stopPolarH10(){
   setStatus("Polar detenido", "idle");
 }
 
+/* ========================= Sesión en vivo ========================= */
+async function liveSessionOpen(meta){
+  liveSession = null;
+  try{
+    const res = await fetch("/api/session", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(meta)
+    });
+    const out = await res.json();
+    if(!res.ok || !out.session_id) return;
+    liveSession = { id: out.session_id, pushed: 0, inflight: null };
+    if(livePushTimer) clearInterval(livePushTimer);
+    livePushTimer = setInterval(() => { liveSessionPush(); }, 5000);
+  }catch(_e){
+    liveSession = null; // sin sesión: se calcula al final como siempre
+  }
+}
+
+async function liveSessionPush(){
+  if(!liveSession) return null;
+  if(liveSession.inflight){
+    try{ await liveSession.inflight; }catch(_e){}
+    if(!liveSession) return null;
+  }
+  const chunk = rrIntervalsMs.slice(liveSession.pushed);
+  if(!chunk.length) return null;
+
+  const sess = liveSession;
+  sess.inflight = (async () => {
+    const res = await fetch(`/api/session/${sess.id}/push`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ rri_ms: chunk })
+    });
+    if(!res.ok) throw new Error("push falló");
+    sess.pushed += chunk.length;
+    const m = await res.json();
+    if(measuring && Number.isFinite(m.rmssd)){
+      const hr = Number.isFinite(m.hr_mean) ? ` • FC ${m.hr_mean.toFixed(0)}` : "";
+      setStatus(`En vivo • RMSSD ${m.rmssd.toFixed(0)} ms${hr}`, "ok");
+      if(Number.isFinite(m.artifact_percent)) setQuality(100 - m.artifact_percent);
+    }
+    return m;
+  })();
+
+  try{
+    return await sess.inflight;
+  }catch(_e){
+    liveSession = null; // sesión rota: fallback a /api/compute
+    return null;
+  }finally{
+    sess.inflight = null;
+  }
+}
+
+async function liveSessionClose(payload){
+  if(livePushTimer){
+    clearInterval(livePushTimer);
+    livePushTimer = null;
+  }
+  if(!liveSession) return null;
+  await liveSessionPush();
+  const sess = liveSession;
+  liveSession = null;
+  if(!sess || sess.pushed !== rrIntervalsMs.length) return null;
+
+  try{
+    const res = await fetch(`/api/session/${sess.id}/close`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ age: payload.age, duration_minutes: payload.duration_minutes, static_etag: dashStatic?.etag })
+    });
+    if(!res.ok) return null;
+    return await res.json();
+  }catch(_e){
+    return null;
+  }
+}
+
 /* ========================= RR Upload ========================= */
 function parseCSVtoNumbers(text){
   const lines = text.split(/\r?\n/).map(s => s.trim()).filter(Boolean);
@@ -1435,8 +1526,132 @@ function normalizeRRUnits(rr){
 }
 
 /* ========================= Measurement ========================= */
+// id del /api/compute en curso: si se cierra la pestaña, el servidor cancela el análisis
+let computeRequestId = null;
+
+function _newRequestId(){
+  if(window.crypto && typeof window.crypto.randomUUID === "function") return window.crypto.randomUUID();
+  return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2, 10);
+}
+
+window.addEventListener("pagehide", () => {
+  if(computeRequestId && navigator.sendBeacon){
+    navigator.sendBeacon(`/api/compute/${computeRequestId}/cancel`);
+  }
+});
+
+async function postCompute(payload){
+  computeRequestId = _newRequestId();
+  try{
+    return await _postCompute(payload, computeRequestId);
+  } finally {
+    computeRequestId = null;
+  }
+}
+
+// señales largas (24 h de RR, PPG de muchos minutos) van a la cola /api/jobs:
+// el cálculo no depende de que la conexión siga abierta y se retoma al recargar
+const ASYNC_MIN_SAMPLES = 20000;
+const PENDING_JOB_KEY = "hba_pending_job";
+
+function _signalLength(payload){
+  const sig = payload.ppg || payload.accel_mag || payload.rri_ms;
+  return Array.isArray(sig) ? sig.length : 0;
+}
+
+async function computeMetrics(payload){
+  if(_signalLength(payload) < ASYNC_MIN_SAMPLES){
+    const res = await postCompute(payload);
+    return await res.json();
+  }
+  setStatus("Señal larga: enviando a la cola de análisis…", "warn");
+  const res = await _postCompute(payload, _newRequestId(), "/api/jobs");
+  const job = await res.json();
+  if(!job.job_id) return job;
+  localStorage.setItem(PENDING_JOB_KEY, job.job_id);
+  return await pollJob(job.job_id);
+}
+
+async function pollJob(jobId){
+  while(true){
+    let res, out;
+    try{
+      res = await fetch(`/api/jobs/${jobId}?wait=20`);
+      out = await res.json();
+    }catch(_e){
+      // conexión caída (móvil): reintentar, el job sigue en el servidor
+      await new Promise(r => setTimeout(r, 3000));
+      continue;
+    }
+    if(res.status === 404){
+      localStorage.removeItem(PENDING_JOB_KEY);
+      return out;
+    }
+    if(out.status === "queued"){
+      setStatus(`En cola de análisis (posición ${(out.queue_position || 0) + 1})…`, "warn");
+      continue;
+    }
+    if(out.status === "running"){
+      setStatus("Procesando en segundo plano…", "warn");
+      continue;
+    }
+    localStorage.removeItem(PENDING_JOB_KEY);
+    return out.result || { error: `Job ${out.status}` };
+  }
+}
+
+async function resumePendingJob(){
+  const jobId = localStorage.getItem(PENDING_JOB_KEY);
+  if(!jobId) return;
+  setStatus("Retomando análisis pendiente…", "warn");
+  const metrics = await pollJob(jobId);
+  lastMetrics = metrics;
+  buildCards(metrics);
+  buildDashTiles(metrics);
+  buildHBADashboard(metrics);
+  setStatus(metrics.error ? "Error en cálculo (ver tarjetas)" : "Cálculo OK (análisis retomado)", metrics.error ? "bad" : "ok");
+}
+
+function _postCompute(payload, requestId, url = "/api/compute"){
+  // PPG / vibración: cuerpo binario float32 LE (~4 bytes/muestra vs ~19 en JSON), metadatos en headers
+  const signal = payload.ppg || payload.accel_mag;
+  if(Array.isArray(signal) && signal.length){
+    const headers = {
+      "Content-Type": "application/octet-stream",
+      "X-HBA-Request-Id": requestId,
+      "X-HBA-Sensor-Type": payload.sensor_type,
+      "X-HBA-Sampling-Rate": String(payload.sampling_rate),
+      "X-HBA-Duration-Minutes": String(payload.duration_minutes)
+    };
+    let body = new Float32Array(signal);
+    if(Array.isArray(payload.timestamps_ms) && payload.timestamps_ms.length === signal.length){
+      // cuerpo = n muestras + n timestamps (ms desde el primer cuadro)
+      body = new Float32Array(2 * signal.length);
+      body.set(signal);
+      body.set(payload.timestamps_ms, signal.length);
+      headers["X-HBA-Timestamps"] = "ms";
+    }
+    if(payload.age !== "" && payload.age != null){
+      headers["X-HBA-Age"] = encodeURIComponent(String(payload.age));
+    }
+    if(payload.student_id){
+      headers["X-HBA-Student-Id"] = encodeURIComponent(String(payload.student_id));
+    }
+    if(dashStatic?.etag){
+      headers["X-HBA-Static-ETag"] = dashStatic.etag;
+    }
+    return fetch(url, { method: "POST", headers, body });
+  }
+  return fetch(url, {
+    method: "POST",
+    headers: { "Content-Type": "application/json", "X-HBA-Request-Id": requestId },
+    body: JSON.stringify(dashStatic?.etag ? { ...payload, static_etag: dashStatic.etag } : payload)
+  });
+}
+
 async function startMeasurement(){
   lastMetrics = null;
+  lastSignal = null;
 
   buildCards(null);
   buildDashTiles(null);
@@ -1563,7 +1778,8 @@ async function stopMeasurement(autoStop=false, opts={}){
   const payload = {
     sensor_type: sensorType,
     duration_minutes: selectedDurationMin,
-    age: document.getElementById("age")?.value || ""
+    age: document.getElementById("age")?.value || "",
+    student_id: document.getElementById("studentId")?.value || ""
   };
 
   if(sensorType === "camera_ppg" || sensorType === "face_rppg"){
@@ -1588,6 +1804,11 @@ async function stopMeasurement(autoStop=false, opts={}){
 
     payload.ppg = cleaned;
     payload.sampling_rate = fs;
+    // tiempo real de cada cuadro: el servidor remuestrea (jitter / cuadros perdidos no pasan al RR)
+    if(ppgTimestamps.length === cleaned.length){
+      const t0 = ppgTimestamps[0];
+      payload.timestamps_ms = ppgTimestamps.map(t => t - t0);
+    }
   }
   else if(sensorType === "vibration_scg"){
     // sampling rate desde timestamps
@@ -1608,13 +1829,13 @@ async function stopMeasurement(autoStop=false, opts={}){
   }
 
   try{
-    const res = await fetch("/api/compute", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(payload)
-    });
-    const metrics = await res.json();
+    // Polar con sesión en vivo: el servidor ya tiene los RR, solo se cierra
+    let metrics = (sensorType === "polar_h10") ? await liveSessionClose(payload) : null;
+    if(!metrics){
+      metrics = await computeMetrics(payload);
+    }
     lastMetrics = metrics;
+    lastSignal = payload;
 
     buildCards(metrics);
     buildDashTiles(metrics);
@@ -1667,17 +1888,14 @@ async function computeFromRRUpload(){
     sensor_type: "rr_upload",
     duration_minutes: inferredMin,
     rri_ms: rr,
-    age: document.getElementById("age")?.value || ""
+    age: document.getElementById("age")?.value || "",
+    student_id: document.getElementById("studentId")?.value || ""
   };
 
   try{
-    const res = await fetch("/api/compute", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(payload)
-    });
-    const metrics = await res.json();
+    const metrics = await computeMetrics(payload);
     lastMetrics = metrics;
+    lastSignal = payload;
 
     buildCards(metrics);
     buildDashTiles(metrics);
@@ -1700,6 +1918,34 @@ async function computeFromRRUpload(){
   enableControls();
 }
 
+function _float32ToB64(arr){
+  const bytes = new Uint8Array(new Float32Array(arr).buffer);
+  let bin = "";
+  for(let i = 0; i < bytes.length; i += 0x8000){
+    bin += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+  }
+  return btoa(bin);
+}
+
+function _signalForArchive(payload){
+  // señal cruda del último cálculo como Float32 base64 (el servidor la archiva comprimida)
+  if(!payload) return null;
+  const field = ["ppg", "accel_mag", "rri_ms"].find(k => Array.isArray(payload[k]) && payload[k].length);
+  if(!field) return null;
+  const sig = {
+    sensor_type: payload.sensor_type,
+    duration_minutes: payload.duration_minutes,
+    dtype: "float32"
+  };
+  if(payload.sampling_rate != null) sig.sampling_rate = payload.sampling_rate;
+  sig[`${field}_b64`] = _float32ToB64(payload[field]);
+  if(Array.isArray(payload.timestamps_ms) && payload.timestamps_ms.length === payload[field].length){
+    // el re-análisis del archivo remuestrea con los mismos timestamps que /api/compute
+    sig.timestamps_ms_b64 = _float32ToB64(payload.timestamps_ms);
+  }
+  return sig;
+}
+
 async function saveResult(){
   if(!lastMetrics || lastMetrics.error){
     setStatus("No hay métricas válidas para guardar", "warn");
@@ -1716,7 +1962,8 @@ async function saveResult(){
     age: age,
     comorbidities: comorbidities,
     notes: notes,
-    metrics: lastMetrics
+    metrics: lastMetrics,
+    signal: _signalForArchive(lastSignal)
   };
 
   setStatus("Guardando en dataset_hba.csv…", "warn");
@@ -1738,6 +1985,15 @@ async function saveResult(){
   }
 }
 
+async function loadDashStatic(){
+  try{
+    const res = await fetch("/api/dashboard/static");
+    if(res.ok) dashStatic = await res.json();
+  }catch(_e){
+    dashStatic = null; // sin textos cacheados: el servidor los incluye en cada resultado
+  }
+}
+
 /* ========================= Init ========================= */
 window.addEventListener("DOMContentLoaded", () => {
   initChart();
@@ -1752,6 +2008,7 @@ window.addEventListener("DOMContentLoaded", () => {
   setQuality(null);
   setTimerText();
   setStatus("Listo", "idle");
+  loadDashStatic().then(resumePendingJob);
 
   // torch toggle
   const tt = document.getElementById("torchToggle");